@@ -0,0 +1,205 @@
+from collections import OrderedDict
+
+import dash
+from dash import dcc, html
+import dash_bootstrap_components as dbc
+from dash.dependencies import Input, Output, State, ALL
+from upload_jobs import get_job, register_upload_callbacks, upload_status
+
+# 原来的五个演示应用合并为一个多页面应用: 一个服务器进程、一次上传 (解析好的数据在所有视图间共用)、
+# 同一组解析进程和图表缓存。每个视图在第一次打开时才生成布局; 上传时所在视图的图表由上传任务在后台生成,
+# 其他图表在第一次被请求时才生成
+
+# 初始化Dash应用程序 (视图的组件在打开时才加入页面)
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
+
+
+# 上传的数据 -> 图表; plotly.express在第一次生成图表时才导入, 不计入应用启动时间
+def age_distribution(df):
+    import plotly.express as px
+    # 生成初诊年龄分布直方图
+    hist_fig = px.histogram(df, x='age_at_initial_pathologic_diagnosis', nbins=30,
+                            title='Age Distribution at Initial Pathologic Diagnosis')
+    hist_fig.update_layout(xaxis_title='Age', yaxis_title='Frequency')
+    return hist_fig
+
+
+def vital_status_vs_age(df):
+    import plotly.express as px
+    # 生成Vital Status vs. Age图像
+    box_fig = px.box(df, x='vital_status', y='age_at_initial_pathologic_diagnosis', color='vital_status',
+                     title='Vital Status vs. Age')
+    box_fig.update_layout(xaxis_title='Vital Status', yaxis_title='Age at Initial Pathologic Diagnosis')
+    return box_fig
+
+
+def mutation_vs_age_vs_status(df):
+    import plotly.express as px
+    # 生成Age at Initial Diagnosis vs. Mutation Type and Vital Status图像
+    box_fig = px.box(df, x='One_Consequence', y='age_at_initial_pathologic_diagnosis', color='vital_status',
+                     title='Age at Initial Diagnosis vs. Mutation Type and Vital Status')
+    box_fig.update_layout(xaxis_title='Mutation Type', yaxis_title='Age at Initial Pathologic Diagnosis')
+    return box_fig
+
+
+def mutation_type_distribution(df):
+    import plotly.express as px
+    # 生成Top 10 Mutation Type Distribution in BRCA Patients图像
+    mutation_type_counts = df['One_Consequence'].value_counts().head(10)
+    bar_fig = px.bar(mutation_type_counts, x=mutation_type_counts.index, y=mutation_type_counts.values,
+                     title='Top 10 Mutation Type Distribution in BRCA Patients')
+    bar_fig.update_layout(xaxis_title='Mutation Type', yaxis_title='Count')
+    return bar_fig
+
+
+# 所有图表: 可视化 -> (名称, 需要的列, 生成函数)
+CHARTS = OrderedDict([
+    ('age_dist', ('Age Distribution at Initial Diagnosis', ['age_at_initial_pathologic_diagnosis'],
+                  age_distribution)),
+    ('vital_status_vs_age', ('Vital Status vs. Age', ['age_at_initial_pathologic_diagnosis', 'vital_status'],
+                             vital_status_vs_age)),
+    ('mutation_vs_age_vs_status', ('Age at Initial Diagnosis vs. Mutation Type and Vital Status',
+                                   ['age_at_initial_pathologic_diagnosis', 'vital_status', 'One_Consequence'],
+                                   mutation_vs_age_vs_status)),
+    ('mutation_type_dist', ('Top 10 Mutation Type Distribution in BRCA Patients', ['One_Consequence'],
+                            mutation_type_distribution)),
+])
+# 视图 (原来的演示应用): 路径 -> (导航名称, 图表, 是否用下拉框选择一个图表; 否则显示所有图表)
+VIEWS = OrderedDict([
+    ('/age-distribution', ('Age Distribution', ['age_dist'], False)),  # demon_visual_test.py
+    ('/age-and-vital-status', ('Age & Vital Status', ['age_dist', 'vital_status_vs_age'], False)),  # visual_demo.py
+    ('/vital-status-vs-age', ('Vital Status vs. Age', ['age_dist', 'vital_status_vs_age'], True)),
+    ('/mutation-type-vs-age', ('Mutation Type vs. Age', ['age_dist', 'vital_status_vs_age',
+                                                         'mutation_vs_age_vs_status'], True)),
+    ('/top-mutation-types', ('Top 10 Mutation Types', list(CHARTS), True)),
+])
+DEFAULT_VIEW = next(iter(VIEWS))
+# 所有视图都需要的列, 上传时检查; 其他列在打开需要它们的图表时检查
+REQUIRED_COLUMNS = ['age_at_initial_pathologic_diagnosis']
+
+# 已经打开过的视图的布局
+_mounted = {}
+
+
+def view_path(pathname):
+    return pathname if pathname in VIEWS else DEFAULT_VIEW
+
+
+def view_charts(pathname, selected_vis):
+    # 视图显示的图表; 选择图表的视图只显示下拉框选中的一个
+    _, charts, selectable = VIEWS[view_path(pathname)]
+    if selectable:
+        charts = [vis for vis in selected_vis if vis in charts][:1] or charts[:1]
+    return charts
+
+
+def missing_columns(vis, frame):
+    return [column for column in CHARTS[vis][1] if column not in frame.columns]
+
+
+def active_charts(frame, pathname, selected_vis):
+    # 上传任务完成前为上传时所在的视图生成的图表 (缺少列的图表不生成)
+    return [(vis, CHARTS[vis][2]) for vis in view_charts(pathname, selected_vis or [])
+            if not missing_columns(vis, frame)]
+
+
+def view_layout(path):
+    # 视图第一次打开时生成布局 (之后复用); 选择图表的视图有一个下拉框
+    if path not in _mounted:
+        title, charts, selectable = VIEWS[path]
+        children = [html.H4(title, className='mb-3')]
+        if selectable:
+            children += [
+                html.Label('Select Visualization:'),
+                dcc.Dropdown(
+                    id={'type': 'view-visualization', 'index': path},
+                    options=[{'label': CHARTS[vis][0], 'value': vis} for vis in charts],
+                    value=charts[0],
+                    multi=False,
+                    clearable=False,
+                    className='mt-3'
+                ),
+            ]
+        _mounted[path] = html.Div(children)
+    return _mounted[path]
+
+
+app.layout = dbc.Container([
+    dcc.Location(id='url'),
+    dbc.Row([
+        dbc.Col(html.H1("Cancer Genomic Data Visualization Tool", className="text-center"), className="mb-4 mt-5")
+    ]),
+    dbc.Row([
+        dbc.Col(dbc.Nav([dbc.NavLink(title, href=path, active='exact') for path, (title, _, _) in VIEWS.items()],
+                        pills=True), className="mb-4")
+    ]),
+    dbc.Row([
+        dbc.Col([
+            # 上传区域在所有视图间共用: 一次上传, 所有视图使用同一份解析好的数据
+            dcc.Upload(
+                id='upload-data',
+                children=html.Div(['Drag and Drop or ', html.A('Select Data Files')]),
+                style={
+                    'width': '100%',
+                    'height': '60px',
+                    'lineHeight': '60px',
+                    'borderWidth': '1px',
+                    'borderStyle': 'dashed',
+                    'borderRadius': '5px',
+                    'textAlign': 'center',
+                    'margin': '10px'
+                },
+                # 可以一次上传多个文件 (例如多个队列或每个样本一个文件), 并行解析后合并显示
+                multiple=True
+            ),
+            dcc.ConfirmDialog(
+                id='upload-confirm',
+                message='Files parsed successfully. Please click "Visualize" to generate the graph.',
+            ),
+            html.Div(id='view-content'),
+            # 上传的文件在后台解析, 解析完成前Visualize按钮不可用
+            html.Button('Visualize', id='visualize-button', n_clicks=0, disabled=True, className='mt-4 mb-4'),
+            upload_status(),
+        ], width=6),
+    ]),
+    html.Div(id='view-graphs')
+])
+
+register_upload_callbacks(app, REQUIRED_COLUMNS, active_charts,
+                          [State('url', 'pathname'), State({'type': 'view-visualization', 'index': ALL}, 'value')])
+
+
+@app.callback(
+    Output('view-content', 'children'),
+    Input('url', 'pathname')
+)
+def mount_view(pathname):
+    return view_layout(view_path(pathname))
+
+
+# 生成图像的回调函数: 显示当前视图的图表, 每个图表对同一次上传只生成一次
+@app.callback(
+    Output('view-graphs', 'children'),
+    [Input('visualize-button', 'n_clicks'),
+     Input('url', 'pathname'),
+     Input({'type': 'view-visualization', 'index': ALL}, 'value')],
+    State('upload-job', 'data')
+)
+def update_graphs(n_clicks, pathname, selected_vis, job_id):
+    job = get_job(job_id)
+    if not n_clicks or job is None:
+        return []
+    rows = []
+    for vis in view_charts(pathname, selected_vis):
+        title, _, build = CHARTS[vis]
+        missing = missing_columns(vis, job.frame)
+        if missing:
+            content = html.Div(f"{title}: the uploaded data is missing {', '.join(missing)}", className='text-danger')
+        else:
+            content = dcc.Graph(figure=job.figure(vis, build))
+        rows.append(dbc.Row([dbc.Col(content, width=12)]))
+    return rows
+
+
+if __name__ == '__main__':
+    app.run_server(debug=True)
@@ -6,11 +6,7 @@ from dash import dcc
 from dash import html
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
-import plotly.express as px
 import plotly.graph_objs as go
-from lifelines import KaplanMeierFitter
-from sklearn.decomposition import PCA
-import networkx as nx
 import numpy as np
 import io
 import base64
@@ -112,6 +108,8 @@ def parse_contents(contents, filename):
 )
 def update_graphs(selected_genes):
     global merged_df  # 声明为全局变量
+    # 分析用的库 (plotly.express, networkx, 以及KM/PCA启用时的lifelines, sklearn) 在第一次生成图表时才导入
+    import plotly.express as px
     if merged_df.empty or not selected_genes:
         return {}, {}, {}, {}, {}, {}
 
@@ -132,6 +130,7 @@ def update_graphs(selected_genes):
     hist_fig.update_layout(xaxis_title='Age', yaxis_title='Frequency')
 
     # 生存分析Kaplan-Meier曲线
+    # from lifelines import KaplanMeierFitter
     # kmf = KaplanMeierFitter()
     # km_fig = go.Figure()
     #
@@ -145,6 +144,7 @@ def update_graphs(selected_genes):
     # km_fig.update_layout(title='Survival Analysis', xaxis_title='Days', yaxis_title='Survival Probability')
 
     # 多变量PCA分析图
+    # from sklearn.decomposition import PCA
     # pca = PCA(n_components=2)
     # clinical_vars = merged_df[['age_at_initial_pathologic_diagnosis', 'days_to_death']].dropna()
     # principal_components = pca.fit_transform(clinical_vars)
@@ -154,6 +154,7 @@ def update_graphs(selected_genes):
     #                       coloraxis_colorbar=dict(title='Days to Death'))
 
     # 突变基因共现网络图
+    import networkx as nx
     co_occurrence_matrix = pd.crosstab(merged_df['bcr_patient_barcode'], merged_df['Hugo_Symbol'])
     co_occurrence_matrix = co_occurrence_matrix.T.dot(co_occurrence_matrix)
     co_occurrence_matrix.values[[np.arange(co_occurrence_matrix.shape[0])] * 2] = 0
@@ -0,0 +1,242 @@
+import base64
+import io
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from dash import dcc, html
+import dash_bootstrap_components as dbc
+from dash.dependencies import Input, Output, State
+
+# 同时处理的上传任务数 (每个任务在线程中协调解析和合并)
+UPLOAD_WORKERS = 2
+# 解析文件的进程数, 一次上传多个文件时并行解析; 可以通过环境变量 GENOVAI_UPLOAD_PROCESSES 修改
+UPLOAD_PROCESSES = int(os.environ.get('GENOVAI_UPLOAD_PROCESSES', os.cpu_count() or 1))
+# 最多保留的上传任务数, 更早的任务 (连同解析好的数据和生成的图表) 被丢弃
+MAX_JOBS = 8
+# 进度条中解析和为当前视图生成图表所占的比例, 剩下的部分是合并数据
+PARSE_SHARE = 0.8
+CHARTS_SHARE = 0.1
+# 解析过程中刷新进度的间隔 (秒)
+PROGRESS_INTERVAL = 0.2
+# 不同取值数不超过行数的这个比例时, 字符串列在解析进程中转换为分类类型 (传回主进程的数据更小)
+CATEGORY_RATIO = 0.5
+
+upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+_parse_pool = None
+_progress_manager = None
+upload_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def parse_pool():
+    # 第一次上传时才启动解析进程, 以及解析进程向后台任务报告读取进度用的共享字典所在的管理进程
+    global _parse_pool, _progress_manager
+    with _jobs_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(max_workers=UPLOAD_PROCESSES)
+            _progress_manager = multiprocessing.Manager()
+        return _parse_pool, _progress_manager
+
+
+class ProgressReader(io.StringIO):
+    # CSV解析器按块 (约256K字符) 读取文本, 每读一块把已读的比例写入进度字典
+    def __init__(self, text, progress, key):
+        super().__init__(text)
+        self.size = max(len(text), 1)
+        self.progress = progress
+        self.key = key
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.progress[self.key] = self.tell() / self.size
+        return chunk
+
+
+# 一次上传 (一个或多个文件) 的后台任务: 解析并合并文件, 再生成上传时所在视图的图表, 之后才标记为完成。
+# 所有视图共用解析好的数据, 其他图表在第一次被请求时生成并缓存在任务中
+class UploadJob:
+
+    def __init__(self, filenames):
+        self.filenames = filenames
+        self.parsed = 0
+        self.merged = False
+        self.progress = 0.0
+        self.error = None
+        self.frame = None
+        self.figures = {}
+        self.future = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.frame is not None
+
+    def figure(self, vis, build):
+        # 同一图表只生成一次 (同时请求时等待第一次生成完成)
+        with self._lock:
+            if vis not in self.figures:
+                self.figures[vis] = build(self.frame)
+            return self.figures[vis]
+
+
+def parse_upload(contents, filename, required_columns=(), progress=None, key=None):
+    # 解析dcc.Upload上传的一个CSV (base64编码) 并检查必需的列; 在解析进程中运行,
+    # progress不为None时把读取进度 (0~1) 写入progress[key]
+    # pandas在第一次上传时才导入 (解析进程和后台任务中), 不计入应用启动时间
+    import pandas as pd
+    content_type, content_string = contents.split(',')
+    if 'csv' not in filename:
+        raise ValueError(f'{filename} is not a CSV file')
+    text = base64.b64decode(content_string).decode('utf-8')
+    df = pd.read_csv(io.StringIO(text) if progress is None else ProgressReader(text, progress, key))
+    missing = [column for column in required_columns if column not in df.columns]
+    if missing:
+        raise ValueError(f"{filename} is missing required columns: {', '.join(missing)}")
+    for column in df.columns:
+        values = df[column]
+        if (pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values)) \
+                and not isinstance(values.dtype, pd.CategoricalDtype) and values.nunique() <= len(df) * CATEGORY_RATIO:
+            df[column] = df[column].astype('category')
+    return df
+
+
+def concat_uploads(frames):
+    # 合并多个文件: 每个分类列在所有文件中使用同一组 (排好序的) 类别, 合并后的编码一致且仍然是分类类型
+    import pandas as pd
+    columns = list(dict.fromkeys(column for df in frames for column in df.columns))
+    frames = [df.reindex(columns=columns) for df in frames]
+    for column in columns:
+        if not any(isinstance(df[column].dtype, pd.CategoricalDtype) for df in frames):
+            continue
+        categories = pd.Index(pd.concat([pd.Series(df[column].dropna().unique()) for df in frames]).unique())
+        dtype = pd.CategoricalDtype(categories.sort_values())
+        frames = [df.assign(**{column: df[column].astype(dtype)}) for df in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _run(job, contents, filenames, required_columns, active_charts=None):
+    import pandas as pd
+    try:
+        # 每个文件在一个解析进程中解析, 解析进程每读一块更新共享的进度字典;
+        # 总进度按文件大小加权, 等待解析完成期间定时刷新
+        pool, manager = parse_pool()
+        progress = manager.dict()
+        futures = {pool.submit(parse_upload, content, filename, required_columns, progress, i): i
+                   for i, (content, filename) in enumerate(zip(contents, filenames))}
+        sizes = [len(content) for content in contents]
+        frames, errors, pending = [None] * len(futures), [], set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    frames[futures[future]] = future.result()
+                except ValueError as e:
+                    errors.append(str(e))
+                job.parsed += 1
+            read = dict(progress)
+            read.update({futures[future]: 1.0 for future in futures if future.done()})
+            parsed_bytes = sum(size * read.get(i, 0.0) for i, size in enumerate(sizes))
+            job.progress = PARSE_SHARE * parsed_bytes / max(sum(sizes), 1)
+        if errors:
+            raise ValueError('; '.join(errors))
+        if len(frames) > 1:
+            # 多个文件一起显示时记录每行来自哪个文件
+            frames = [df.assign(source_file=pd.Categorical([filename] * len(df)))
+                      for df, filename in zip(frames, filenames)]
+        frame = concat_uploads(frames)
+        job.merged = True
+        job.progress = 1.0 - CHARTS_SHARE
+        # 当前视图的图表在后台生成, 点击Visualize时直接显示; 生成失败的图表留到被请求时再生成
+        charts = active_charts(frame) if active_charts is not None else []
+        for i, (vis, build) in enumerate(charts):
+            try:
+                job.figures[vis] = build(frame)
+            except Exception as e:
+                print(f'{vis}: {e}')
+            job.progress = 1.0 - CHARTS_SHARE * (1 - (i + 1) / len(charts))
+        job.frame = frame
+        job.progress = 1.0
+    except Exception as e:
+        print(e)
+        job.error = str(e)
+
+
+def start_upload(contents, filenames, required_columns, active_charts=None):
+    # 在后台线程中开始解析 (一个或多个文件), 立即返回任务id;
+    # active_charts(frame) 返回合并后要预先生成的图表 [(可视化, 生成函数)]
+    if not isinstance(contents, list):
+        contents, filenames = [contents], [filenames]
+    job_id = uuid.uuid4().hex
+    job = UploadJob(filenames)
+    with _jobs_lock:
+        upload_jobs[job_id] = job
+        while len(upload_jobs) > MAX_JOBS:
+            upload_jobs.popitem(last=False)
+    job.future = upload_executor.submit(_run, job, contents, filenames, required_columns, active_charts)
+    return job_id
+
+
+def get_job(job_id):
+    # 解析完成的任务, 还没有完成或任务不存在时返回None
+    job = upload_jobs.get(job_id) if job_id else None
+    return job if job is not None and job.ready else None
+
+
+def upload_status():
+    # 放在Visualize按钮旁边的任务状态、轮询定时器和进度条
+    return html.Div([
+        dcc.Store(id='upload-job'),
+        dcc.Interval(id='upload-poll', interval=300, disabled=True),
+        dbc.Progress(id='upload-progress', value=0, label='', striped=True, animated=True,
+                     style={'height': '20px'}, className='mt-2'),
+    ])
+
+
+def register_upload_callbacks(app, required_columns, active_charts=None, view_state=()):
+    # 上传后立即开始后台解析; 定时器轮询进度, 解析完成并生成当前视图的图表后才启用Visualize按钮并弹出提示。
+    # view_state为描述当前视图的State, 上传时的取值传给active_charts(frame, *取值)
+    @app.callback(
+        [Output('upload-job', 'data'),
+         Output('upload-poll', 'disabled')],
+        Input('upload-data', 'contents'),
+        [State('upload-data', 'filename')] + list(view_state),
+        prevent_initial_call=True
+    )
+    def start_upload_job(contents, filenames, *view):
+        if not contents:
+            return None, True
+        charts = None if active_charts is None else (lambda frame: active_charts(frame, *view))
+        return start_upload(contents, filenames, required_columns, charts), False
+
+    @app.callback(
+        [Output('upload-progress', 'value'),
+         Output('upload-progress', 'label'),
+         Output('upload-progress', 'color'),
+         Output('visualize-button', 'disabled'),
+         Output('upload-poll', 'disabled', allow_duplicate=True),
+         Output('upload-confirm', 'displayed')],
+        [Input('upload-poll', 'n_intervals'),
+         Input('upload-job', 'data')],
+        prevent_initial_call=True
+    )
+    def poll_upload_job(n_intervals, job_id):
+        job = upload_jobs.get(job_id) if job_id else None
+        if job is None:
+            return 0, '', 'primary', True, True, False
+        percent = round(job.progress * 100)
+        if job.error is not None:
+            return 100, f'Error: {job.error}', 'danger', True, True, False
+        if job.ready:
+            return 100, 'Ready', 'success', False, True, True
+        if job.parsed < len(job.filenames):
+            label = f'Parsing {job.parsed} of {len(job.filenames)} files... {percent}%' if len(job.filenames) > 1 \
+                else f'Parsing {job.filenames[0]}... {percent}%'
+        elif not job.merged:
+            label = f'Merging files... {percent}%'
+        else:
+            label = f'Generating charts... {percent}%'
+        return percent, label, 'primary', True, False, False
@@ -0,0 +1,87 @@
+import numpy as np
+import plotly.graph_objs as go
+
+from cross_filter import AGE_COLUMN
+from genome_view import figure_patch, visible_range
+
+# 年龄直方图在可见范围内的分箱数, 缩放后在可见范围内重新分箱, 分辨率随之提高
+AGE_HISTOGRAM_BINS = 30
+# 年龄折线图在可见范围内最多的点数
+AGE_LINE_POINTS = 200
+
+
+def age_resolution(ages):
+    # 年龄取值之间的最小间隔 (整数年龄为1); 箱宽取它的整数倍, 缩放到底时每个取值一个箱
+    steps = np.diff(np.unique(ages))
+    return float(steps.min()) if len(steps) else 1.0
+
+
+def age_bins(ages, x_range, bins):
+    # 可见范围内的分箱 (起点, 箱宽, 箱数); ages为排好序的年龄取值
+    if not len(ages):
+        return 0.0, 1.0, 1
+    resolution = age_resolution(ages)
+    low, high = visible_range(x_range, float(ages[0]), float(ages[-1]))
+    width = max(np.ceil((high - low) / bins / resolution), 1) * resolution
+    first = np.floor(low / width) * width
+    return first, width, int((high - first) // width) + 1
+
+
+def count_bins(ages, weights, first, width, n):
+    # 有序的年龄先二分查找切出分箱范围内的一段, 再按箱累加权重 (计数) 和年龄之和
+    start, stop = np.searchsorted(ages, [first, first + n * width])
+    ages, weights = ages[start:stop], weights[start:stop]
+    index = np.clip(((ages - first) / width).astype(np.int64), 0, n - 1)
+    return np.bincount(index, weights, minlength=n), np.bincount(index, weights * ages, minlength=n)
+
+
+def zoom_values(cross_filter, mask, low, high):
+    # 逐行的有序年龄数组 (范围索引) 中[low, high)的一段, 权重为是否满足过滤条件 (抽样时乘以行权重)
+    index = cross_filter.ranges[AGE_COLUMN]
+    start, stop = index.span(low, high, high_inclusive=False)
+    rows = index.row_ids[start:stop]
+    weights = mask[rows].astype(float)
+    if cross_filter.weights is not None:
+        weights *= cross_filter.weights[rows]
+    return index.values[start:stop], weights
+
+
+def histogram_trace(ages, weights, bins):
+    first, width, n = bins
+    counts, _ = count_bins(ages, weights, first, width, n)
+    return {'x': first + (np.arange(n) + 0.5) * width, 'y': counts, 'width': np.full(n, width)}
+
+
+def line_trace(ages, weights, bins):
+    # 每个箱一个点, 横坐标为箱内的平均年龄 (整数年龄且箱宽为1时就是每个年龄的突变数)
+    counts, sums = count_bins(ages, weights, *bins)
+    nonzero = counts > 0
+    return {'x': sums[nonzero] / counts[nonzero], 'y': counts[nonzero]}
+
+
+def age_histogram_figure(ages, counts, title='Age Distribution at Initial Pathologic Diagnosis'):
+    # ages/counts: 年龄取值 (有序) 和当前过滤状态下每个取值的计数
+    bins = age_bins(ages, None, AGE_HISTOGRAM_BINS)
+    fig = go.Figure(go.Bar(**histogram_trace(ages, np.asarray(counts, dtype=float), bins), name='Frequency'))
+    fig.update_layout(title=title, xaxis_title='Age', yaxis_title='Frequency', bargap=0, uirevision='age_dist')
+    return fig
+
+
+def age_line_figure(ages, counts, title='Mutation Count by Age at Initial Pathologic Diagnosis'):
+    bins = age_bins(ages, None, AGE_LINE_POINTS)
+    fig = go.Figure(go.Scatter(**line_trace(ages, np.asarray(counts, dtype=float), bins), mode='lines'))
+    fig.update_layout(title=title, xaxis_title='Age at Initial Pathologic Diagnosis', yaxis_title='Mutation Count',
+                      uirevision='mutation_line')
+    return fig
+
+
+def age_zoom_patch(vis, cross_filter, mask, x_range):
+    # 缩放后在可见范围内按更高的分辨率重新分箱 (箱宽由所有年龄取值决定), 只发送新的trace数据
+    all_ages = cross_filter.labels[AGE_COLUMN].to_numpy(dtype=float)
+    if vis == 'age_dist':
+        trace, bins = histogram_trace, age_bins(all_ages, x_range, AGE_HISTOGRAM_BINS)
+    else:
+        trace, bins = line_trace, age_bins(all_ages, x_range, AGE_LINE_POINTS)
+    first, width, n = bins
+    ages, weights = zoom_values(cross_filter, mask, first, first + n * width)
+    return figure_patch([trace(ages, weights, bins)])
@@ -0,0 +1,48 @@
+// 只改变界面、不需要数据的回调在浏览器中执行 (由updated_app.py通过ClientsideFunction注册), 不请求服务器
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    genovai: {
+        // 图表网格: 每行figuresPerRow个等宽的图表, 与grid_style生成的样式相同
+        gridStyle: function (figuresPerRow) {
+            return {
+                display: 'grid',
+                gridTemplateColumns: 'repeat(' + (figuresPerRow || 1) + ', minmax(0, 1fr))',
+                columnGap: '24px',
+                rowGap: '24px'
+            };
+        },
+
+        // 选中的表格列高亮显示
+        selectedColumnStyles: function (selectedColumns) {
+            return (selectedColumns || []).map(function (column) {
+                return {'if': {'column_id': column}, 'background_color': '#D2F3FF'};
+            });
+        },
+
+        // 切换任务时按任务设置可视化选项、默认选择和每行图表数; 标签中的{cohort}替换为当前队列。
+        // 只切换队列时选项不变 (只有标签变化): 保留仍在选项中的选择和每行图表数
+        taskContent: function (selectedTask, cohort, settings, selected) {
+            var noUpdate = window.dash_clientside.no_update;
+            if (selectedTask === '') {
+                return [noUpdate, noUpdate, noUpdate];
+            }
+            var task = settings.tasks[selectedTask] || settings.default;
+            var options = task.options.map(function (option) {
+                return {label: option.label.split('{cohort}').join(cohort), value: option.value};
+            });
+            var context = window.dash_clientside.callback_context;
+            var triggered = (context && context.triggered || []).map(function (event) {
+                return event.prop_id;
+            });
+            if (triggered.indexOf('cohort-dropdown.value') >= 0 && triggered.indexOf('task-dropdown.value') < 0) {
+                var values = options.map(function (option) {
+                    return option.value;
+                });
+                var kept = (selected || []).filter(function (value) {
+                    return values.indexOf(value) >= 0;
+                });
+                return [options, kept, noUpdate];
+            }
+            return [options, task.value, task.per_row];
+        }
+    }
+});
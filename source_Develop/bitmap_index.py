@@ -0,0 +1,136 @@
+import numpy as np
+
+# 位图按64位字存储, 第i行对应第i//64个字的第i%64位
+WORD_BITS = 64
+
+
+def popcount(words):
+    # 统计位图中置1的位数
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(words).sum())
+    return int(np.unpackbits(words.view(np.uint8)).sum())
+
+
+def popcount_rows(words):
+    # 二维位图 (每行一个位图) 每行置1的位数
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    return np.unpackbits(words.view(np.uint8), axis=-1).sum(axis=-1, dtype=np.int64)
+
+
+def set_bits(words, rows):
+    np.bitwise_or.at(words, rows >> 6, np.left_shift(np.uint64(1), (rows & 63).astype(np.uint64)))
+    return words
+
+
+# 分类列的位图索引
+# 每列的行id按编码分组存成CSR形式 (offsets + row_ids); 行数超过总行数1/32的取值另外存一份
+# 位图 (这时位图比32位行id数组更小, 与roaring位图选择容器的方式相同), 每列最多32个这样的取值。
+# 多列的合取过滤变成位图之间的按位与, 结果行数由popcount得到。
+class BitmapIndex:
+
+    def __init__(self, codes, labels, n_rows, columns):
+        self.n_rows = n_rows
+        self.n_words = (n_rows + WORD_BITS - 1) // WORD_BITS
+        self.labels = {}
+        self.offsets = {}
+        self.row_ids = {}
+        self.dense = {}
+        for column in columns:
+            if column not in codes:
+                continue
+            column_codes = codes[column]
+            counts = np.bincount(column_codes, minlength=len(labels[column]) + 1)
+            self.labels[column] = labels[column]
+            self.offsets[column] = np.concatenate([[0], np.cumsum(counts)])
+            self.row_ids[column] = np.argsort(column_codes, kind='stable').astype(np.int64)
+            self.dense[column] = {code: self.from_rows(self.rows_for_code(column, code))
+                                  for code in np.flatnonzero(counts * 32 > n_rows)}
+
+    def copy(self):
+        # 追加前复制一份 (append只替换数组, 不修改已有数组, 数组可以共享)
+        index = BitmapIndex.__new__(BitmapIndex)
+        index.n_rows, index.n_words = self.n_rows, self.n_words
+        index.labels, index.offsets, index.row_ids = dict(self.labels), dict(self.offsets), dict(self.row_ids)
+        index.dense = {column: dict(dense) for column, dense in self.dense.items()}
+        return index
+
+    def append(self, codes, labels, n_rows, remaps):
+        # 追加行: codes为追加后所有行的编码, remaps为出现新取值的列的旧编码->新编码映射。
+        # 旧行按新编码分组后仍然有序, 新行的行id比旧行大, 只需接在每组末尾, 稳定排序几乎是线性的;
+        # 已有的稠密位图只补上新行的位
+        old_rows = self.n_rows
+        self.n_rows = n_rows
+        self.n_words = (n_rows + WORD_BITS - 1) // WORD_BITS
+        new_rows = np.arange(old_rows, n_rows, dtype=np.int64)
+        for column in self.labels:
+            column_codes = codes[column]
+            remap = remaps.get(column)
+            sizes = np.diff(self.offsets[column])
+            old_codes = np.repeat(np.arange(len(sizes)) if remap is None else remap, sizes)
+            order = np.argsort(np.concatenate([old_codes, column_codes[old_rows:]]), kind='stable')
+            self.row_ids[column] = np.concatenate([self.row_ids[column], new_rows])[order]
+            counts = np.bincount(column_codes, minlength=len(labels[column]) + 1)
+            self.labels[column] = labels[column]
+            self.offsets[column] = np.concatenate([[0], np.cumsum(counts)])
+            old_dense = {code if remap is None else remap[code]: words
+                         for code, words in self.dense[column].items()}
+            dense = {}
+            for code in np.flatnonzero(counts * 32 > n_rows):
+                if code in old_dense:
+                    words = np.concatenate([old_dense[code], np.zeros(self.n_words - len(old_dense[code]),
+                                                                      dtype=np.uint64)])
+                    dense[code] = set_bits(words, new_rows[column_codes[old_rows:] == code])
+                else:
+                    dense[code] = self.from_rows(self.rows_for_code(column, code))
+            self.dense[column] = dense
+
+    def empty(self):
+        return np.zeros(self.n_words, dtype=np.uint64)
+
+    def full(self):
+        return self.from_mask(np.ones(self.n_rows, dtype=bool))
+
+    def from_rows(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) * WORD_BITS > self.n_rows:
+            mask = np.zeros(self.n_rows, dtype=bool)
+            mask[rows] = True
+            return self.from_mask(mask)
+        return set_bits(self.empty(), rows)
+
+    def from_mask(self, mask):
+        padded = np.zeros(self.n_words * WORD_BITS, dtype=bool)
+        padded[:self.n_rows] = mask
+        return np.packbits(padded, bitorder='little').view(np.uint64)
+
+    def to_mask(self, words):
+        return np.unpackbits(words.view(np.uint8), bitorder='little')[:self.n_rows].astype(bool)
+
+    def to_rows(self, words):
+        return np.flatnonzero(self.to_mask(words))
+
+    def rows_for_code(self, column, code):
+        offsets = self.offsets[column]
+        return self.row_ids[column][offsets[code]:offsets[code + 1]]
+
+    def bitmap_codes(self, column, codes):
+        # 多个取值编码之间按位或; 稀疏取值的行id先合并再一次性置位
+        words = self.empty()
+        sparse = []
+        for code in codes:
+            if code in self.dense[column]:
+                words |= self.dense[column][code]
+            else:
+                sparse.append(self.rows_for_code(column, code))
+        if sparse:
+            words |= self.from_rows(np.concatenate(sparse))
+        return words
+
+    def bitmap(self, column, values):
+        # 某列取值属于values的行
+        positions = self.labels[column].get_indexer(list(values))
+        return self.bitmap_codes(column, positions[positions >= 0])
+
+    def count(self, words):
+        return popcount(words)
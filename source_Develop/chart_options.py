@@ -0,0 +1,34 @@
+import os
+
+# 页面布局需要的图表选项和默认值; 不导入数据和绘图相关的模块, 应用启动时只导入这个模块,
+# 生成图表和统计的模块在回调第一次使用时才导入
+
+# 定义可视化选项
+visualization_options = [
+    {'label': 'Age Distribution at Initial Diagnosis', 'value': 'age_dist'},
+    {'label': 'Vital Status vs. Age', 'value': 'vital_status_vs_age'},
+    {'label': 'Age at Initial Diagnosis vs. Mutation Type and Vital Status', 'value': 'mutation_vs_age_vs_status'},
+    {'label': 'Top 10 Mutation Type Distribution in {cohort} Patients', 'value': 'mutation_type_dist'},
+    {'label': 'Gene Mutation Frequency by Chromosome', 'value': 'mutation_by_chr'},
+    {'label': 'Age at Initial Diagnosis by Gender', 'value': 'age_by_gender'},
+    {'label': 'Number of Mutations per Gene', 'value': 'mutations_per_gene'},
+    {'label': 'Number of Mutations per Patient', 'value': 'mutations_per_patient'},
+    {'label': 'Genome-wide Mutation Density', 'value': 'genome_density'},
+    {'label': 'Mutation Burden across All Patients', 'value': 'patient_burden'}
+    # {'label': 'BRCA Gene Mutation Waterfall Plot', 'value': 'brca_waterfall'}
+]
+# 所有可以生成的图表 (瀑布图任务的图表不在可视化选项中)
+chart_ids = [option['value'] for option in visualization_options] + ['brca_waterfall']
+
+# 突变共现统计默认的基因数, 界面上最多可以选到MAX_TOP_GENES
+TOP_GENES = 50
+MAX_TOP_GENES = 500
+# 网络图只画q值低于阈值的基因对
+NETWORK_Q_THRESHOLD = 0.05
+STATS_COLUMNS = ['Gene A', 'Gene B', 'Neither', 'A Not B', 'B Not A', 'Both', 'Log2 Odds Ratio', 'p-Value',
+                 'q-Value', 'Tendency']
+# 表格默认显示的列 (逗号分隔), 可以通过环境变量 GENOVAI_TABLE_COLUMNS 修改。
+# 加载时只读取图表/过滤需要的列和这些列, 其他列在用户把它们加入表格时才从文件读取
+TABLE_COLUMNS = [column for column in os.environ.get('GENOVAI_TABLE_COLUMNS', '').split(',') if column] or [
+    'Hugo_Symbol', 'One_Consequence', 'age_at_initial_pathologic_diagnosis', 'vital_status',
+    'Chromosome', 'Start_Position', 'bcr_patient_barcode', 'gender']
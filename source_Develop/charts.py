@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+
+from age_view import age_histogram_figure, age_line_figure
+from cross_filter import AGE_COLUMN, box_stats_from_counts
+from filter_state import is_empty_filter
+from genome_view import burden_figure, density_figure, genome_axis, patient_burden
+
+
+def top_counts(series, n):
+    # 取计数最高的n个取值 (与value_counts().head(n)顺序一致), n为None时返回全部
+    series = series[series > 0].sort_values(ascending=False, kind='stable')
+    return series if n is None else series.head(n)
+
+
+def count_frame(series, column):
+    # 计数Series -> (取值, Count)两列的表; 过滤后没有计数时px.bar仍然能生成空的条形图
+    return pd.DataFrame({column: series.index, 'Count': series.to_numpy()})
+
+
+def top_values(dataset, counts, column, n, filter_state):
+    # 分区数据集 (全局字典可能很大) 没有过滤条件且草图能确定Top N时, 由草图选出这n个取值, 只取出它们的计数;
+    # 否则在当前过滤后的所有计数中选。柱子高度总是取计数中的值 (草图的计数只是上界),
+    # 加上/清除过滤条件时同一根柱子的高度一致。内存中的队列没有草图
+    sketch = dataset.sketches.get(column)
+    if sketch is not None and is_empty_filter(filter_state) and sketch.certain(n):
+        labels = dataset.cross_filter.labels[column]
+        positions = labels.get_indexer(sketch.top(n).index)
+        positions = positions[positions >= 0]
+        return top_counts(pd.Series(counts[positions], index=labels[positions]), n)
+    return top_counts(dataset.cross_filter.series(counts, column), n)
+
+
+def gene_consequence_frame(dataset, gene_consequence, genes):
+    # 从基因×突变类型计数矩阵中取出指定基因的长表
+    gene_labels = dataset.cross_filter.labels['Hugo_Symbol']
+    consequence_labels = dataset.cross_filter.labels['One_Consequence']
+    positions = gene_labels.get_indexer(genes)
+    block = gene_consequence[positions, :-1]
+    gene_index, consequence_index = np.nonzero(block)
+    return pd.DataFrame({'Hugo_Symbol': gene_labels[positions[gene_index]],
+                         'One_Consequence': consequence_labels[consequence_index],
+                         'Count': block[gene_index, consequence_index]})
+
+
+def box_figure(dataset, counts, group_column, title, color_column=None):
+    # 根据(分组[, 颜色], 年龄)的计数矩阵生成箱线图, 不需要回到原始行
+    cross_filter = dataset.cross_filter
+    ages = cross_filter.labels['age_at_initial_pathologic_diagnosis'].to_numpy()
+    groups = cross_filter.labels[group_column]
+    fig = go.Figure()
+    if color_column is None:
+        for i, group in enumerate(groups):
+            stats = box_stats_from_counts(ages, counts[i, :-1])
+            if stats is not None:
+                fig.add_trace(go.Box(x=[group], name=str(group), **{k: [v] for k, v in stats.items()}))
+    else:
+        for j, color in enumerate(cross_filter.labels[color_column]):
+            x, values = [], {}
+            for i, group in enumerate(groups):
+                stats = box_stats_from_counts(ages, counts[i, j, :-1])
+                if stats is None:
+                    continue
+                x.append(group)
+                for k, v in stats.items():
+                    values.setdefault(k, []).append(v)
+            if x:
+                fig.add_trace(go.Box(x=x, name=str(color), legendgroup=str(color), **values))
+        fig.update_layout(boxmode='group', legend_title_text=color_column)
+    fig.update_layout(title=title)
+    return fig
+
+
+def zoom_filter(dataset):
+    # 按缩放范围重新聚合时使用的交叉过滤器: 分区数据集在内存中只有 (带权重的) 抽样
+    return dataset.sample_filter if dataset.partitioned is not None else dataset.cross_filter
+
+
+def chart_figures(dataset, vis, counts, filter_state):
+    # 由过滤后的计数生成一个可视化的图表 [(图表id, 图表)], 瀑布图同时生成年龄折线图;
+    # 网页回调和命令行导出/预计算共用
+    # plotly.express 导入较慢, 第一次生成条形图时才导入, 不计入应用启动时间
+    import plotly.express as px
+    cross_filter = dataset.cross_filter
+    ages = cross_filter.labels[AGE_COLUMN].to_numpy()
+    figs = []
+    if vis == 'age_dist':
+        # Age Distribution at Initial Pathologic Diagnosis bar chart (服务器端分箱, 缩放时重新分箱)
+        hist_fig = age_histogram_figure(ages, counts['age'][:-1])
+        figs.append((vis, hist_fig))
+
+    elif vis == 'vital_status_vs_age':
+        # 生成Vital Status vs. Age图像
+        box_fig = box_figure(dataset, counts['status_age'], 'vital_status', 'Vital Status vs. Age')
+        box_fig.update_layout(xaxis_title='Vital Status', yaxis_title='Age at Initial Pathologic Diagnosis')
+        figs.append((vis, box_fig))
+
+    elif vis == 'mutation_vs_age_vs_status':
+        # 生成Age at Initial Diagnosis vs. Mutation Type and Vital Status图像
+        box_fig = box_figure(dataset, counts['consequence_status_age'], 'One_Consequence',
+                             'Age at Initial Diagnosis vs. Mutation Type and Vital Status',
+                             color_column='vital_status')
+        box_fig.update_layout(xaxis_title='Mutation Type', yaxis_title='Age at Initial Pathologic Diagnosis')
+        figs.append((vis, box_fig))
+
+    elif vis == 'mutation_type_dist':
+        # 生成Top 10 Mutation Type Distribution in BRCA Patients图像
+        mutation_type_counts = top_values(dataset, counts['consequence'], 'One_Consequence', 10, filter_state)
+        bar_fig = px.bar(count_frame(mutation_type_counts, 'One_Consequence'), x='One_Consequence', y='Count',
+                         title=f'Top 10 Mutation Type Distribution in {dataset.name} Patients')
+        bar_fig.update_layout(xaxis_title='Mutation Type', yaxis_title='Count')
+        figs.append((vis, bar_fig))
+
+    elif vis == 'mutation_by_chr':
+        # 生成Gene Mutation Frequency by Chromosome图像
+        mutation_by_chr = top_counts(cross_filter.series(counts['chromosome'], 'Chromosome'), None)
+        bar_fig = px.bar(count_frame(mutation_by_chr, 'Chromosome'), x='Chromosome', y='Count',
+                         title='Gene Mutation Frequency by Chromosome')
+        bar_fig.update_layout(xaxis_title='Chromosome', yaxis_title='Mutation Count')
+        figs.append((vis, bar_fig))
+
+    elif vis == 'age_by_gender':
+        # 生成Age at Initial Diagnosis by Gender图像
+        box_fig = box_figure(dataset, counts['gender_age'], 'gender', 'Age at Initial Diagnosis by Gender')
+        box_fig.update_layout(xaxis_title='Gender', yaxis_title='Age at Initial Pathologic Diagnosis')
+        figs.append((vis, box_fig))
+
+    elif vis == 'mutations_per_gene':
+        # 生成Number of Mutations per Gene图像（堆积条形图）
+        gene_consequence = counts['gene_consequence']
+        top_genes = top_values(dataset, gene_consequence.sum(axis=1), 'Hugo_Symbol', 10, filter_state).index
+        mutations_per_gene_data = gene_consequence_frame(dataset, gene_consequence, top_genes)
+        consequence_order = mutations_per_gene_data.groupby('One_Consequence')['Count'].sum() \
+            .sort_values(ascending=False).index[:5].tolist()
+        mutations_per_gene_fig = px.bar(mutations_per_gene_data, x='Hugo_Symbol', y='Count',
+                                        color='One_Consequence',
+                                        title='Number of Mutations per Gene',
+                                        category_orders={'One_Consequence': consequence_order},
+                                        labels={'Hugo_Symbol': 'Gene', 'Count': 'Mutation Count'},
+                                        barmode='stack')
+        mutations_per_gene_fig.update_layout(xaxis_title='Gene', yaxis_title='Mutation Count')
+        figs.append((vis, mutations_per_gene_fig))
+
+    elif vis == 'mutations_per_patient':
+        # 生成Number of Mutations per Patient图像
+        mutations_per_patient = top_values(dataset, counts['patient'], 'bcr_patient_barcode', 10, filter_state)
+        max_value = mutations_per_patient.max() if len(mutations_per_patient) else 0
+        y_axis_max = max(10, max_value + 1)  # 动态调整Y轴范围
+        mutations_per_patient_fig = px.bar(count_frame(mutations_per_patient, 'bcr_patient_barcode'),
+                                           x='bcr_patient_barcode', y='Count',
+                                           title='Number of Mutations per Patient')
+        mutations_per_patient_fig.update_layout(xaxis_title='Patient', yaxis_title='Mutation Count',
+                                                yaxis=dict(range=[0, y_axis_max]), xaxis={'tickangle': 45})
+        figs.append((vis, mutations_per_patient_fig))
+
+    elif vis == 'genome_density':
+        # 全基因组突变密度 (WebGL), 缩放时只对可见范围重新分箱
+        view_filter = zoom_filter(dataset)
+        if genome_axis(view_filter) is not None:
+            figs.append((vis, density_figure(view_filter, view_filter.mask_for(filter_state))))
+
+    elif vis == 'patient_burden':
+        # 所有病人的突变负荷 (WebGL), 缩放时只对可见范围重新取点
+        view_filter = zoom_filter(dataset)
+        if 'bcr_patient_barcode' in view_filter.codes:
+            figs.append((vis, burden_figure(*patient_burden(view_filter, view_filter.mask_for(filter_state)))))
+
+    elif vis == 'brca_waterfall':
+        # 生成BRCA基因突变的瀑布图 (跟随表格过滤和其他图表的共享过滤状态)
+        gene_consequence = counts['gene_consequence']
+        top_genes = top_values(dataset, gene_consequence.sum(axis=1), 'Hugo_Symbol', 20, filter_state).index
+        waterfall_data = gene_consequence_frame(dataset, gene_consequence, top_genes)
+        waterfall_fig = px.bar(waterfall_data, x='Hugo_Symbol', y='Count', color='One_Consequence',
+                               title=f'{dataset.name} Gene Mutation Waterfall Plot')
+        waterfall_fig.update_layout(xaxis_title='Gene', yaxis_title='Count')
+        # 添加折线图 (服务器端分箱, 缩放时重新分箱)
+        line_fig = age_line_figure(ages, counts['age'][:-1])
+        figs.append((vis, waterfall_fig))
+        figs.append(('mutation_line', line_fig))
+    return figs
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+from readers import read_table
+
+# 突变表和临床表之间的连接键
+PATIENT_KEY = 'bcr_patient_barcode'
+# 每个病人一行的临床列; 合并后的数据中这些列在同一病人的所有突变行上重复
+CLINICAL_COLUMNS = ['age_at_initial_pathologic_diagnosis', 'vital_status', 'gender']
+# GDC门户导出的clinical.tsv中的列名
+CLINICAL_RENAMES = {'case_submitter_id': PATIENT_KEY, 'submitter_id': PATIENT_KEY}
+
+
+def patient_barcodes(values):
+    # 样本条码的前12位是病人条码 (TCGA-A1-A0SB-01A-11D-A142-09 -> TCGA-A1-A0SB), 在类别上计算
+    values = pd.Series(values).astype('category')
+    inverse, uniques = pd.factorize(values.cat.categories.astype(str).str[:12])
+    codes = np.append(inverse, -1)[values.cat.codes.to_numpy()]
+    return pd.Categorical.from_codes(codes, categories=uniques)
+
+
+# 临床表: 每个病人一行, 行号就是整数病人编码。突变行只保存病人编码, 需要临床属性时
+# 按编码取值 (向量化的索引查找), 不把临床数据复制到每个突变行上
+class ClinicalTable:
+
+    def __init__(self, frame):
+        frame = frame.rename(columns=CLINICAL_RENAMES)
+        frame = frame[frame[PATIENT_KEY].notna()].drop_duplicates(PATIENT_KEY, keep='last')
+        self.frame = frame.reset_index(drop=True)
+        self.index = pd.Index(self.frame[PATIENT_KEY].astype(str))
+        # 最后加一行缺失值, 找不到的病人 (编码-1) 正好取到这一行
+        self._padded = pd.concat([self.frame, self.frame.iloc[:0].reindex([0])], ignore_index=True)
+        self._codes = {}
+
+    @classmethod
+    def read(cls, path):
+        return cls(read_table(path))
+
+    @classmethod
+    def split(cls, frame):
+        # 从合并后的数据中拆出临床表; 临床列在同一病人内不一致时不拆分, 返回None
+        columns = [column for column in CLINICAL_COLUMNS if column in frame.columns]
+        if PATIENT_KEY not in frame.columns or not columns:
+            return frame, None
+        grouped = frame.groupby(PATIENT_KEY, observed=True, sort=False)[columns]
+        if (grouped.nunique(dropna=False) > 1).any().any():
+            return frame, None
+        clinical = grouped.first().reset_index()
+        return frame.drop(columns=columns), cls(clinical)
+
+    @property
+    def columns(self):
+        return [column for column in self.frame.columns if column != PATIENT_KEY]
+
+    def patient_rows(self, barcodes):
+        # 每个突变行对应的临床表行号, 没有临床记录的病人为-1; 分类列只对类别做一次查找
+        barcodes = pd.Series(barcodes)
+        if isinstance(barcodes.dtype, pd.CategoricalDtype):
+            rows = self.index.get_indexer(barcodes.cat.categories.astype(str))
+            return np.append(rows, -1)[barcodes.cat.codes.to_numpy()]
+        return self.index.get_indexer(barcodes.astype(str))
+
+    def take(self, column, patient_rows):
+        return self._padded[column].iloc[patient_rows].reset_index(drop=True)
+
+    def codes(self, column, labels=None):
+        # 每个病人在该列上的编码 (最后一个编码为缺失值, 包括找不到的病人) 和取值字典
+        if labels is None:
+            if column not in self._codes:
+                codes, uniques = pd.factorize(self.frame[column], sort=True)
+                if isinstance(uniques, pd.Categorical):
+                    uniques = np.asarray(uniques)
+                self._codes[column] = (codes, pd.Index(uniques))
+            codes, labels = self._codes[column]
+        else:
+            labels = pd.Index(labels)
+            codes = labels.get_indexer(self.frame[column])
+        codes = np.append(codes, -1).astype(np.int32)
+        codes[codes < 0] = len(labels)
+        return codes, labels
+
+    def join(self, mutations, columns=None):
+        # 给一部分突变行 (例如表格的一页) 加上临床列
+        columns = self.columns if columns is None else [column for column in columns if column in self.columns]
+        if not columns:
+            return mutations
+        rows = self.patient_rows(mutations[PATIENT_KEY])
+        joined = mutations.copy()
+        for column in columns:
+            joined[column] = self.take(column, rows).to_numpy()
+        return joined
+
+    def covers(self, frame):
+        # frame中的病人都已经在表中, 且给出的非缺失值与表中一致 (不需要更新)
+        frame = frame.rename(columns=CLINICAL_RENAMES)
+        rows = self.patient_rows(frame[PATIENT_KEY].dropna())
+        if (rows < 0).any():
+            return False
+        frame = frame[frame[PATIENT_KEY].notna()]
+        for column in frame.columns:
+            if column not in self.columns:
+                continue
+            given = frame[column].reset_index(drop=True)
+            current = self.take(column, rows)
+            known = given.notna().to_numpy()
+            if not (given[known].astype(object).to_numpy() == current[known].astype(object).to_numpy()).all():
+                return False
+        return True
+
+    def upsert(self, frame):
+        # 新增或更新病人记录 (只覆盖给出的非缺失值), 返回新的临床表; 旧表保持不变,
+        # 正在使用它的快照不受影响
+        frame = frame.rename(columns=CLINICAL_RENAMES)
+        frame = frame[frame[PATIENT_KEY].notna()].drop_duplicates(PATIENT_KEY, keep='last')
+        frame = frame.set_index(frame[PATIENT_KEY].astype(str)).drop(columns=PATIENT_KEY)
+        current = self.frame.set_index(self.index).drop(columns=PATIENT_KEY).astype(object)
+        updated = current.reindex(current.index.append(frame.index.difference(current.index)))
+        updated.update(frame.astype(object))
+        return ClinicalTable(updated.infer_objects().rename_axis(PATIENT_KEY).reset_index())
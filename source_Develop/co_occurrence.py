@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+
+from bitmap_index import WORD_BITS, popcount_rows
+from chart_options import NETWORK_Q_THRESHOLD, STATS_COLUMNS, TOP_GENES
+from clinical import PATIENT_KEY
+
+# 突变共现 / 互斥统计: 突变病人数最多的K个基因两两之间的单侧Fisher精确检验 (超几何分布),
+# 对所有基因对向量化计算, 用Benjamini-Hochberg校正多重检验
+
+# 网络图最多画这么多条边 (q值最小的)
+NETWORK_EDGES = 300
+# 网页表格最多显示的基因对数 (q值最小的)
+TABLE_ROWS = 1000
+# 尾部求和时相对当前和小于这个比例的项不再累加 (离众数越远项越小)
+TAIL_TOLERANCE = 1e-17
+TENDENCY_COLORS = {'Co-occurrence': '#2ca02c', 'Mutual exclusivity': '#d62728'}
+
+
+def gene_patient_bits(cross_filter, mask, top_k=TOP_GENES):
+    # 过滤后的突变 -> 基因×病人的稀疏二值矩阵 (每个基因一个病人位图, 同一病人的多个突变只置一次位);
+    # 病人全集为过滤后至少有一个突变的病人, 基因按突变病人数 (位图的popcount) 取前top_k个
+    genes = cross_filter.codes['Hugo_Symbol'][mask]
+    patients = cross_filter.codes[PATIENT_KEY][mask]
+    n_genes, n_labels = len(cross_filter.labels['Hugo_Symbol']), len(cross_filter.labels[PATIENT_KEY])
+    known = (genes < n_genes) & (patients < n_labels)
+    genes, patients = genes[known], patients[known]
+    present = np.bincount(patients, minlength=n_labels) > 0
+    n_patients = int(present.sum())
+    patients = (np.cumsum(present) - 1)[patients]
+    bits = np.zeros((n_genes, (n_patients + WORD_BITS - 1) // WORD_BITS), dtype=np.uint64)
+    np.bitwise_or.at(bits, (genes, patients >> 6), np.left_shift(np.uint64(1), (patients & 63).astype(np.uint64)))
+    mutated = popcount_rows(bits)
+    top = np.argsort(-mutated, kind='stable')[:top_k]
+    top = top[mutated[top] > 0]
+    return cross_filter.labels['Hugo_Symbol'][top], bits[top], n_patients
+
+
+def pair_counts(bits):
+    # 两两同时突变的病人数: 按行对位图做按位与后popcount (只计算上三角)
+    k = len(bits)
+    both = np.zeros((k, k), dtype=np.int64)
+    for i in range(k - 1):
+        both[i, i + 1:] = popcount_rows(bits[i] & bits[i + 1:])
+    return both
+
+
+def log_factorials(n):
+    return np.concatenate([[0.0], np.cumsum(np.log(np.arange(1, n + 1)))])
+
+
+def hypergeometric_tails(both, k1, k2, n):
+    # X ~ 超几何(n, k1, k2): 返回 (P(X <= both), P(X >= both))。
+    # 从观测值向远离众数的一侧逐项求和 (项单调递减, 很快可以截断), 另一侧由补集得到 (这时p值较大, 精度足够)
+    log_fact = log_factorials(n)
+
+    def log_choose(m, r):
+        return log_fact[m] - log_fact[r] - log_fact[m - r]
+
+    def log_pmf(x, a, b):
+        return log_choose(b, x) + log_choose(n - b, a - x) - log_choose(n, a)
+
+    low, high = np.maximum(0, k1 + k2 - n), np.minimum(k1, k2)
+    mode = (k1 + 1) * (k2 + 1) // (n + 2)
+    step = np.where(both >= mode, 1, -1)
+    bound = np.where(step > 0, high, low)
+    observed = np.exp(log_pmf(both, k1, k2))
+    tail = observed.copy()
+    active = np.flatnonzero(both != bound)
+    x = both.copy()
+    while len(active):
+        x[active] += step[active]
+        term = np.exp(log_pmf(x[active], k1[active], k2[active]))
+        tail[active] += term
+        active = active[(x[active] != bound[active]) & (term > TAIL_TOLERANCE * tail[active])]
+    tail = np.minimum(tail, 1.0)
+    other = np.clip(1.0 - tail + observed, 0.0, 1.0)
+    return np.where(step > 0, other, tail), np.where(step > 0, tail, other)
+
+
+def benjamini_hochberg(p_values):
+    # Benjamini-Hochberg q值 (按p值排序后从大到小取累积最小值)
+    m = len(p_values)
+    if m == 0:
+        return p_values
+    order = np.argsort(p_values)
+    q = p_values[order] * m / np.arange(1, m + 1)
+    q = np.minimum.accumulate(q[::-1])[::-1]
+    q_values = np.empty(m)
+    q_values[order] = np.minimum(q, 1.0)
+    return q_values
+
+
+def co_occurrence_stats(cross_filter, mask, top_k=TOP_GENES):
+    # 所有基因对的2×2列联表、对数优势比和单侧检验; 优势比>1检验共现 (P(X >= 同时突变数)),
+    # 否则检验互斥 (P(X <= 同时突变数)), q值在所有基因对上校正
+    genes, bits, n = gene_patient_bits(cross_filter, mask, top_k)
+    if len(genes) < 2:
+        return pd.DataFrame(columns=STATS_COLUMNS)
+    mutated = popcount_rows(bits)
+    first, second = np.triu_indices(len(genes), k=1)
+    both = pair_counts(bits)[first, second]
+    k1, k2 = mutated[first], mutated[second]
+    a_only, b_only = k1 - both, k2 - both
+    neither = n - k1 - k2 + both
+    # 每格加0.5 (Haldane-Anscombe校正), 有零格时优势比仍然有限
+    log2_odds = np.log2((both + 0.5) * (neither + 0.5) / ((a_only + 0.5) * (b_only + 0.5)))
+    p_lower, p_upper = hypergeometric_tails(both, k1, k2, n)
+    co_occurring = log2_odds > 0
+    p_values = np.where(co_occurring, p_upper, p_lower)
+    stats = pd.DataFrame({
+        'Gene A': np.asarray(genes)[first], 'Gene B': np.asarray(genes)[second],
+        'Neither': neither, 'A Not B': a_only, 'B Not A': b_only, 'Both': both,
+        'Log2 Odds Ratio': log2_odds, 'p-Value': p_values, 'q-Value': benjamini_hochberg(p_values),
+        'Tendency': np.where(co_occurring, 'Co-occurrence', 'Mutual exclusivity'),
+    })
+    return stats.sort_values(['q-Value', 'p-Value'], kind='stable').reset_index(drop=True)
+
+
+def network_figure(stats, q_threshold=NETWORK_Q_THRESHOLD, max_edges=NETWORK_EDGES,
+                   title='Mutation Co-occurrence and Mutual Exclusivity'):
+    # 只画显著的基因对 (q值最小的max_edges条), 节点按环形排列; 每种倾向一条折线 (用None断开各条边)
+    edges = stats[stats['q-Value'] < q_threshold].head(max_edges)
+    genes = pd.unique(pd.concat([edges['Gene A'], edges['Gene B']]))
+    angles = 2 * np.pi * np.arange(len(genes)) / max(len(genes), 1)
+    position = {gene: (np.cos(angle), np.sin(angle)) for gene, angle in zip(genes, angles)}
+    fig = go.Figure()
+    for tendency, color in TENDENCY_COLORS.items():
+        selected = edges[edges['Tendency'] == tendency]
+        x, y = [], []
+        for gene_a, gene_b in zip(selected['Gene A'], selected['Gene B']):
+            x += [position[gene_a][0], position[gene_b][0], None]
+            y += [position[gene_a][1], position[gene_b][1], None]
+        fig.add_trace(go.Scatter(x=x, y=y, mode='lines', line=dict(width=1.5, color=color), name=tendency,
+                                 hoverinfo='skip'))
+    fig.add_trace(go.Scatter(x=[position[gene][0] for gene in genes], y=[position[gene][1] for gene in genes],
+                             mode='markers+text', text=[str(gene) for gene in genes], textposition='top center',
+                             marker=dict(size=10, color='#1f78b4'), hoverinfo='text', showlegend=False))
+    fig.update_layout(title=f'{title} ({len(edges)} pairs with q < {q_threshold:g})', hovermode='closest',
+                      xaxis=dict(visible=False), yaxis=dict(visible=False, scaleanchor='x'))
+    return fig
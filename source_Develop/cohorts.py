@@ -0,0 +1,164 @@
+import glob
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from discovery import TABLE_PATTERNS, is_clinical_file
+
+# 常驻队列的总内存上限 (字节), 可以通过环境变量 GENOVAI_COHORT_MEMORY_MB 修改
+DEFAULT_MEMORY_CAP = int(os.environ.get('GENOVAI_COHORT_MEMORY_MB', 4096)) * 2 ** 20
+# 检查数据文件是否变化的间隔 (秒), 可以通过环境变量 GENOVAI_RELOAD_INTERVAL 修改, 0表示不检查
+RELOAD_INTERVAL = float(os.environ.get('GENOVAI_RELOAD_INTERVAL', 2))
+
+
+def cohort_name(path):
+    # Cleaned_BRCA_Merged_Data_test.csv -> BRCA, TCGA.LUAD.mutect.<uuid>.somatic.maf.gz -> LUAD,
+    # cancer_type=LUAD -> LUAD, 其他情况使用文件名
+    base = os.path.basename(os.path.normpath(path))
+    match = re.match(r'Cleaned_([A-Za-z0-9-]+?)_Merged', base) or re.match(r'TCGA[._-]([A-Z0-9]+)[._-]', base)
+    if match:
+        return match.group(1)
+    if '=' in base:
+        return base.split('=', 1)[1]
+    return base.split('.')[0]
+
+
+def discover_cohorts(directory):
+    # dataset目录下的每个CSV/TSV/MAF文件或分区子目录是一个队列 (临床文件除外, 它们与同名队列配对)
+    cohorts = OrderedDict()
+    paths = [path for pattern in TABLE_PATTERNS for path in glob.glob(os.path.join(directory, pattern))
+             if not is_clinical_file(path)]
+    for path in sorted(paths + glob.glob(os.path.join(directory, '*', ''))):
+        cohorts.setdefault(cohort_name(path), os.path.normpath(path))
+    return cohorts
+
+
+# 队列管理器: 第一次使用时加载队列 (连同索引和聚合), 按最近使用顺序保留常驻队列,
+# 总内存超过上限时淘汰最久未使用的队列。常驻队列之间切换不需要重新加载。
+class CohortManager:
+
+    def __init__(self, paths, memory_cap=DEFAULT_MEMORY_CAP, clinical=None):
+        self.paths = OrderedDict(paths)
+        # 队列名称 -> 单独的临床文件
+        self.clinical = dict(clinical or {})
+        self.memory_cap = memory_cap
+        self.resident = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._writing = {}
+        self._pending = {}
+        self._failed = {}
+        self._watcher = None
+
+    def names(self):
+        return list(self.paths)
+
+    def get(self, name):
+        if name not in self.paths:
+            name = next(iter(self.paths))
+        with self._lock:
+            if name in self.resident:
+                self.resident.move_to_end(name)
+                return self.resident[name]
+            loading = self._loading.setdefault(name, threading.Lock())
+        # 同一队列只加载一次, 其他请求等待加载完成
+        with loading:
+            with self._lock:
+                if name in self.resident:
+                    self.resident.move_to_end(name)
+                    return self.resident[name]
+            # 加载数据的模块 (pandas) 在第一次加载队列时才导入, 不计入应用启动时间
+            from dataset import Dataset
+            dataset = Dataset(name, self.paths[name], self.clinical.get(name))
+            with self._lock:
+                self.resident[name] = dataset
+                self._evict(keep=name)
+                self._loading.pop(name, None)
+            return dataset
+
+    def append(self, name, batch):
+        # 追加一批新行到队列 (未加载时先加载), 返回新的版本号
+        return self._update(name, lambda dataset: dataset.append(batch)).version
+
+    def update_clinical(self, name, batch):
+        return self._update(name, lambda dataset: dataset.update_clinical(batch)).version
+
+    def load_columns(self, name, columns):
+        # 表格中加入的列: 读取到新快照上后替换, 返回替换后的快照
+        return self._update(name, lambda dataset: dataset.load_columns(columns))
+
+    def _update(self, name, change):
+        # 与reload_changed相同: 在新快照上更新后原子地替换, 正在执行的回调继续使用旧快照;
+        # 同一队列的写入依次进行, 每次都在上一次替换后的快照上更新
+        with self._lock:
+            writing = self._writing.setdefault(name, threading.Lock())
+        with writing:
+            dataset = self.get(name)
+            snapshot = change(dataset)
+            if snapshot is dataset:
+                return snapshot
+            with self._lock:
+                if self.resident.get(dataset.name) is dataset:
+                    self.resident[dataset.name] = snapshot
+                    self._evict(keep=dataset.name)
+                else:
+                    # 更新期间旧快照被淘汰或被重新加载替换: 丢弃, 下一次请求从文件重新加载 (包括这次写入的行)
+                    self.resident.pop(dataset.name, None)
+            return snapshot
+
+    def reload_changed(self):
+        # 常驻队列的数据文件被修改时, 在后台加载一个新的快照 (索引和聚合都预先建好), 然后原子地替换;
+        # 新的请求使用新快照, 正在执行的回调继续使用它们已经取得的旧快照
+        with self._lock:
+            resident = list(self.resident.items())
+        for name, dataset in resident:
+            with dataset._lock:
+                signature = dataset.current_signature()
+                changed = signature != dataset.signature
+            if not changed or self._failed.get(name) == signature:
+                self._pending.pop(name, None)
+                continue
+            # 连续两次检查文件状态相同 (写入已经完成) 才重新加载
+            if self._pending.get(name) != signature:
+                self._pending[name] = signature
+                continue
+            self._pending.pop(name, None)
+            from dataset import Dataset
+            try:
+                snapshot = Dataset(name, dataset.path, dataset.clinical_path)
+            except Exception as error:
+                # 同一个文件状态只尝试一次, 文件再次被修改时重试
+                print(f"Reloading cohort {name} failed, keeping the previous snapshot: {error}")
+                self._failed[name] = signature
+                continue
+            self._failed.pop(name, None)
+            snapshot.version = dataset.version + 1
+            with self._lock:
+                if self.resident.get(name) is dataset:
+                    self.resident[name] = snapshot
+                    self._evict(keep=name)
+
+    def watch(self, interval=RELOAD_INTERVAL):
+        # 启动检查数据文件的后台线程
+        if interval <= 0 or self._watcher is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.reload_changed()
+
+        self._watcher = threading.Thread(target=run, name='cohort-reload', daemon=True)
+        self._watcher.start()
+
+    def _evict(self, keep):
+        while len(self.resident) > 1 and self.memory_bytes() > self.memory_cap:
+            coldest = next(iter(self.resident))
+            if coldest == keep:
+                break
+            del self.resident[coldest]
+
+    def memory_bytes(self):
+        return sum(dataset.memory_bytes() for dataset in self.resident.values())
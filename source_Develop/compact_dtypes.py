@@ -0,0 +1,66 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 不同取值数不超过行数的这个比例时, 字符串列转换为分类类型 (每行只保存一个小整数编码)
+CATEGORY_RATIO = 0.5
+
+
+def compact_column(values):
+    # 低基数字符串 -> category, 整数 -> 最小的整数类型, 浮点数 -> float32 (不损失精度时)
+    if isinstance(values.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(values):
+        return values
+    if pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+        if values.nunique(dropna=True) <= len(values) * CATEGORY_RATIO:
+            return values.astype('category')
+        return values
+    if pd.api.types.is_integer_dtype(values):
+        return pd.to_numeric(values, downcast='integer')
+    if pd.api.types.is_float_dtype(values):
+        compact = values.astype(np.float32)
+        if np.array_equal(compact.to_numpy(dtype=np.float64), values.to_numpy(dtype=np.float64), equal_nan=True):
+            return compact
+    return values
+
+
+def compact_frame(frame):
+    # 加载后的类型压缩 (读取时已经只读了需要的列)
+    return pd.DataFrame({column: compact_column(frame[column]) for column in frame.columns}, index=frame.index)
+
+
+def memory_report(before, after):
+    # 每列压缩前后的类型和内存 (字节), 被删除的列压缩后为0, 最后一行为合计
+    before_bytes = before.memory_usage(deep=True, index=False)
+    after_bytes = after.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'dtype_after': after.dtypes.astype(str).reindex(before.columns).fillna('dropped'),
+        'bytes_before': before_bytes,
+        'bytes_after': after_bytes.reindex(before.columns).fillna(0).astype(np.int64),
+    })
+    report.loc['Total'] = ['', '', int(before_bytes.sum()), int(after_bytes.sum())]
+    report['ratio'] = (report['bytes_before'] / report['bytes_after'].replace(0, np.nan)).round(1)
+    return report
+
+
+def align_categories(frame, batch):
+    # 追加行之前让两边的分类列使用同一组类别, 合并后仍然是分类类型
+    frame, batch = frame.copy(deep=False), batch.copy()
+    for column in frame.columns:
+        if isinstance(frame[column].dtype, pd.CategoricalDtype) and column in batch.columns:
+            categories = frame[column].cat.categories
+            new_values = pd.Index(batch[column].dropna().unique()).difference(categories, sort=False)
+            if len(new_values):
+                # 类别保持有序, 表格按该列排序时与字符串排序一致
+                frame[column] = frame[column].cat.set_categories(categories.union(new_values))
+            batch[column] = pd.Categorical(batch[column], categories=frame[column].cat.categories)
+    return frame, batch
+
+
+if __name__ == '__main__':
+    # python compact_dtypes.py 数据文件.csv : 打印每列压缩前后的内存
+    original = pd.read_csv(sys.argv[1])
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_columns', None)
+    print(memory_report(original, compact_frame(original)))
@@ -0,0 +1,364 @@
+import copy
+import threading
+
+import numpy as np
+import pandas as pd
+
+from bitmap_index import BitmapIndex
+from clinical import PATIENT_KEY
+from compact_dtypes import align_categories
+from filter_state import FILTER_COLUMNS
+from range_index import POSITION_COLUMN, RANGE_OPERATORS, PositionIndex, RangeIndex, interval_from_conditions
+
+AGE_COLUMN = 'age_at_initial_pathologic_diagnosis'
+
+# 每个聚合对应的维度, 图表直接从这些计数矩阵生成
+AGGREGATIONS = {
+    'consequence': ('One_Consequence',),
+    'chromosome': ('Chromosome',),
+    'patient': ('bcr_patient_barcode',),
+    'gene_consequence': ('Hugo_Symbol', 'One_Consequence'),
+    'age': (AGE_COLUMN,),
+    'status_age': ('vital_status', AGE_COLUMN),
+    'gender_age': ('gender', AGE_COLUMN),
+    'consequence_status_age': ('One_Consequence', 'vital_status', AGE_COLUMN),
+}
+
+
+# DataTable filter_query中的操作符 (custom filter_action)
+TABLE_FILTER_OPERATORS = [['ge ', '>='], ['le ', '<='], ['lt ', '<'], ['gt ', '>'], ['ne ', '!='], ['eq ', '='],
+                          ['contains '], ['datestartswith ']]
+
+
+def split_filter_part(filter_part):
+    for operator_type in TABLE_FILTER_OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+                value_part = value_part.strip()
+                v0 = value_part[0] if value_part else ''
+                if v0 == value_part[-1:] and v0 in ("'", '"', '`'):
+                    value = value_part[1: -1].replace('\\' + v0, v0)
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+                # word operators need spaces after them in the filter string,
+                # but we don't want these later
+                return name, operator_type[0].strip(), value
+    return [None] * 3
+
+
+def parse_table_filter(filter_query):
+    # 将表格的filter_query拆成 (列名, 操作符, 值) 列表
+    if not filter_query:
+        return []
+    conditions = []
+    for filter_part in filter_query.split(' && '):
+        column, operator, value = split_filter_part(filter_part)
+        if column is not None:
+            conditions.append((column, operator, value))
+    return conditions
+
+
+def compare(values, operator, value):
+    # 对一列取值求表格过滤条件, 返回布尔数组
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # 分类列只在类别上求值, 再按编码取回每行的结果 (缺失值的编码-1对应最后的False)
+        matched = compare(pd.Series(np.asarray(values.cat.categories)), operator, value)
+        return np.append(matched, False)[values.cat.codes.to_numpy()]
+    if isinstance(value, float) and not pd.api.types.is_numeric_dtype(values):
+        value = str(int(value)) if value.is_integer() else str(value)
+    if operator == 'contains':
+        return values.astype(str).str.contains(str(value), regex=False).to_numpy(dtype=bool)
+    if operator == 'datestartswith':
+        return values.astype(str).str.startswith(str(value)).to_numpy(dtype=bool)
+    comparisons = {'eq': values.eq, 'ne': values.ne, 'ge': values.ge, 'le': values.le,
+                   'lt': values.lt, 'gt': values.gt}
+    try:
+        return comparisons[operator](value).fillna(False).to_numpy(dtype=bool)
+    except TypeError:
+        return np.zeros(len(values), dtype=bool)
+
+
+def merge_labels(labels, values):
+    # 把新取值并入有序的取值字典, 返回新字典和旧编码到新编码的映射 (包括最后的缺失值编码);
+    # 没有新取值时映射为None
+    new_values = pd.Index(pd.Series(values).dropna().unique()).difference(labels, sort=False)
+    if len(new_values) == 0:
+        return labels, None
+    merged = labels.append(new_values)
+    try:
+        merged = merged.sort_values()
+    except TypeError:
+        pass
+    remap = np.append(merged.get_indexer(labels), len(merged)).astype(np.int32)
+    return merged, remap
+
+
+# 交叉过滤器: 让所有图表背后的计数矩阵与当前行掩码保持同步
+# 每列在加载时编码一次, 每个维度最后一个编码留给缺失值; 掩码变化时只对进入/离开
+# 选择的行做加减, 一次小的交互只需要O(变化行数)的bincount
+class CrossFilter:
+
+    def __init__(self, frame, aggregations=AGGREGATIONS, labels=None, weights=None, clinical=None):
+        # labels: 预先确定的每列取值字典 (例如分区数据集的全局字典), 不在字典中的取值视为缺失
+        # clinical: 单独的临床表, 突变行通过病人编码取得临床列的编码, 不需要把临床列合并到每一行
+        self.frame = frame
+        self.n_rows = len(frame)
+        self.clinical = clinical
+        self.patient_rows = None if clinical is None else clinical.patient_rows(frame[PATIENT_KEY])
+        self.codes = {}
+        self.labels = {}
+        columns = set(FILTER_COLUMNS) | {column for dims in aggregations.values() for column in dims}
+        for column in columns:
+            if column not in frame.columns:
+                if clinical is None or column not in clinical.columns:
+                    continue
+                patient_codes, uniques = clinical.codes(column, labels.get(column) if labels else None)
+                codes = patient_codes[self.patient_rows]
+            elif labels is not None and column in labels:
+                uniques = pd.Index(labels[column])
+                codes = uniques.get_indexer(frame[column])
+            else:
+                codes, uniques = pd.factorize(frame[column], sort=True)
+                if isinstance(uniques, pd.Categorical):
+                    uniques = np.asarray(uniques)
+            codes = codes.astype(np.int32)
+            codes[codes < 0] = len(uniques)
+            self.codes[column] = codes
+            self.labels[column] = pd.Index(uniques)
+
+        self.aggregations = {}
+        self.shapes = {}
+        self.keys = {}
+        for name, dims in aggregations.items():
+            if not all(column in self.codes for column in dims):
+                continue
+            self.aggregations[name] = dims
+            shape = tuple(len(self.labels[column]) + 1 for column in dims)
+            keys = np.ravel_multi_index([self.codes[column] for column in dims], shape)
+            self.shapes[name] = shape
+            self.keys[name] = keys.astype(np.int32 if np.prod(shape) < 2 ** 31 else np.int64)
+
+        self.weights = None if weights is None else np.asarray(weights, dtype=float)
+        self._build_indexes()
+
+    def has_column(self, column):
+        return column in self.frame.columns or (self.clinical is not None and column in self.clinical.columns)
+
+    def values(self, column):
+        # 一列的逐行取值; 临床列按病人编码从临床表取
+        if column in self.frame.columns:
+            return self.frame[column]
+        return self.clinical.take(column, self.patient_rows)
+
+    def _build_indexes(self):
+        # 分类过滤列的位图索引, 过滤时只做按位与
+        self.bitmaps = BitmapIndex(self.codes, self.labels, self.n_rows, FILTER_COLUMNS)
+        # 年龄和基因组位置的有序数组索引, 区间过滤通过二分查找得到行id
+        self.ranges = {}
+        if self.has_column(AGE_COLUMN):
+            self.ranges[AGE_COLUMN] = RangeIndex(self.values(AGE_COLUMN))
+        self.positions = None
+        if POSITION_COLUMN in self.frame.columns and 'Chromosome' in self.frame.columns:
+            self.positions = PositionIndex(self.frame['Chromosome'], self.frame[POSITION_COLUMN])
+
+        self.mask = np.ones(self.n_rows, dtype=bool)
+        self.counts = {name: self._full_counts(name, self.mask) for name in self.keys}
+        self._lock = threading.Lock()
+
+    def subset(self, rows, weights=None):
+        # 在部分行上建立交叉过滤器 (例如抽样), 与原过滤器共享取值编码, 计数矩阵形状相同;
+        # weights为每行代表的原始行数, 计数按权重累加
+        subset = CrossFilter.__new__(CrossFilter)
+        subset.frame = self.frame.iloc[rows].reset_index(drop=True)
+        subset.n_rows = len(rows)
+        subset.clinical = self.clinical
+        subset.patient_rows = None if self.patient_rows is None else self.patient_rows[rows]
+        subset.codes = {column: codes[rows] for column, codes in self.codes.items()}
+        subset.labels = self.labels
+        subset.aggregations = self.aggregations
+        subset.shapes = self.shapes
+        subset.keys = {name: keys[rows] for name, keys in self.keys.items()}
+        subset.weights = None if weights is None else np.asarray(weights, dtype=float)
+        subset._build_indexes()
+        return subset
+
+    def with_frame(self, frame):
+        # 同样的行换一个数据框 (例如加入了按需读取的列), 返回新的交叉过滤器: 编码和索引共享,
+        # 增量计数的状态各自一份, 当前过滤器不变
+        with self._lock:
+            replaced = copy.copy(self)
+            replaced.mask, replaced.counts = self.mask.copy(), dict(self.counts)
+        replaced.frame = frame
+        replaced._lock = threading.Lock()
+        return replaced
+
+    def append(self, frame):
+        # 追加一批行, 返回新的交叉过滤器而不重建, 当前过滤器不变 (正在使用它的回调不受影响):
+        # 新取值并入有序字典并重映射已有编码, 计数矩阵按新字典重新排布, 位图/范围索引在副本上合并新行;
+        # 新行先不在掩码中, 下一次apply时作为进入选择的行增量计入
+        frame = frame.reindex(columns=self.frame.columns)
+        with self._lock:
+            mask, current = self.mask, dict(self.counts)
+        start = self.n_rows
+        labels, codes, remaps = dict(self.labels), {}, {}
+        new_patient_rows = None if self.clinical is None else self.clinical.patient_rows(frame[PATIENT_KEY])
+        for column, column_codes in self.codes.items():
+            if column not in frame.columns:
+                # 临床列: 新行的编码按病人编码从临床表取
+                patient_codes, _ = self.clinical.codes(column, labels[column])
+                codes[column] = np.concatenate([column_codes, patient_codes[new_patient_rows]])
+                continue
+            labels[column], remap = merge_labels(labels[column], frame[column])
+            if remap is not None:
+                remaps[column] = remap
+                column_codes = remap[column_codes]
+            new_codes = labels[column].get_indexer(frame[column]).astype(np.int32)
+            new_codes[new_codes < 0] = len(labels[column])
+            codes[column] = np.concatenate([column_codes, new_codes])
+
+        shapes, keys, counts = {}, {}, {}
+        for name, dims in self.aggregations.items():
+            shape = tuple(len(labels[column]) + 1 for column in dims)
+            dtype = np.int32 if np.prod(shape) < 2 ** 31 else np.int64
+            shapes[name] = shape
+            if shape == self.shapes[name]:
+                new_keys = np.ravel_multi_index([codes[column][start:] for column in dims], shape)
+                keys[name] = np.concatenate([self.keys[name], new_keys.astype(dtype)])
+                counts[name] = current[name]
+            else:
+                # 只有出现新取值的维度需要重映射, 计数矩阵按旧编码->新编码搬到新形状中
+                index = np.ix_(*[remaps.get(column, np.arange(size))
+                                 for column, size in zip(dims, self.shapes[name])])
+                keys[name] = np.ravel_multi_index([codes[column] for column in dims], shape).astype(dtype)
+                counts[name] = np.zeros(shape, dtype=current[name].dtype)
+                counts[name][index] = current[name]
+
+        appended = copy.copy(self)
+        previous, frame = align_categories(self.frame, frame)
+        appended.frame = pd.concat([previous, frame], ignore_index=True)
+        appended.n_rows = len(appended.frame)
+        appended.codes, appended.labels, appended.shapes, appended.keys = codes, labels, shapes, keys
+        appended.counts = counts
+        if self.weights is not None:
+            appended.weights = np.concatenate([self.weights, np.ones(len(frame))])
+        if self.patient_rows is not None:
+            appended.patient_rows = np.concatenate([self.patient_rows, new_patient_rows])
+        rows = np.arange(start, appended.n_rows)
+        appended.bitmaps = self.bitmaps.copy()
+        appended.bitmaps.append(codes, labels, appended.n_rows, remaps)
+        appended.ranges = {column: index.copy() for column, index in self.ranges.items()}
+        if AGE_COLUMN in appended.ranges:
+            ages = frame[AGE_COLUMN] if AGE_COLUMN in frame.columns else \
+                self.clinical.take(AGE_COLUMN, new_patient_rows)
+            appended.ranges[AGE_COLUMN].append(ages, rows)
+        if self.positions is not None:
+            appended.positions = self.positions.copy()
+            appended.positions.append(frame['Chromosome'], frame[POSITION_COLUMN], rows)
+        appended.mask = np.concatenate([mask, np.zeros(len(frame), dtype=bool)])
+        appended._lock = threading.Lock()
+        return appended
+
+    def _full_counts(self, name, mask):
+        return self._delta_counts(name, mask)
+
+    def _delta_counts(self, name, rows):
+        size = int(np.prod(self.shapes[name]))
+        weights = None if self.weights is None else self.weights[rows]
+        return np.bincount(self.keys[name][rows], weights=weights, minlength=size).reshape(self.shapes[name])
+
+    def bitmap_for(self, state):
+        # 过滤状态对应的位图: 分类列的条件在去重后的取值上求值, 再对取值位图按位或/与;
+        # 其他列的表格过滤条件在原始列上做向量化比较
+        state = state or {}
+        words = self.bitmaps.full()
+        intervals = {}
+        for column, operator, value in parse_table_filter(state.get('table_filter')):
+            if not self.has_column(column):
+                continue
+            if (column in self.ranges or (column == POSITION_COLUMN and self.positions is not None)) \
+                    and operator in RANGE_OPERATORS and isinstance(value, float):
+                # 同一列上的比较条件先合并成一个区间, 再通过范围索引查询
+                intervals.setdefault(column, []).append((operator, value))
+            elif column in self.bitmaps.labels:
+                labels = pd.Series(self.bitmaps.labels[column])
+                codes = np.flatnonzero(compare(labels, operator, value))
+                words &= self.bitmaps.bitmap_codes(column, codes)
+            else:
+                words &= self.bitmaps.from_mask(compare(self.values(column), operator, value))
+        for column, conditions in intervals.items():
+            interval = interval_from_conditions(conditions)
+            if column == POSITION_COLUMN:
+                words &= self.bitmaps.from_rows(self.positions.rows(None, *interval))
+            else:
+                words &= self.bitmaps.from_rows(self.ranges[column].rows(*interval))
+        if state.get('age_range') and AGE_COLUMN in self.ranges:
+            low, high = state['age_range']
+            words &= self.bitmaps.from_rows(self.ranges[AGE_COLUMN].rows(low, high))
+        if state.get('region') and self.positions is not None:
+            region = state['region']
+            words &= self.bitmaps.from_rows(self.positions.rows([region['chromosome']], region['start'],
+                                                                region['end']))
+        for column in FILTER_COLUMNS:
+            values = state.get(column) or []
+            if values and column in self.bitmaps.labels:
+                words &= self.bitmaps.bitmap(column, values)
+        return words
+
+    def mask_for(self, state):
+        return self.bitmaps.to_mask(self.bitmap_for(state))
+
+    # 将计数更新到新的掩码, 并返回计数的副本
+    def apply(self, mask):
+        with self._lock:
+            changed = np.flatnonzero(mask != self.mask)
+            if len(changed) * 2 > self.n_rows:
+                # 变化的行超过一半时直接全量重算更便宜
+                self.counts = {name: self._full_counts(name, mask) for name in self.keys}
+            elif len(changed) > 0:
+                entering = changed[mask[changed]]
+                leaving = changed[~mask[changed]]
+                for name in self.keys:
+                    self.counts[name] = (self.counts[name] + self._delta_counts(name, entering)
+                                         - self._delta_counts(name, leaving))
+            self.mask = mask.copy()
+            return {name: counts.copy() for name, counts in self.counts.items()}
+
+    def count(self, name, mask):
+        # 单个聚合在掩码下的计数, 不改变增量计数的状态
+        return self._delta_counts(name, np.flatnonzero(mask))
+
+    def series(self, counts, column):
+        # 一维计数转换为按列取值索引的Series (去掉缺失值)
+        return pd.Series(counts[:-1], index=self.labels[column])
+
+
+def quantiles_from_counts(values, counts, quantiles):
+    # 在取值-计数的直方图上按线性插值求分位数, 与逐行计算的结果一致
+    cumulative = np.cumsum(counts)
+    total = cumulative[-1]
+    results = []
+    for q in quantiles:
+        position = q * (total - 1)
+        low = np.searchsorted(cumulative, np.floor(position), side='right')
+        high = np.searchsorted(cumulative, np.ceil(position), side='right')
+        results.append(values[low] + (values[high] - values[low]) * (position - np.floor(position)))
+    return results
+
+
+def box_stats_from_counts(values, counts):
+    # 根据计数计算箱线图的统计量 (q1, median, q3, lowerfence, upperfence)
+    values = np.asarray(values, dtype=float)
+    counts = np.asarray(counts)
+    present = counts > 0
+    if not present.any():
+        return None
+    values, counts = values[present], counts[present]
+    q1, median, q3 = quantiles_from_counts(values, counts, [0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    return {'q1': q1, 'median': median, 'q3': q3, 'lowerfence': inside.min(), 'upperfence': inside.max()}
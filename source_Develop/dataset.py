@@ -0,0 +1,417 @@
+import copy
+import glob
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from chart_options import TABLE_COLUMNS
+from clinical import PATIENT_KEY, ClinicalTable, patient_barcodes
+from compact_dtypes import compact_frame, memory_report
+from cross_filter import AGE_COLUMN, AGGREGATIONS, FILTER_COLUMNS, CrossFilter, merge_labels
+from partitions import PARTITION_PATTERNS, STRATA_COLUMNS, PartitionedDataset, strata_keys
+from range_index import POSITION_COLUMN
+from readers import append_table, read_header, read_table, table_format
+from sampling import StratifiedReservoir
+
+# 近似模式: 按(突变类型, 生存状态)分层的蓄水池抽样, 每层最多保留的行数
+APPROXIMATE_SAMPLE_PER_STRATUM = 2000
+# 分区数据集扫描时为基因、病人、突变类型建立频繁项草图, 未过滤时直接给出Top N而不需要完整的计数表;
+# 内存中的队列总有精确计数, 不建立草图
+SKETCH_COLUMNS = ['Hugo_Symbol', 'bcr_patient_barcode', 'One_Consequence']
+# 每个队列最多缓存的过滤状态数 (每个过滤状态下缓存各个图表)
+FIGURE_CACHE_SIZE = 64
+
+
+def display_order(frame):
+    # 删除第一列并重新排列数据框列顺序，将与可视化相关的列放在前面显示
+    columns_to_display = ['Hugo_Symbol', 'One_Consequence', 'age_at_initial_pathologic_diagnosis', 'vital_status'] + \
+                         [col for col in frame.columns if
+                          col not in ['Unnamed: 0', 'Hugo_Symbol', 'One_Consequence',
+                                      'age_at_initial_pathologic_diagnosis',
+                                      'vital_status']]
+    return frame[[col for col in columns_to_display if col in frame.columns]]
+
+
+def projected_columns():
+    # 加载时读取的列: 图表聚合和过滤需要的列 + 表格默认显示的列
+    columns = set(FILTER_COLUMNS) | {AGE_COLUMN, POSITION_COLUMN}
+    columns |= {column for dims in AGGREGATIONS.values() for column in dims}
+    return columns | set(TABLE_COLUMNS)
+
+
+def conform(batch, frame):
+    # 新批次的列类型与已加载的数据一致 (例如JSON中的整数年龄 -> float64);
+    # 数值列中有不能转换为数字的取值时抛出ValueError (这批行不写入)
+    batch = batch.copy()
+    for column in batch.columns:
+        if column not in frame.columns or batch[column].dtype == frame[column].dtype \
+                or isinstance(frame[column].dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.is_numeric_dtype(frame[column]):
+            try:
+                batch[column] = pd.to_numeric(batch[column])
+            except (TypeError, ValueError):
+                raise ValueError(f'column {column} must be numeric') from None
+        try:
+            batch[column] = batch[column].astype(frame[column].dtype)
+        except (TypeError, ValueError):
+            # 例如整数列中有缺失值: 保留转换后的数值类型
+            pass
+    return batch
+
+
+def append_rows(path, batch, start):
+    # 按文件已有的列顺序追加到文件末尾; 第一列是保存时写出的行号时接着编号
+    header = read_header(path)
+    batch = batch.reindex(columns=header)
+    if header[0].startswith('Unnamed'):
+        batch[header[0]] = np.arange(start, start + len(batch))
+    append_table(path, batch)
+
+
+def code_strata(cross_filter, rows):
+    # 由编码得到与strata_keys相同的分层键, 只对出现的取值组合生成字符串
+    codes = [cross_filter.codes[column][rows] for column in STRATA_COLUMNS]
+    names = [np.append(cross_filter.labels[column].astype(str), 'nan') for column in STRATA_COLUMNS]
+    shape = tuple(len(labels) for labels in names)
+    keys, inverse = np.unique(np.ravel_multi_index(codes, shape), return_inverse=True)
+    first, second = np.unravel_index(keys, shape)
+    strata = np.array([f'{names[0][i]}\t{names[1][j]}' for i, j in zip(first, second)], dtype=object)
+    return strata[inverse.reshape(-1)]
+
+
+def with_patient_key(frame):
+    # MAF中只有样本条码, 病人条码 (与临床表的连接键) 由样本条码得到
+    if PATIENT_KEY not in frame.columns and 'Tumor_Sample_Barcode' in frame.columns:
+        frame = frame.assign(**{PATIENT_KEY: patient_barcodes(frame['Tumor_Sample_Barcode'])})
+    return frame
+
+
+def file_signature(path):
+    # 数据文件 (或分区目录下所有分片) 的修改时间和大小, 用来检测文件是否被改动
+    if path is None:
+        return ()
+    if os.path.isdir(path):
+        files = sorted(file for pattern in PARTITION_PATTERNS
+                       for file in glob.glob(os.path.join(path, '**', pattern), recursive=True))
+    else:
+        files = [path] if os.path.exists(path) else []
+    signature = []
+    for file in files:
+        try:
+            stat = os.stat(file)
+        except OSError:
+            continue
+        signature.append((file, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_nbytes(item) for item in value.values())
+    return 0
+
+
+# 一个队列 (例如一个TCGA项目) 的数据, 以及加载时预先建立的索引和聚合:
+# 交叉过滤的编码/计数、位图和范围索引、分层抽样、频繁项草图。
+# 新的突变批次通过append追加, 在新快照上增量更新所有结构并增加版本号。
+# 临床数据 (单独的临床文件, 或从合并文件中拆出) 每个病人只保存一行, 突变行通过病人编码关联。
+class Dataset:
+
+    def __init__(self, name, path, clinical_path=None):
+        self.name = name
+        self.path = path
+        self.clinical_path = clinical_path
+        self.version = 0
+        # 每次追加的 (版本号, 起始行, 结束行); 分区数据集没有全局行号, 起止为None
+        self.batches = []
+        self.figure_cache = OrderedDict()
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        self.partitioned = None
+        self.sample_filter = None
+        self.reservoir = None
+        self.sketches = {}
+        self._memory_bytes = None
+        self.memory_report = None
+        self.clinical = None
+        # 数据中所有可以显示的列 (包括还没有读取的列)
+        self.columns = []
+        # 在读取之前记录文件状态, 读取过程中文件再被修改时会再次触发重新加载
+        self.signature = self.current_signature()
+        if os.path.isdir(self.path):
+            # 分区数据集只在内存中保留分层抽样的行, 精确计数逐个分区计算后合并
+            self.partitioned = PartitionedDataset(self.path)
+            summary = self.partitioned.summarize(APPROXIMATE_SAMPLE_PER_STRATUM, SKETCH_COLUMNS)
+            # 抽样很小, 保留所有列
+            self.df = self._compact(display_order(summary['sample']))
+            self.cross_filter = CrossFilter(self.df, labels=summary['labels'], weights=summary['weights'])
+            self.sample_filter = self.cross_filter
+            self.reservoir = summary['reservoir']
+            self.sketches = summary['sketches']
+        elif os.path.exists(self.path):
+            header = read_header(self.path)
+            columns = projected_columns()
+            if PATIENT_KEY not in header:
+                columns.add('Tumor_Sample_Barcode')
+            frame = with_patient_key(read_table(self.path, columns))
+            header += [PATIENT_KEY] if PATIENT_KEY not in header and PATIENT_KEY in frame.columns else []
+            if self.clinical_path is not None and os.path.exists(self.clinical_path):
+                # 单独的临床文件优先, 突变文件中重复的临床列不再保留
+                self.clinical = ClinicalTable.read(self.clinical_path)
+                frame = frame.drop(columns=[column for column in self.clinical.columns if column in frame.columns])
+            else:
+                frame, self.clinical = ClinicalTable.split(frame)
+            self.df = self._compact(display_order(frame))
+            if self.clinical is not None:
+                header += [column for column in self.clinical.columns if column not in header]
+            self.columns = list(display_order(pd.DataFrame(columns=header)).columns)
+            # 加载时建立交叉过滤的编码和计数, 之后所有图表都从计数生成
+            self.cross_filter = CrossFilter(self.df, clinical=self.clinical)
+        else:
+            self.df = pd.DataFrame()
+            self.cross_filter = None
+
+        if self.cross_filter is None:
+            return
+        if not self.columns:
+            self.columns = list(self.df.columns)
+        if self.sample_filter is None:
+            self._build_sample()
+
+    def _build_sample(self):
+        self.reservoir = None
+        self.sample_filter = None
+        if all(column in self.cross_filter.codes for column in STRATA_COLUMNS):
+            rows = np.arange(len(self.df))
+            self.reservoir = StratifiedReservoir(APPROXIMATE_SAMPLE_PER_STRATUM)
+            self.reservoir.add(code_strata(self.cross_filter, rows), rows)
+            self.sample_filter = self.cross_filter.subset(*self.reservoir.sample())
+
+    def current_signature(self):
+        return file_signature(self.path) + file_signature(self.clinical_path)
+
+    def _compact(self, frame):
+        # 加载时压缩列类型 (低基数字符串 -> category, 数值向下转换) 并记录每列压缩前后的内存
+        compact = compact_frame(frame)
+        self.memory_report = memory_report(frame, compact)
+        total = self.memory_report.loc['Total']
+        print(f"Loaded cohort {self.name}: {total['bytes_before'] / 2 ** 20:.1f} MB -> "
+              f"{total['bytes_after'] / 2 ** 20:.1f} MB after dtype compaction")
+        return compact
+
+    @property
+    def empty(self):
+        return self.cross_filter is None or self.df.empty
+
+    def snapshot(self):
+        # 追加和更新临床数据都在新快照上进行, 正在使用当前快照的回调不受影响:
+        # 会被原地修改的结构 (抽样、草图、分区列表、图表缓存) 复制一份, 其他数组和数据框更新时整个替换, 可以共享
+        with self._lock:
+            snapshot = copy.copy(self)
+            snapshot._lock = threading.RLock()
+            snapshot.batches = list(self.batches)
+            snapshot.figure_cache = OrderedDict((key, dict(entry, figures=dict(entry['figures'])))
+                                                for key, entry in self.figure_cache.items())
+            snapshot.reservoir = copy.deepcopy(self.reservoir)
+            snapshot.sketches = copy.deepcopy(self.sketches)
+            if self.partitioned is not None:
+                snapshot.partitioned = copy.copy(self.partitioned)
+                snapshot.partitioned.partitions = list(self.partitioned.partitions)
+            return snapshot
+
+    def append(self, batch):
+        # 追加一批新的突变/临床行: 在新快照上增量更新编码、索引、计数、抽样和草图 (不重新解析已有数据),
+        # 都成功后才写入磁盘 (CSV末尾或新的分片); 批次有问题时抛出ValueError, 文件和当前快照都不变。
+        # 返回版本号加1的新快照
+        return self.snapshot()._append(batch)
+
+    def _conform(self, batch):
+        batch = conform(batch, self.df)
+        return batch if self.clinical is None else conform(batch, self.clinical.frame)
+
+    def _append(self, batch):
+        with self._lock:
+            clinical = None
+            if self.cross_filter is None and self.partitioned is None:
+                # 还没有数据文件: 写出第一批后直接加载, 加载失败时删除写出的文件
+                batch.to_csv(self.path, sep=table_format(self.path), index=False, compression='infer')
+                try:
+                    self._load()
+                except Exception:
+                    os.remove(self.path)
+                    raise
+                batch = batch.iloc[:0]
+            elif self.partitioned is not None:
+                batch = self._conform(batch)
+                # 分区数据集在内存中只有抽样: 新行加入蓄水池, 在新的抽样上重建 (很小的) 交叉过滤器
+                self.reservoir.add(strata_keys(batch), batch.reset_index(drop=True))
+                self.partitioned.bound_sample(self.reservoir)
+                sample, weights = self.reservoir.sample()
+                labels = {column: merge_labels(labels, batch[column])[0] if column in batch.columns else labels
+                          for column, labels in self.cross_filter.labels.items()}
+                self.df = compact_frame(display_order(sample))
+                self.cross_filter = CrossFilter(self.df, labels=labels, weights=weights)
+                self.sample_filter = self.cross_filter
+                self.partitioned.append(batch, f'ingest-{self.version + 1:06d}')
+            else:
+                batch = self._conform(with_patient_key(batch))
+                clinical = self._upsert_clinical(batch)
+                start = len(self.df)
+                self.cross_filter = self.cross_filter.append(batch)
+                self.df = self.cross_filter.frame
+                rows = np.arange(start, len(self.df))
+                if clinical is not None:
+                    # 已有病人的临床属性变了或有新的病人: 这些病人的所有突变行编码都要更新, 重建交叉过滤器
+                    self.clinical = clinical
+                    self.cross_filter = CrossFilter(self.df, clinical=clinical)
+                    self._build_sample()
+                elif self.reservoir is not None:
+                    self.reservoir.add(code_strata(self.cross_filter, rows), rows)
+                    self.sample_filter = self.cross_filter.subset(*self.reservoir.sample())
+                # 内存中的结构都建好后才写入文件
+                append_rows(self.path, batch, start)
+                if clinical is not None:
+                    self._write_clinical(clinical)
+            # 分区数据集的草图随新行更新 (内存中的队列没有草图)
+            for column, sketch in self.sketches.items():
+                if column in batch.columns:
+                    sketch.update(batch[column])
+            self.version += 1
+            if self.partitioned is not None or clinical is not None:
+                self.batches.append((self.version, None, None))
+            else:
+                self.batches.append((self.version, len(self.df) - len(batch), len(self.df)))
+            self._memory_bytes = None
+            # 自己写入的改动不需要重新加载
+            self.signature = self.current_signature()
+            return self
+
+    def update_clinical(self, batch):
+        # 新增或更新病人的临床记录 (每个病人一行), 突变数据不变; 有改动时返回新快照, 否则返回当前快照
+        # 从合并文件中拆出的临床表没有单独的文件可以写回, 只能通过append追加带临床列的行
+        if self.cross_filter is None or self.clinical is None or self.clinical_path is None:
+            raise ValueError(f'cohort {self.name} has no clinical file')
+        with self._lock:
+            clinical = self._upsert_clinical(self._conform(batch))
+        if clinical is None:
+            return self
+        return self.snapshot()._replace_clinical(clinical)
+
+    def _replace_clinical(self, clinical):
+        with self._lock:
+            self.clinical = clinical
+            self.cross_filter = CrossFilter(self.df, clinical=clinical)
+            self._build_sample()
+            self._write_clinical(clinical)
+            self.version += 1
+            self.batches.append((self.version, None, None))
+            self._memory_bytes = None
+            self.signature = self.current_signature()
+            return self
+
+    def _upsert_clinical(self, batch):
+        # 批次中带有临床列时返回更新后的临床表 (还不写入文件); 没有新病人也没有改动时返回None
+        if self.clinical is None or PATIENT_KEY not in batch.columns:
+            return None
+        columns = [column for column in self.clinical.columns if column in batch.columns]
+        if not columns or self.clinical.covers(batch[[PATIENT_KEY] + columns]):
+            return None
+        return self.clinical.upsert(batch[[PATIENT_KEY] + columns])
+
+    def _write_clinical(self, clinical):
+        if self.clinical_path is not None and os.path.exists(self.clinical_path):
+            # 临床文件很小, 整个重写 (先写临时文件再替换, 读取方不会看到写了一半的文件)
+            temporary = f'{self.clinical_path}.{os.getpid()}.tmp'
+            clinical.frame.to_csv(temporary, sep=table_format(self.clinical_path), index=False,
+                                  compression='gzip' if self.clinical_path.endswith('.gz') else None)
+            os.replace(temporary, self.clinical_path)
+
+    def join_clinical(self, frame, columns=None):
+        # 给一部分突变行 (表格的一页或需要排序的行) 加上临床列
+        if self.clinical is None:
+            return frame
+        return self.clinical.join(frame, columns)
+
+    def load_columns(self, columns):
+        # 表格中加入的列第一次显示时才从文件读取 (只读这些列), 返回带有这些列的新快照;
+        # 没有需要读取的列时返回当前快照。数据框整个替换, 正在使用当前快照的回调不受影响
+        with self._lock:
+            clinical = self.clinical.columns if self.clinical is not None else []
+            missing = [column for column in columns
+                       if column in self.columns and column not in self.df.columns and column not in clinical]
+            if not missing or self.partitioned is not None:
+                return self
+            extra = compact_frame(read_table(self.path, missing))
+            # 文件在读取期间被其他程序改写时行数对不上, 等待重新加载后的快照
+            if len(extra) != len(self.df):
+                return self
+            snapshot = self.snapshot()
+        snapshot.df = self.df.assign(**{column: extra[column].values for column in missing})
+        snapshot.cross_filter = self.cross_filter.with_frame(snapshot.df)
+        snapshot._memory_bytes = None
+        return snapshot
+
+    def shown_columns(self, columns):
+        # 已经读取 (或来自临床表) 可以在表格中显示的列
+        clinical = self.clinical.columns if self.clinical is not None else []
+        return [column for column in columns if column in self.df.columns or column in clinical]
+
+    def affected_since(self, version, filter_state):
+        # version之后追加的行中是否有满足过滤条件的行; 没有时该过滤状态下的图表不需要重新生成
+        starts = [start for batch_version, start, _ in self.batches if batch_version > version]
+        if not starts:
+            return False
+        if any(start is None for start in starts):
+            return True
+        return bool(self.cross_filter.mask_for(filter_state)[min(starts):].any())
+
+    def cached_figures(self, filter_key, filter_state):
+        # 返回该过滤状态下缓存的图表 {可视化: [(id, 图表)]}, 只有受影响时才失效
+        with self._lock:
+            entry = self.figure_cache.get(filter_key)
+            if entry is None:
+                return {}
+            if entry['version'] != self.version:
+                if self.affected_since(entry['version'], filter_state):
+                    del self.figure_cache[filter_key]
+                    return {}
+                entry['version'] = self.version
+            self.figure_cache.move_to_end(filter_key)
+            return dict(entry['figures'])
+
+    def store_figures(self, filter_key, version, vis, figures):
+        with self._lock:
+            entry = self.figure_cache.get(filter_key)
+            if entry is None or entry['version'] != version:
+                entry = self.figure_cache[filter_key] = {'version': version, 'figures': {}}
+            entry['figures'][vis] = figures
+            while len(self.figure_cache) > FIGURE_CACHE_SIZE:
+                self.figure_cache.popitem(last=False)
+
+    def exact_counts(self, filter_state):
+        if self.partitioned is not None:
+            return self.partitioned.aggregate_counts(filter_state, self.cross_filter.labels)
+        return self.cross_filter.apply(self.cross_filter.mask_for(filter_state))
+
+    def memory_bytes(self):
+        # 估计常驻内存: 数据框 + 交叉过滤/抽样中的编码和计数数组 (加载或追加后第一次调用时计算)
+        if self._memory_bytes is None:
+            self._memory_bytes = self._estimate_memory()
+        return self._memory_bytes
+
+    def _estimate_memory(self):
+        total = int(self.df.memory_usage(deep=True).sum())
+        if self.clinical is not None:
+            total += int(self.clinical.frame.memory_usage(deep=True).sum())
+        for cross_filter in {id(f): f for f in [self.cross_filter, self.sample_filter] if f is not None}.values():
+            total += _nbytes(cross_filter.codes) + _nbytes(cross_filter.keys) + _nbytes(cross_filter.counts)
+            total += _nbytes(cross_filter.bitmaps.row_ids) + _nbytes(cross_filter.bitmaps.dense)
+        return total
@@ -0,0 +1,26 @@
+import glob
+import os
+import re
+
+# 数据文件的发现和配对只用标准库: 应用启动时导入这个模块, 不需要导入pandas
+
+# 可以直接读取的表格文件: 合并后的CSV、GDC的MAF和临床TSV (都可以是gzip压缩的)
+TABLE_PATTERNS = ['*.csv', '*.tsv', '*.txt', '*.maf', '*.csv.gz', '*.tsv.gz', '*.txt.gz', '*.maf.gz']
+
+
+def is_clinical_file(path):
+    return 'clinical' in os.path.basename(path).lower()
+
+
+def clinical_cohort_name(path):
+    # clinical.BRCA.tsv / BRCA_clinical.tsv / nationwidechildrens.org_clinical_patient_brca.txt -> BRCA
+    base = os.path.basename(path)
+    match = re.search(r'clinical[._-](?:patient[._-])?([A-Za-z0-9]+)[._-]', base, re.IGNORECASE) or \
+        re.match(r'([A-Za-z0-9]+)[._-]clinical', base, re.IGNORECASE)
+    return match.group(1).upper() if match else base.split('.')[0]
+
+
+def discover_clinical(directory):
+    # dataset目录下的临床表, 按队列名称与突变文件配对
+    paths = sorted(path for pattern in TABLE_PATTERNS for path in glob.glob(os.path.join(directory, pattern)))
+    return {clinical_cohort_name(path): path for path in paths if is_clinical_file(path)}
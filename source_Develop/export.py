@@ -0,0 +1,127 @@
+import argparse
+import atexit
+import importlib.util
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import plotly.io as pio
+from plotly.io.json import to_json_plotly
+
+from chart_options import chart_ids
+from charts import chart_figures
+from cohorts import cohort_name
+from filter_state import empty_filter_state
+from dataset import Dataset
+
+# 无界面批量导出图表 (例如肿瘤委员会报告), 不需要启动网页应用:
+#   python export.py 数据文件或分区目录 [--vis age_dist ...] [--formats png svg pdf] [--out exports]
+# 图表在主进程中由计数生成, 渲染分给常驻的渲染进程; 每个进程启动一次Kaleido (Chrome),
+# 之后所有图片复用同一个渲染器, 不为每张图片重新启动
+
+# 渲染进程数, 可以通过环境变量 GENOVAI_EXPORT_PROCESSES 修改
+EXPORT_PROCESSES = int(os.environ.get('GENOVAI_EXPORT_PROCESSES', os.cpu_count() or 1))
+# 需要Kaleido的格式; html不需要渲染器 (浏览器中可交互)
+IMAGE_FORMATS = ['png', 'svg', 'pdf']
+EXPORT_FORMATS = IMAGE_FORMATS + ['html']
+
+
+def start_renderer():
+    # 渲染进程的初始化: Kaleido 1.x 启动常驻的同步渲染服务器, 进程退出时关闭;
+    # Kaleido 0.2 的渲染子进程本身就是常驻的, 第一次渲染时启动
+    import kaleido
+    if hasattr(kaleido, 'start_sync_server'):
+        kaleido.start_sync_server(silence_warnings=True)
+        atexit.register(kaleido.stop_sync_server, silence_warnings=True)
+
+
+def warm_up():
+    # 在每个渲染进程中渲染一张空图, 让渲染器在计时之前启动完成
+    pio.to_image({'data': [], 'layout': {}}, format='png', validate=False)
+    return os.getpid()
+
+
+def render_image(fig_json, path, image_format, width, height, scale):
+    # 在渲染进程中运行: 图表以JSON传入 (已经验证过, 不再验证), 返回写出的字节数
+    fig = json.loads(fig_json)
+    if image_format == 'html':
+        pio.write_html(fig, path, include_plotlyjs='cdn', validate=False)
+    else:
+        with open(path, 'wb') as file:
+            file.write(pio.to_image(fig, format=image_format, width=width, height=height, scale=scale,
+                                    validate=False))
+    return os.path.getsize(path)
+
+
+def build_figures(dataset, selected_vis, filter_state):
+    # 与网页中相同的图表: 一次计算过滤后的计数, 再生成每个可视化的图表
+    counts = dataset.exact_counts(filter_state)
+    figs = []
+    for vis in selected_vis:
+        figs += chart_figures(dataset, vis, counts, filter_state)
+    return figs
+
+
+def export_figures(figs, out_dir, formats, prefix='', processes=EXPORT_PROCESSES, width=None, height=None,
+                   scale=None):
+    # 把所有 (图表, 格式) 分给渲染进程并行渲染, 返回 (写出的文件, 渲染器启动时间, 渲染时间)
+    os.makedirs(out_dir, exist_ok=True)
+    needs_renderer = any(image_format in IMAGE_FORMATS for image_format in formats)
+    jobs = [(to_json_plotly(fig), os.path.join(out_dir, f'{prefix}{vis}.{image_format}'), image_format)
+            for vis, fig in figs for image_format in formats]
+    processes = max(1, min(processes, len(jobs)))
+    with ProcessPoolExecutor(max_workers=processes,
+                             initializer=start_renderer if needs_renderer else None) as pool:
+        start = time.perf_counter()
+        if needs_renderer:
+            list(pool.map(warm_up, range(processes)))
+        warm = time.perf_counter() - start
+        start = time.perf_counter()
+        futures = {pool.submit(render_image, fig_json, path, image_format, width, height, scale): path
+                   for fig_json, path, image_format in jobs}
+        written = []
+        for future in as_completed(futures):
+            written.append((futures[future], future.result()))
+            print(f'  {futures[future]} ({written[-1][1] / 1024:.0f} KB)')
+        elapsed = time.perf_counter() - start
+    return sorted(written), warm, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export dashboard charts as static images.')
+    parser.add_argument('path', help='mutation CSV/TSV/MAF file or partitioned dataset directory')
+    parser.add_argument('--clinical', help='clinical table for the cohort')
+    parser.add_argument('--vis', nargs='+', choices=chart_ids, default=chart_ids, metavar='VIS',
+                        help=f"visualization ids (default: all of {', '.join(chart_ids)})")
+    parser.add_argument('--formats', nargs='+', choices=EXPORT_FORMATS, default=['png'])
+    parser.add_argument('--filter', default='{}',
+                        help='filter state as JSON, e.g. \'{"Hugo_Symbol": ["TP53"], "vital_status": ["Dead"]}\'')
+    parser.add_argument('--out', default='exports')
+    parser.add_argument('--processes', type=int, default=EXPORT_PROCESSES)
+    parser.add_argument('--width', type=int)
+    parser.add_argument('--height', type=int)
+    parser.add_argument('--scale', type=float)
+    args = parser.parse_args(argv)
+
+    if any(image_format in IMAGE_FORMATS for image_format in args.formats) \
+            and importlib.util.find_spec('kaleido') is None:
+        sys.exit('PNG/SVG/PDF export needs Kaleido: pip install kaleido (and plotly_get_chrome for Kaleido 1.x)')
+
+    start = time.perf_counter()
+    dataset = Dataset(cohort_name(args.path), args.path, args.clinical)
+    filter_state = dict(empty_filter_state(), **json.loads(args.filter))
+    figs = build_figures(dataset, args.vis, filter_state)
+    print(f'Built {len(figs)} figures for {dataset.name} in {time.perf_counter() - start:.2f} s')
+
+    written, warm, elapsed = export_figures(figs, args.out, args.formats, prefix=f'{dataset.name}_',
+                                            processes=args.processes, width=args.width, height=args.height,
+                                            scale=args.scale)
+    processes = max(1, min(args.processes, len(written)))
+    print(f'Renderers started in {warm:.2f} s ({processes} processes)')
+    print(f'Rendered {len(written)} images in {elapsed:.2f} s: {len(written) / elapsed:.1f} images/s')
+
+
+if __name__ == '__main__':
+    main()
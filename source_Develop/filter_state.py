@@ -0,0 +1,31 @@
+# 共享过滤状态的结构和解析只用标准库: 应用启动时 (页面布局) 导入这个模块, 不需要导入pandas
+
+# 可以被图表点击、下拉框或表格过滤的分类列
+FILTER_COLUMNS = ['Hugo_Symbol', 'One_Consequence', 'Chromosome', 'bcr_patient_barcode', 'vital_status', 'gender']
+
+
+def empty_filter_state():
+    # 共享过滤状态: 表格的filter_query + 年龄区间 + 基因组区域 + 每个分类列选中的取值
+    state = {'table_filter': '', 'age_range': None, 'region': None}
+    for column in FILTER_COLUMNS:
+        state[column] = []
+    return state
+
+
+def is_empty_filter(state):
+    # 过滤状态中没有任何生效的条件
+    if not state:
+        return True
+    return not any(state.get(key) for key in ['table_filter', 'age_range', 'region'] + FILTER_COLUMNS)
+
+
+def parse_region(text):
+    # 解析 "chr17:7000000-7700000" 形式的基因组区域, 格式不对时返回None
+    if not text or ':' not in text:
+        return None
+    chromosome, _, span = text.strip().partition(':')
+    start, _, end = span.replace(',', '').partition('-')
+    try:
+        return {'chromosome': chromosome, 'start': float(start), 'end': float(end or start)}
+    except ValueError:
+        return None
@@ -0,0 +1,193 @@
+import re
+import weakref
+
+import numpy as np
+import plotly.graph_objs as go
+from dash import Patch
+
+# 基因组密度图在可见范围内的分箱数, 缩放后只对可见范围重新分箱, 分辨率随之提高
+DENSITY_BINS = 2000
+# 病人突变负荷图在可见范围内最多绘制的点数, 超过时按等间隔取点 (负荷已排序, 曲线形状不变)
+BURDEN_POINTS = 4000
+# 交替使用的染色体颜色 (manhattan图风格)
+CHROMOSOME_COLORS = ['#1f77b4', '#9ecae1']
+
+# 每个交叉过滤器的基因组坐标轴 (追加行后行数变化时重建)
+_axes = weakref.WeakKeyDictionary()
+
+
+def chromosome_key(chromosome):
+    # chr1..chr22, chrX, chrY, chrM 的自然顺序, 其他名称排在最后
+    name = re.sub(r'^chr', '', str(chromosome), flags=re.IGNORECASE).upper()
+    if name.isdigit():
+        return 0, int(name), ''
+    order = {'X': 1, 'Y': 2, 'M': 3, 'MT': 3}
+    return (1, order[name], '') if name in order else (2, 0, name)
+
+
+# 全基因组坐标轴: 各条染色体按自然顺序首尾相接 (长度取数据中的最大位置),
+# 所有突变按全基因组坐标排序并保存行id, 任意可见范围通过二分查找切出对应的行
+class GenomeAxis:
+
+    def __init__(self, positions):
+        self.chromosomes = sorted(positions.chromosomes, key=chromosome_key)
+        lengths = [positions.chromosomes[chromosome].values[-1] + 1 if len(positions.chromosomes[chromosome].values)
+                   else 1 for chromosome in self.chromosomes]
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
+        self.coordinates = np.concatenate([positions.chromosomes[chromosome].values + offset
+                                           for chromosome, offset in zip(self.chromosomes, self.offsets)])
+        self.row_ids = np.concatenate([positions.chromosomes[chromosome].row_ids for chromosome in self.chromosomes])
+
+    @property
+    def length(self):
+        return self.offsets[-1]
+
+    def locate(self, coordinates):
+        # 全基因组坐标 -> (染色体序号, 染色体内位置)
+        index = np.clip(np.searchsorted(self.offsets, coordinates, side='right') - 1, 0, len(self.chromosomes) - 1)
+        return index, coordinates - self.offsets[index]
+
+
+def genome_axis(cross_filter):
+    if cross_filter.positions is None:
+        return None
+    cached = _axes.get(cross_filter)
+    if cached is None or cached[0] != cross_filter.n_rows:
+        cached = _axes[cross_filter] = (cross_filter.n_rows, GenomeAxis(cross_filter.positions))
+    return cached[1]
+
+
+def visible_range(x_range, low, high):
+    # 缩放范围与数据范围取交集, x_range为None时为全部范围
+    if x_range is None:
+        return low, high
+    return max(low, float(x_range[0])), min(high, float(x_range[1]))
+
+
+def density_bins(cross_filter, mask, x_range=None, bins=DENSITY_BINS):
+    # 可见范围内满足过滤条件的突变按全基因组坐标分箱计数, 只返回非空的箱 (中心, 计数, 箱宽)
+    axis = genome_axis(cross_filter)
+    low, high = visible_range(x_range, 0, axis.length)
+    if high <= low:
+        return np.zeros(0), np.zeros(0), 0
+    start, stop = np.searchsorted(axis.coordinates, [low, high])
+    rows = axis.row_ids[start:stop]
+    selected = mask[rows]
+    coordinates = axis.coordinates[start:stop][selected]
+    width = (high - low) / bins
+    index = np.minimum(((coordinates - low) / width).astype(np.int64), bins - 1)
+    weights = None if cross_filter.weights is None else cross_filter.weights[rows[selected]]
+    counts = np.bincount(index, weights=weights, minlength=bins)
+    nonzero = np.flatnonzero(counts)
+    return low + (nonzero + 0.5) * width, counts[nonzero], width
+
+
+def density_traces(cross_filter, mask, x_range=None):
+    # 棒棒糖图的数据: 每个箱一条竖线和一个点, 颜色按染色体交替
+    axis = genome_axis(cross_filter)
+    centers, counts, width = density_bins(cross_filter, mask, x_range)
+    chromosome_index, positions = axis.locate(centers)
+    names = np.asarray(axis.chromosomes, dtype=object)[chromosome_index]
+    hover = [f'{name}:{int(position - width / 2):,}-{int(position + width / 2):,}<br>{count:,.0f} mutations'
+             for name, position, count in zip(names, positions, counts)]
+    # 所有竖线放在一条折线里, 用NaN断开
+    stems_x = np.repeat(centers, 3)
+    stems_x[2::3] = np.nan
+    stems_y = np.column_stack([np.zeros(len(counts)), counts, np.full(len(counts), np.nan)]).ravel()
+    return {'stems': {'x': stems_x, 'y': stems_y},
+            'points': {'x': centers, 'y': counts, 'text': hover, 'marker.color': chromosome_index % 2},
+            'xaxis.title.text': f'Genomic position ({width:,.0f} bp bins)'}
+
+
+def density_figure(cross_filter, mask, title='Genome-wide Mutation Density'):
+    # 全基因组范围的棒棒糖图, 用WebGL绘制
+    axis = genome_axis(cross_filter)
+    traces = density_traces(cross_filter, mask)
+    points = traces['points']
+    fig = go.Figure([
+        go.Scattergl(**traces['stems'], mode='lines', line=dict(width=1, color='#bbbbbb'),
+                     hoverinfo='skip', showlegend=False),
+        go.Scattergl(x=points['x'], y=points['y'], text=points['text'], mode='markers', hoverinfo='text',
+                     showlegend=False,
+                     marker=dict(size=5, color=points['marker.color'], cmin=0, cmax=1,
+                                 colorscale=[[0, CHROMOSOME_COLORS[0]], [1, CHROMOSOME_COLORS[1]]])),
+    ])
+    middles = (axis.offsets[:-1] + axis.offsets[1:]) / 2
+    fig.update_layout(title=title, yaxis_title='Mutations per bin', uirevision='genome_density',
+                      xaxis=dict(title=traces['xaxis.title.text'], tickvals=middles,
+                                 ticktext=[str(name).replace('chr', '') for name in axis.chromosomes]))
+    return fig
+
+
+def density_patch(cross_filter, mask, x_range):
+    # 缩放后只发送可见范围重新分箱的数据, 不替换整个图表
+    traces = density_traces(cross_filter, mask, x_range)
+    return figure_patch([traces['stems'], traces['points']], {'xaxis.title.text': traces['xaxis.title.text']})
+
+
+def patient_burden(cross_filter, mask):
+    # 满足过滤条件的突变按病人计数, 从高到低排序 (所有病人, 不只是Top 10)
+    codes = cross_filter.codes['bcr_patient_barcode'][mask]
+    weights = None if cross_filter.weights is None else cross_filter.weights[mask]
+    labels = cross_filter.labels['bcr_patient_barcode']
+    counts = np.bincount(codes, weights=weights, minlength=len(labels) + 1)[:-1]
+    order = np.argsort(-counts, kind='stable')
+    order = order[counts[order] > 0]
+    return labels[order], counts[order]
+
+
+def burden_trace(patients, counts, x_range=None):
+    # 按负荷排序的所有病人; 可见范围内点数过多时等间隔取点, 缩放后在可见范围内重新取点
+    low, high = visible_range(x_range, 0, len(counts) - 1)
+    start, stop = max(0, int(np.floor(low))), min(len(counts), int(np.ceil(high)) + 1)
+    ranks = np.arange(start, stop)
+    if len(ranks) > BURDEN_POINTS:
+        ranks = np.unique(np.linspace(start, stop - 1, BURDEN_POINTS).astype(np.int64))
+    hover = [f'{patients[i]}<br>rank {i + 1:,}<br>{counts[i]:,.0f} mutations' for i in ranks]
+    # customdata为病人条码, 点击点时按病人过滤
+    return {'x': ranks, 'y': counts[ranks], 'text': hover, 'customdata': np.asarray(patients[ranks])}
+
+
+def burden_figure(patients, counts, title='Mutation Burden across All Patients'):
+    fig = go.Figure(go.Scattergl(**burden_trace(patients, counts), mode='markers+lines', hoverinfo='text',
+                                 marker=dict(size=4), line=dict(width=1)))
+    fig.update_layout(title=title, xaxis_title=f'Patients ranked by mutation count ({len(counts):,} patients)',
+                      yaxis_title='Mutation Count', yaxis_type='log', uirevision='patient_burden')
+    return fig
+
+
+def burden_patch(patients, counts, x_range):
+    return figure_patch([burden_trace(patients, counts, x_range)])
+
+
+def figure_patch(traces, layout=None):
+    # 部分更新: 只替换各个trace的数据数组 (和少量布局属性), 坐标轴范围等保持客户端当前的状态;
+    # 属性名中的点表示嵌套属性, 例如 'marker.color'
+    patch = Patch()
+    for i, trace in enumerate(traces):
+        for name, value in trace.items():
+            target = patch['data'][i]
+            *parents, leaf = name.split('.')
+            for parent in parents:
+                target = target[parent]
+            target[leaf] = value
+    for name, value in (layout or {}).items():
+        target = patch['layout']
+        *parents, leaf = name.split('.')
+        for parent in parents:
+            target = target[parent]
+        target[leaf] = value
+    return patch
+
+
+def relayout_range(relayout_data, axis='xaxis'):
+    # 从relayoutData中取出x轴的缩放范围; 恢复自动范围时返回None, 与x轴无关的事件返回False
+    if not relayout_data:
+        return False
+    if relayout_data.get(f'{axis}.autorange'):
+        return None
+    if f'{axis}.range[0]' in relayout_data and f'{axis}.range[1]' in relayout_data:
+        return relayout_data[f'{axis}.range[0]'], relayout_data[f'{axis}.range[1]']
+    if f'{axis}.range' in relayout_data:
+        return tuple(relayout_data[f'{axis}.range'])
+    return False
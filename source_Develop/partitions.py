@@ -0,0 +1,190 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from cross_filter import AGGREGATIONS, AGE_COLUMN, FILTER_COLUMNS, CrossFilter, parse_table_filter
+from range_index import POSITION_COLUMN
+from readers import TABLE_PATTERNS, iter_table, read_header
+from sampling import StratifiedReservoir
+from sketches import HeavyHitters
+
+# 默认内存预算 (字节), 可以通过环境变量 GENOVAI_MEMORY_BUDGET_MB 修改
+DEFAULT_MEMORY_BUDGET = int(os.environ.get('GENOVAI_MEMORY_BUDGET_MB', 512)) * 2 ** 20
+# 常驻内存的分层抽样最多占用内存预算的这一部分, 其余留给扫描时读取的数据块
+SAMPLE_BUDGET_SHARE = 0.25
+PARTITION_PATTERNS = ['*.parquet'] + TABLE_PATTERNS
+# 分层抽样使用的列
+STRATA_COLUMNS = ['One_Consequence', 'vital_status']
+
+
+def strata_keys(frame):
+    # 分层抽样的分层键: "突变类型\t生存状态"
+    return (frame[STRATA_COLUMNS[0]].astype(str) + '\t' + frame[STRATA_COLUMNS[1]].astype(str)).to_numpy()
+
+
+def partition_keys(directory, path):
+    # 从Hive风格的目录名 (例如 cancer_type=BRCA/Chromosome=chr17/part-0.parquet) 中解析分区键
+    keys = {}
+    for part in os.path.relpath(os.path.dirname(path), directory).split(os.sep):
+        if '=' in part:
+            key, value = part.split('=', 1)
+            keys[key] = value
+    return keys
+
+
+# 分区数据集: 一个目录下按癌症类型或染色体划分的Parquet/CSV分片, 总大小可以超过内存。
+# 每次扫描只读取需要的分区和列, 按内存预算分块读取, 聚合结果逐个分区计算后再合并。
+class PartitionedDataset:
+
+    def __init__(self, directory, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.partitions = []
+        for pattern in PARTITION_PATTERNS:
+            for path in glob.glob(os.path.join(directory, '**', pattern), recursive=True):
+                self.partitions.append((path, partition_keys(directory, path)))
+        self.partitions.sort()
+        self.columns = self._read_columns()
+        self._chunk_rows = None
+        self._row_bytes = None
+
+    def _read_columns(self):
+        columns = []
+        for path, keys in self.partitions:
+            if path.endswith('.parquet'):
+                names = next(self._read(path, None, 5)).columns.tolist()
+            else:
+                names = read_header(path)
+            for column in names + list(keys):
+                if column not in columns:
+                    columns.append(column)
+        return columns
+
+    def _read(self, path, columns, chunk_rows):
+        # 按块读取一个分片中的指定列
+        if path.endswith('.parquet'):
+            try:
+                import pyarrow.parquet as pq
+            except ImportError:
+                frame = pd.read_parquet(path, columns=columns)
+                for start in range(0, len(frame), chunk_rows):
+                    yield frame.iloc[start:start + chunk_rows]
+                return
+            parquet_file = pq.ParquetFile(path)
+            available = parquet_file.schema_arrow.names
+            if columns is not None:
+                columns = [column for column in columns if column in available]
+            for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+                yield batch.to_pandas()
+            return
+        # CSV/TSV/MAF按显式的列类型读取, 不同块的分类列类型一致 (例如染色体 1 和 X)
+        yield from iter_table(path, columns, chunk_rows)
+
+    def chunk_rows(self, columns):
+        # 根据前几千行的内存占用估计每行大小, 让一个块 (加上聚合时的中间结果) 不超过内存预算中
+        # 留给扫描的部分 (其余留给分层抽样)
+        if self._chunk_rows is None:
+            if not self.partitions:
+                self._chunk_rows = 100_000
+            else:
+                probe = next(self._read(self.partitions[0][0], columns, 5000))
+                self._row_bytes = max(1, probe.memory_usage(deep=True).sum() / max(1, len(probe)))
+                scan_budget = self.memory_budget * (1 - SAMPLE_BUDGET_SHARE)
+                self._chunk_rows = max(1000, int(scan_budget / (4 * self._row_bytes)))
+        return self._chunk_rows
+
+    def bound_sample(self, reservoir):
+        # 分层抽样保存的是行内容, 总行数超过内存预算中留给抽样的部分时减小每层的容量
+        if self._row_bytes is None:
+            return
+        max_rows = int(self.memory_budget * SAMPLE_BUDGET_SHARE / self._row_bytes)
+        if reservoir.n_rows() > max_rows:
+            capacity = max(1, max_rows // max(1, len(reservoir.reservoirs)))
+            if capacity < reservoir.capacity:
+                print(f"Sample reduced to {capacity:,} rows per stratum to fit the memory budget")
+            reservoir.shrink(capacity)
+
+    def _pruned(self, keys, filter_state):
+        # 分区键上的过滤条件不满足时整个分区跳过
+        for key, value in keys.items():
+            selected = (filter_state or {}).get(key) or []
+            if selected and value not in [str(v) for v in selected]:
+                return True
+        return False
+
+    def scan(self, columns, filter_state=None):
+        # 依次返回满足分区过滤条件的数据块, 只包含需要的列
+        columns = [column for column in columns if column in self.columns]
+        chunk_rows = self.chunk_rows(columns)
+        for path, keys in self.partitions:
+            if self._pruned(keys, filter_state):
+                continue
+            for chunk in self._read(path, columns, chunk_rows):
+                for key, value in keys.items():
+                    if key in columns and key not in chunk.columns:
+                        chunk[key] = value
+                yield chunk
+
+    def required_columns(self, filter_state=None):
+        # 图表和过滤需要的列
+        columns = set(FILTER_COLUMNS) | {column for dims in AGGREGATIONS.values() for column in dims}
+        columns |= {AGE_COLUMN, POSITION_COLUMN}
+        columns |= {column for column, _, _ in parse_table_filter((filter_state or {}).get('table_filter'))}
+        return [column for column in self.columns if column in columns]
+
+    def summarize(self, sample_capacity, sketch_columns, sketch_capacity=256, sample_columns=None):
+        # 扫描一遍所有分区: 收集每列的全局取值字典、频繁项草图和分层抽样
+        columns = sample_columns or self.columns
+        columns = list(dict.fromkeys(list(columns) + self.required_columns()))
+        label_columns = set(FILTER_COLUMNS) | {column for dims in AGGREGATIONS.values() for column in dims}
+        uniques = {column: set() for column in label_columns if column in self.columns}
+        sketches = {column: HeavyHitters(sketch_capacity) for column in sketch_columns if column in self.columns}
+        reservoir = StratifiedReservoir(sample_capacity)
+        n_rows = 0
+        for chunk in self.scan(columns):
+            n_rows += len(chunk)
+            for column, values in uniques.items():
+                values.update(chunk[column].dropna().unique().tolist())
+            for column, sketch in sketches.items():
+                sketch.merge(HeavyHitters(sketch_capacity).update(chunk[column]))
+            reservoir.add(strata_keys(chunk), chunk.reset_index(drop=True))
+            self.bound_sample(reservoir)
+        labels = {column: pd.Index(sorted(values)) for column, values in uniques.items()}
+        sample, weights = reservoir.sample()
+        if isinstance(sample, np.ndarray):
+            sample = pd.DataFrame(columns=columns)
+        return {'labels': labels, 'sketches': sketches, 'sample': sample, 'weights': weights, 'n_rows': n_rows,
+                'reservoir': reservoir}
+
+    def append(self, batch, name):
+        # 新的一批行写成新的分片: 按已有的分区键放到对应的分区目录下, 不改写已有分片
+        key_columns = []
+        for _, keys in self.partitions:
+            key_columns += [key for key in keys if key not in key_columns]
+        key_columns = [key for key in key_columns if key in batch.columns]
+        groups = batch.groupby(key_columns, dropna=False, sort=False) if key_columns else [((), batch)]
+        for values, group in groups:
+            values = values if isinstance(values, tuple) else (values,)
+            keys = {key: str(value) for key, value in zip(key_columns, values)}
+            directory = os.path.join(self.directory, *[f'{key}={value}' for key, value in keys.items()])
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'{name}.csv')
+            group.drop(columns=key_columns).to_csv(path, index=False)
+            self.partitions.append((path, keys))
+        self.partitions.sort()
+        self.columns += [column for column in batch.columns if column not in self.columns]
+
+    def aggregate_counts(self, filter_state, labels):
+        # 按分区逐块计算过滤后的计数矩阵并相加, 结果与内存中的CrossFilter计数形状相同;
+        # 所有分区都被过滤掉时返回同样形状的零计数
+        columns = self.required_columns(filter_state)
+        empty = CrossFilter(pd.DataFrame({column: pd.Series(dtype=object) for column in columns}), labels=labels)
+        totals = empty.apply(empty.mask)
+        for chunk in self.scan(columns, filter_state):
+            chunk_filter = CrossFilter(chunk.reset_index(drop=True), labels=labels)
+            counts = chunk_filter.apply(chunk_filter.mask_for(filter_state))
+            for name in totals:
+                totals[name] = totals[name] + counts[name]
+        return totals
@@ -0,0 +1,137 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from plotly.io.json import to_json_plotly
+
+from chart_options import chart_ids
+from charts import chart_figures
+from cohorts import cohort_name
+from filter_state import empty_filter_state
+from dataset import Dataset, file_signature
+
+# 离线预计算 (例如每晚的队列快照):
+#   python precompute.py 数据文件或分区目录 [--clinical 临床文件] [--out dataset/precomputed]
+# 加载数据集, 计算没有过滤条件时的所有聚合并生成所有图表, 写成一个压缩的产物 (<队列>.npz):
+# 聚合计数数组 + 图表JSON + 元数据。网页应用启动时读取产物直接显示初始图表, 不需要先读取原始CSV;
+# 数据文件的修改时间或大小变化后产物失效, 应用回到正常的计算路径
+
+# 预计算时生成图表的进程数, 可以通过环境变量 GENOVAI_PRECOMPUTE_PROCESSES 修改
+PRECOMPUTE_PROCESSES = int(os.environ.get('GENOVAI_PRECOMPUTE_PROCESSES', os.cpu_count() or 1))
+ARTIFACT_VERSION = 2
+
+# fork出的图表进程继承主进程中已经加载的数据集和计数
+_dataset = None
+_counts = None
+
+
+def source_signature(path, clinical_path=None):
+    # 数据文件和临床文件的 (修改时间, 大小); 不含路径, 产物移动到其他位置后仍然可以比较
+    return [[mtime, size] for _, mtime, size in file_signature(path) + file_signature(clinical_path)]
+
+
+def _chart_json(vis):
+    return [(chart_id, to_json_plotly(fig)) for chart_id, fig in
+            chart_figures(_dataset, vis, _counts, empty_filter_state())]
+
+
+def precompute(path, clinical_path=None, processes=PRECOMPUTE_PROCESSES):
+    # 返回 (元数据, 计数数组, 图表JSON {图表id: JSON})
+    global _dataset, _counts
+    signature = source_signature(path, clinical_path)
+    _dataset = Dataset(cohort_name(path), path, clinical_path)
+    _counts = _dataset.exact_counts(empty_filter_state())
+    # 各个可视化的图表在多个进程中并行生成 (只在支持fork的平台上, 其他平台依次生成)
+    if processes > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('fork')) as pool:
+            results = list(pool.map(_chart_json, chart_ids))
+    else:
+        results = [_chart_json(vis) for vis in chart_ids]
+    figures = {chart_id: fig_json for result in results for chart_id, fig_json in result}
+    meta = {
+        'artifact_version': ARTIFACT_VERSION,
+        'name': _dataset.name,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'signature': signature,
+        'rows': len(_dataset.df),
+        'columns': list(_dataset.columns),
+        'charts': {vis: [chart_id for chart_id, _ in result] for vis, result in zip(chart_ids, results)},
+        'labels': {column: labels.tolist() for column, labels in _dataset.cross_filter.labels.items()},
+    }
+    return meta, _counts, figures
+
+
+def write_artifact(out_path, meta, counts, figures):
+    # 数组用npz压缩保存, 元数据和图表JSON以UTF-8字节数组保存 (读取时不需要pickle)
+    arrays = {f'counts/{key}': np.asarray(value) for key, value in counts.items()}
+    arrays['meta'] = np.frombuffer(to_json_plotly(meta).encode(), dtype=np.uint8)
+    arrays['figures'] = np.frombuffer(json.dumps(figures).encode(), dtype=np.uint8)
+    tmp_path = out_path + '.tmp.npz'
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, out_path)
+
+
+# 预计算的队列: 没有过滤条件时的图表和聚合计数, 以及生成时数据文件的签名
+class PrecomputedCohort:
+
+    def __init__(self, path):
+        self.path = path
+        with np.load(path) as artifact:
+            self.meta = json.loads(artifact['meta'].tobytes())
+            figures = json.loads(artifact['figures'].tobytes())
+            self.counts = {key.split('/', 1)[1]: artifact[key] for key in artifact.files if key.startswith('counts/')}
+        self.name = self.meta['name']
+        self.columns = self.meta['columns']
+        self.charts = self.meta['charts']
+        self.figures = {chart_id: json.loads(fig_json) for chart_id, fig_json in figures.items()}
+
+    def valid_for(self, path, clinical_path=None):
+        # 数据文件 (和临床文件) 自生成以来没有变化
+        return self.meta.get('artifact_version') == ARTIFACT_VERSION and \
+            self.meta['signature'] == source_signature(path, clinical_path)
+
+    def chart_figures(self, selected_vis):
+        # [(图表id, 图表字典)], 有可视化不在产物中时返回None
+        if any(vis not in self.charts for vis in selected_vis):
+            return None
+        return [(chart_id, self.figures[chart_id]) for vis in selected_vis for chart_id in self.charts[vis]]
+
+
+def load_precomputed(directory):
+    # 目录下的所有产物, 按队列名称; 读取失败的产物被跳过
+    cohorts = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.npz'))):
+        try:
+            cohort = PrecomputedCohort(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f'Skipping precomputed artifact {path}: {e}')
+            continue
+        cohorts[cohort.name] = cohort
+    return cohorts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute dashboard aggregates and figures for a cohort.')
+    parser.add_argument('path', help='mutation CSV/TSV/MAF file or partitioned dataset directory')
+    parser.add_argument('--clinical', help='clinical table for the cohort')
+    parser.add_argument('--out', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dataset',
+                                                      'precomputed'))
+    parser.add_argument('--processes', type=int, default=PRECOMPUTE_PROCESSES)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    meta, counts, figures = precompute(args.path, args.clinical, args.processes)
+    os.makedirs(args.out, exist_ok=True)
+    out_path = os.path.join(args.out, f"{meta['name']}.npz")
+    write_artifact(out_path, meta, counts, figures)
+    print(f"Precomputed {meta['name']}: {meta['rows']:,} rows, {len(figures)} figures in "
+          f"{time.perf_counter() - start:.2f} s -> {out_path} ({os.path.getsize(out_path) / 2 ** 20:.2f} MB)")
+
+
+if __name__ == '__main__':
+    main()
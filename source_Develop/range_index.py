@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+POSITION_COLUMN = 'Start_Position'
+
+# 可以由范围索引回答的表格过滤操作符
+RANGE_OPERATORS = ('ge', 'gt', 'le', 'lt', 'eq')
+
+
+def interval_from_conditions(conditions):
+    # 将同一列上的多个比较条件合并为一个区间 (low, high, low_inclusive, high_inclusive)
+    low, high = -np.inf, np.inf
+    low_inclusive = high_inclusive = True
+    for operator, value in conditions:
+        if operator in ('ge', 'gt', 'eq') and (value > low or (value == low and operator == 'gt')):
+            low, low_inclusive = value, operator != 'gt'
+        if operator in ('le', 'lt', 'eq') and (value < high or (value == high and operator == 'lt')):
+            high, high_inclusive = value, operator != 'lt'
+    return low, high, low_inclusive, high_inclusive
+
+
+# 数值列的有序数组索引: 取值排序后保存对应的行id, 区间查询通过二分查找得到行id的一段连续区间
+class RangeIndex:
+
+    def __init__(self, values, row_ids=None):
+        values = np.asarray(values, dtype=float)
+        row_ids = np.arange(len(values)) if row_ids is None else np.asarray(row_ids)
+        valid = ~np.isnan(values)
+        order = np.argsort(values[valid], kind='stable')
+        self.values = values[valid][order]
+        self.row_ids = row_ids[valid][order].astype(np.int64)
+
+    def copy(self):
+        index = RangeIndex.__new__(RangeIndex)
+        index.values, index.row_ids = self.values, self.row_ids
+        return index
+
+    def append(self, values, row_ids):
+        # 新行的取值排序后通过二分查找插入到有序数组中 (相同取值的新行排在已有行之后)
+        values = np.asarray(values, dtype=float)
+        row_ids = np.asarray(row_ids)
+        valid = ~np.isnan(values)
+        order = np.argsort(values[valid], kind='stable')
+        values, row_ids = values[valid][order], row_ids[valid][order].astype(np.int64)
+        positions = np.searchsorted(self.values, values, side='right')
+        self.values = np.insert(self.values, positions, values)
+        self.row_ids = np.insert(self.row_ids, positions, row_ids)
+
+    def span(self, low=-np.inf, high=np.inf, low_inclusive=True, high_inclusive=True):
+        start = np.searchsorted(self.values, low, side='left' if low_inclusive else 'right')
+        stop = np.searchsorted(self.values, high, side='right' if high_inclusive else 'left')
+        return start, max(start, stop)
+
+    def rows(self, low=-np.inf, high=np.inf, low_inclusive=True, high_inclusive=True):
+        start, stop = self.span(low, high, low_inclusive, high_inclusive)
+        return self.row_ids[start:stop]
+
+    def count(self, low=-np.inf, high=np.inf, low_inclusive=True, high_inclusive=True):
+        start, stop = self.span(low, high, low_inclusive, high_inclusive)
+        return stop - start
+
+
+# 基因组位置索引: 每条染色体一个有序数组索引
+class PositionIndex:
+
+    def __init__(self, chromosomes, positions):
+        codes, labels = pd.factorize(pd.Series(chromosomes), sort=True)
+        positions = np.asarray(positions, dtype=float)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+        self.chromosomes = {}
+        for i, chromosome in enumerate(labels):
+            rows = order[bounds[i]:bounds[i + 1]]
+            self.chromosomes[chromosome] = RangeIndex(positions[rows], rows)
+
+    def copy(self):
+        index = PositionIndex.__new__(PositionIndex)
+        index.chromosomes = {chromosome: ranges.copy() for chromosome, ranges in self.chromosomes.items()}
+        return index
+
+    def append(self, chromosomes, positions, row_ids):
+        codes, labels = pd.factorize(pd.Series(chromosomes), sort=True)
+        positions = np.asarray(positions, dtype=float)
+        row_ids = np.asarray(row_ids)
+        for i, chromosome in enumerate(labels):
+            rows = codes == i
+            if chromosome in self.chromosomes:
+                self.chromosomes[chromosome].append(positions[rows], row_ids[rows])
+            else:
+                self.chromosomes[chromosome] = RangeIndex(positions[rows], row_ids[rows])
+
+    def rows(self, chromosomes=None, low=-np.inf, high=np.inf, low_inclusive=True, high_inclusive=True):
+        # chromosomes为None时查询所有染色体
+        if chromosomes is None:
+            chromosomes = list(self.chromosomes)
+        spans = [self.chromosomes[chromosome].rows(low, high, low_inclusive, high_inclusive)
+                 for chromosome in chromosomes if chromosome in self.chromosomes]
+        return np.concatenate(spans) if spans else np.zeros(0, dtype=np.int64)
+
+    def count(self, chromosomes=None, low=-np.inf, high=np.inf, low_inclusive=True, high_inclusive=True):
+        if chromosomes is None:
+            chromosomes = list(self.chromosomes)
+        return sum(self.chromosomes[chromosome].count(low, high, low_inclusive, high_inclusive)
+                   for chromosome in chromosomes if chromosome in self.chromosomes)
@@ -0,0 +1,188 @@
+import csv
+import glob
+import gzip
+import os
+import sys
+import time
+
+import pandas as pd
+
+from discovery import TABLE_PATTERNS
+
+# 多线程解析时每个块的字节数
+BLOCK_SIZE = 16 * 2 ** 20
+# GDC/TCGA文件中表示缺失的取值
+NULL_VALUES = ['', 'NA', 'NaN', 'nan', 'null', 'NULL', '--', "'--", '[Not Available]', '[Not Applicable]',
+               '[Unknown]', '[Not Evaluated]', '[Discrepancy]']
+
+# 已知列的类型: 低基数的字符串直接读成字典编码 (pandas中为category), 其他列按类型解析,
+# 不在这里的列由解析器推断
+SCHEMA = {
+    'Hugo_Symbol': 'category',
+    'Chromosome': 'category',
+    'Start_Position': 'int64',
+    'End_Position': 'int64',
+    'Strand': 'category',
+    'Variant_Classification': 'category',
+    'Variant_Type': 'category',
+    'One_Consequence': 'category',
+    'Consequence': 'category',
+    'Reference_Allele': 'string',
+    'Tumor_Seq_Allele1': 'string',
+    'Tumor_Seq_Allele2': 'string',
+    'Tumor_Sample_Barcode': 'category',
+    'Matched_Norm_Sample_Barcode': 'category',
+    'HGVSp_Short': 'string',
+    'IMPACT': 'category',
+    't_depth': 'int64',
+    't_ref_count': 'int64',
+    't_alt_count': 'int64',
+    'bcr_patient_barcode': 'category',
+    'age_at_initial_pathologic_diagnosis': 'float64',
+    'vital_status': 'category',
+    'gender': 'category',
+    'days_to_death': 'float64',
+    'days_to_last_followup': 'float64',
+}
+
+
+def table_format(path):
+    # 根据扩展名判断分隔符: CSV用逗号, MAF/TSV/TXT用制表符
+    name = path[:-3] if path.endswith('.gz') else path
+    return ',' if name.endswith('.csv') else '\t'
+
+
+def _open_text(path):
+    return gzip.open(path, 'rt') if path.endswith('.gz') else open(path)
+
+
+def comment_lines(path):
+    # MAF文件开头的 "#version 2.4" 等注释行数
+    count = 0
+    with _open_text(path) as handle:
+        for line in handle:
+            if not line.startswith('#'):
+                break
+            count += 1
+    return count
+
+
+def read_header(path):
+    # 只读取表头 (跳过注释行); 没有名字的列与pandas一样命名为 "Unnamed: i"
+    separator = table_format(path)
+    with _open_text(path) as handle:
+        for line in handle:
+            if not line.startswith('#'):
+                names = next(csv.reader([line.rstrip('\r\n')], delimiter=separator))
+                return [name or f'Unnamed: {i}' for i, name in enumerate(names)]
+    return []
+
+
+def _pyarrow_types(columns):
+    import pyarrow as pa
+    types = {'category': pa.dictionary(pa.int32(), pa.string()), 'string': pa.string(),
+             'int64': pa.int64(), 'float64': pa.float64()}
+    return {column: types[SCHEMA[column]] for column in columns if column in SCHEMA}
+
+
+def _pandas_types(columns):
+    # 整数列可能有缺失值, 交给pandas推断 (有缺失时为float64)
+    types = {'category': 'category', 'string': 'str', 'float64': 'float64'}
+    return {column: types[SCHEMA[column]] for column in columns if SCHEMA.get(column) in types}
+
+
+def _sorted_categories(frame):
+    # 字典编码的类别按出现顺序排列, 统一排好序, 表格按该列排序时与字符串排序一致
+    for column in frame.columns:
+        if not isinstance(frame[column].dtype, pd.CategoricalDtype):
+            continue
+        categories = frame[column].cat.categories
+        if not categories.is_monotonic_increasing:
+            frame[column] = frame[column].cat.reorder_categories(categories.sort_values())
+    return frame
+
+
+def _options(path, columns):
+    header = read_header(path)
+    if columns is not None:
+        columns = [column for column in header if column in set(columns)]
+    return header, columns, table_format(path), comment_lines(path)
+
+
+def _pandas_options(header, columns, separator, skip):
+    return dict(sep=separator, skiprows=skip, usecols=columns, dtype=_pandas_types(columns or header),
+                na_values=NULL_VALUES, quoting=csv.QUOTE_MINIMAL if separator == ',' else csv.QUOTE_NONE)
+
+
+def _pyarrow_options(header, columns, separator, skip):
+    import pyarrow.csv as pacsv
+    # MAF/TSV中的字段不加引号, 只有CSV按引号解析
+    return dict(read_options=pacsv.ReadOptions(skip_rows=skip, use_threads=True, block_size=BLOCK_SIZE),
+                parse_options=pacsv.ParseOptions(delimiter=separator, quote_char='"' if separator == ',' else False),
+                convert_options=pacsv.ConvertOptions(column_types=_pyarrow_types(columns or header),
+                                                     include_columns=columns, null_values=NULL_VALUES,
+                                                     strings_can_be_null=True))
+
+
+def read_table(path, columns=None):
+    # 读取CSV/TSV/MAF (可以是gzip压缩的) 中的指定列; 有pyarrow时用多线程的pyarrow CSV解析器,
+    # 否则退回pandas的C解析器
+    options = _options(path, columns)
+    try:
+        import pyarrow.csv as pacsv
+    except ImportError:
+        return _sorted_categories(pd.read_csv(path, low_memory=False, **_pandas_options(*options)))
+    return _sorted_categories(pacsv.read_csv(path, **_pyarrow_options(*options)).to_pandas())
+
+
+def iter_table(path, columns=None, chunk_rows=100_000):
+    # 按块读取, 每块大约chunk_rows行 (分区数据集在内存预算内扫描大文件时使用)
+    options = _options(path, columns)
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        yield from pd.read_csv(path, chunksize=chunk_rows, **_pandas_options(*options))
+        return
+    batches, rows = [], 0
+    for batch in pacsv.open_csv(path, **_pyarrow_options(*options)):
+        batches.append(batch)
+        rows += batch.num_rows
+        if rows >= chunk_rows:
+            yield pa.Table.from_batches(batches).to_pandas()
+            batches, rows = [], 0
+    if batches:
+        yield pa.Table.from_batches(batches).to_pandas()
+
+
+def append_table(path, batch):
+    # 追加到文件末尾, 分隔符与文件一致; gzip文件追加一个新的gzip成员
+    batch.to_csv(path, sep=table_format(path), mode='a', header=False, index=False, compression='infer')
+
+
+def benchmark(path, repeat=3):
+    # 与原来的 pd.read_csv(path) 比较读取时间
+    size = os.path.getsize(path) / 2 ** 20
+    results = {}
+    for name, read in [('pandas.read_csv', lambda: pd.read_csv(path, sep=table_format(path),
+                                                                 skiprows=comment_lines(path), low_memory=False)),
+                       ('read_table', lambda: read_table(path))]:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            frame = read()
+            best = min(best, time.perf_counter() - start)
+        results[name] = best
+        print(f"{name:16s} {len(frame):>10,} rows  {best:7.2f} s  {size / best:7.1f} MB/s  "
+              f"{frame.memory_usage(deep=True).sum() / 2 ** 20:8.1f} MB in memory")
+    print(f"speedup: {results['pandas.read_csv'] / results['read_table']:.1f}x")
+
+
+if __name__ == '__main__':
+    # python readers.py 文件或目录 ... : 比较pandas.read_csv和read_table的读取速度
+    for argument in sys.argv[1:]:
+        paths = [argument] if os.path.isfile(argument) else sorted(
+            path for pattern in TABLE_PATTERNS for path in glob.glob(os.path.join(argument, pattern)))
+        for path in paths:
+            print(path)
+            benchmark(path)
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+# 近似模式下误差界使用的置信水平
+CONFIDENCE = 0.95
+
+
+def _concat(parts):
+    if isinstance(parts[0], pd.DataFrame):
+        return pd.concat(parts, ignore_index=True)
+    return np.concatenate(parts)
+
+
+def _take(rows, positions):
+    if isinstance(rows, pd.DataFrame):
+        return rows.iloc[positions]
+    return rows[positions]
+
+
+# 分层蓄水池抽样
+# 每一行分配一个均匀随机键, 每个分层只保留随机键最小的capacity行, 这等价于对每个分层分别做
+# 蓄水池抽样; 数据可以分批加入, 不同分区的抽样结果也可以合并。
+# 保存的行可以是行id数组, 也可以是DataFrame (分区数据集没有全局行id时直接保存行内容)。
+class StratifiedReservoir:
+
+    def __init__(self, capacity, seed=0):
+        self.capacity = capacity
+        self.rng = np.random.default_rng(seed)
+        self.reservoirs = {}
+        self.totals = {}
+
+    def _keep(self, stratum, random_keys, rows):
+        if stratum in self.reservoirs:
+            old_keys, old_rows = self.reservoirs[stratum]
+            random_keys = np.concatenate([old_keys, random_keys])
+            rows = _concat([old_rows, rows])
+        if len(random_keys) > self.capacity:
+            keep = np.argpartition(random_keys, self.capacity - 1)[:self.capacity]
+            random_keys, rows = random_keys[keep], _take(rows, keep)
+        self.reservoirs[stratum] = (random_keys, rows)
+
+    def add(self, strata, rows):
+        strata = np.asarray(strata)
+        if not isinstance(rows, pd.DataFrame):
+            rows = np.asarray(rows, dtype=np.int64)
+        random_keys = self.rng.random(len(rows))
+        order = np.argsort(strata, kind='stable')
+        values, starts, counts = np.unique(strata[order], return_index=True, return_counts=True)
+        for stratum, start, count in zip(values.tolist(), starts, counts):
+            group = order[start:start + count]
+            self.totals[stratum] = self.totals.get(stratum, 0) + int(count)
+            self._keep(stratum, random_keys[group], _take(rows, group))
+
+    def merge(self, other):
+        for stratum, (random_keys, rows) in other.reservoirs.items():
+            self.totals[stratum] = self.totals.get(stratum, 0) + other.totals[stratum]
+            self._keep(stratum, random_keys, rows)
+        return self
+
+    def n_rows(self):
+        return sum(len(random_keys) for random_keys, _ in self.reservoirs.values())
+
+    def shrink(self, capacity):
+        # 减小每层的容量: 每层只保留随机键最小的capacity行, 仍然是各层的均匀抽样
+        self.capacity = capacity
+        for stratum, (random_keys, rows) in self.reservoirs.items():
+            if len(random_keys) > capacity:
+                keep = np.argpartition(random_keys, capacity - 1)[:capacity]
+                self.reservoirs[stratum] = (random_keys[keep], _take(rows, keep))
+
+    def sample(self):
+        # 返回抽样的行 (行id时按升序) 和每行的权重 (分层总行数 / 分层抽样行数)
+        if not self.reservoirs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        rows, weights = [], []
+        for stratum, (_, stratum_rows) in self.reservoirs.items():
+            rows.append(stratum_rows)
+            weights.append(np.full(len(stratum_rows), self.totals[stratum] / len(stratum_rows)))
+        rows, weights = _concat(rows), np.concatenate(weights)
+        if isinstance(rows, pd.DataFrame):
+            return rows, weights
+        order = np.argsort(rows)
+        return rows[order], weights[order]
+
+
+def dkw_bound(n_rows, confidence=CONFIDENCE):
+    # Dvoretzky-Kiefer-Wolfowitz界: 抽样得到的经验分布函数与真实分布函数之差
+    # 以confidence的概率不超过该值, 同时约束直方图比例和分位数的秩误差
+    if n_rows <= 0:
+        return 1.0
+    return float(np.sqrt(np.log(2 / (1 - confidence)) / (2 * n_rows)))
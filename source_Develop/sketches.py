@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+# 加载/追加数据时每批处理的行数
+SKETCH_CHUNK_ROWS = 100_000
+
+
+# Space-Saving频繁项摘要: 最多保留capacity个计数器, 每个计数是真实次数的上界, error为可能多计的次数。
+# 两个摘要可以合并 (不在某个摘要里的项按该摘要的最小计数计), 所以分批加载和分区计算都可以合并结果。
+class SpaceSaving:
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+    def floor(self):
+        # 摘要已满时, 未被记录的项的真实次数不超过最小计数
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def _merge(self, counts, errors, floor):
+        own_floor = self.floor()
+        merged_counts, merged_errors = {}, {}
+        for item in set(self.counts) | set(counts):
+            merged_counts[item] = self.counts.get(item, own_floor) + counts.get(item, floor)
+            merged_errors[item] = self.errors.get(item, own_floor) + errors.get(item, floor)
+        keep = sorted(merged_counts, key=merged_counts.get, reverse=True)[:self.capacity]
+        self.counts = {item: merged_counts[item] for item in keep}
+        self.errors = {item: merged_errors[item] for item in keep}
+
+    def update(self, values):
+        values = pd.Series(values)
+        for start in range(0, len(values), SKETCH_CHUNK_ROWS):
+            chunk = values.iloc[start:start + SKETCH_CHUNK_ROWS].value_counts()
+            # 分类列的value_counts包含没有出现的类别
+            chunk = chunk[chunk > 0]
+            # 每批只取最频繁的capacity项加入摘要, 其余项的次数作为该批的下限误差
+            floor = int(chunk.iloc[self.capacity]) if len(chunk) > self.capacity else 0
+            chunk = chunk.head(self.capacity)
+            self._merge({item: int(count) for item, count in chunk.items()}, {}, floor)
+        return self
+
+    def merge(self, other):
+        self._merge(other.counts, other.errors, other.floor())
+        return self
+
+    def top(self, n):
+        items = sorted(self.counts, key=self.counts.get, reverse=True)[:n]
+        return pd.Series([self.counts[item] for item in items], index=items, dtype='int64')
+
+
+# Count-Min草图: depth行width列的计数表, 点查询取各行的最小值, 结果是真实次数的上界
+class CountMin:
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    def _buckets(self, values):
+        values = pd.Series(values).astype(str).to_numpy(dtype=object)
+        return [pd.util.hash_array(values, hash_key=f'countmin{row:08d}') % self.width
+                for row in range(self.depth)]
+
+    def update(self, values):
+        for row, buckets in enumerate(self._buckets(values)):
+            self.table[row] += np.bincount(buckets.astype(np.int64), minlength=self.width)
+        return self
+
+    def merge(self, other):
+        self.table += other.table
+        return self
+
+    def estimate(self, values):
+        estimates = [self.table[row][buckets.astype(np.int64)] for row, buckets in enumerate(self._buckets(values))]
+        return np.min(estimates, axis=0)
+
+
+# 频繁项草图: Space-Saving给出候选项, Count-Min收紧候选项的计数上界
+class HeavyHitters:
+
+    def __init__(self, capacity=256, width=2048, depth=4):
+        self.space_saving = SpaceSaving(capacity)
+        self.count_min = CountMin(width, depth)
+
+    def update(self, values):
+        values = pd.Series(values).dropna()
+        self.space_saving.update(values)
+        self.count_min.update(values)
+        return self
+
+    def merge(self, other):
+        self.space_saving.merge(other.space_saving)
+        self.count_min.merge(other.count_min)
+        return self
+
+    def certain(self, n):
+        # Top N能否由摘要确定: 前n项计数的下界 (count - error) 都不小于第n+1项计数的上界
+        counts, errors = self.space_saving.counts, self.space_saving.errors
+        items = sorted(counts, key=counts.get, reverse=True)
+        if len(items) <= n:
+            return self.space_saving.floor() == 0
+        return min(counts[item] - errors[item] for item in items[:n]) >= counts[items[n]]
+
+    def top(self, n):
+        candidates = self.space_saving.top(self.space_saving.capacity)
+        if candidates.empty:
+            return candidates
+        estimates = np.minimum(candidates.to_numpy(), self.count_min.estimate(candidates.index))
+        counts = pd.Series(estimates, index=candidates.index)
+        return counts.sort_values(ascending=False, kind='stable').head(n)
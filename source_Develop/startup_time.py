@@ -0,0 +1,58 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+# 启动时间预算 (秒): 从开始导入应用模块到Dash应用可以开始服务;
+# 较慢的机器上可以通过环境变量 GENOVAI_STARTUP_BUDGET 放宽
+STARTUP_BUDGET = float(os.environ.get('GENOVAI_STARTUP_BUDGET', 1.0))
+# 在子进程中运行应用脚本 (不启动服务器), 打印经过的时间; -X importtime 把每个模块的导入时间写到stderr
+_PROBE = '''
+import runpy, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {directory!r})
+runpy.run_path({path!r}, run_name='startup_time')
+print('STARTUP', time.perf_counter() - start)
+'''
+_IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def measure(path):
+    # 返回 (启动秒数, {顶层包: 自身导入秒数}); 第一次导入的模块才计入 (与实际启动相同)
+    path = os.path.abspath(path)
+    directory = os.path.dirname(path)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', _PROBE.format(directory=directory, path=path)],
+                            cwd=directory, capture_output=True, text=True)
+    startup = [line for line in result.stdout.splitlines() if line.startswith('STARTUP ')]
+    if result.returncode != 0 or not startup:
+        raise RuntimeError(f'{path} failed to start:\n{result.stderr[-2000:]}')
+    packages = defaultdict(float)
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            packages[match.group(4).split('.')[0]] += int(match.group(1)) / 1e6
+    return float(startup[-1].split()[1]), dict(packages)
+
+
+def report(path, top=15, budget=STARTUP_BUDGET):
+    startup, packages = measure(path)
+    print(f'{os.path.basename(path)}: started in {startup:.2f} s (budget {budget:.2f} s, '
+          f"{'ok' if startup <= budget else 'over budget'})")
+    for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f'  {package:30s} {seconds * 1000:8.1f} ms')
+    print(f"  {'(all imports)':30s} {sum(packages.values()) * 1000:8.1f} ms")
+    return startup <= budget
+
+
+if __name__ == '__main__':
+    # python startup_time.py [应用脚本 ...] : 测量启动时间和每个依赖包的导入时间, 超出预算时返回非零状态
+    parser = argparse.ArgumentParser(description='Measure app start-up time and import time per dependency.')
+    parser.add_argument('paths', nargs='*', default=[os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                  'updated_app.py')])
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET)
+    args = parser.parse_args()
+    within_budget = [report(path, args.top, args.budget) for path in args.paths]
+    sys.exit(0 if all(within_budget) else 1)
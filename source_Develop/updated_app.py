@@ -1,10 +1,23 @@
-import pandas as pd
 import dash
 from dash import dcc, html, dash_table
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output, State
-import plotly.express as px
+from dash.dependencies import Input, Output, State, ALL, MATCH, ClientsideFunction
+import hashlib
+import io
+import json
 import os
+import threading
+import time
+import uuid
+from flask import request, jsonify
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from filter_state import FILTER_COLUMNS, empty_filter_state, is_empty_filter, parse_region
+# 加载数据、生成图表、共现统计和读取预计算产物的模块 (pandas) 在回调第一次使用时才导入, 不计入应用启动时间
+from chart_options import (MAX_TOP_GENES, NETWORK_Q_THRESHOLD, STATS_COLUMNS, TABLE_COLUMNS, TOP_GENES,
+                           visualization_options)
+from cohorts import CohortManager, discover_cohorts, cohort_name
+from discovery import discover_clinical
 
 # 初始化Dash应用程序并设置标题
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
@@ -13,37 +26,109 @@ app.title = "GenoVAI"
 # 读取项目中的癌症数据文件
 # df = pd.read_csv('../dataset/Cleaned_BRCA_Merged_Data_test.csv')  # 替换为你实际的数据文件路径
 
-data_path = os.path.join(os.path.dirname(__file__), 'dataset/Cleaned_BRCA_Merged_Data_test.csv')
-if os.path.exists(data_path):
-    df = pd.read_csv(data_path)
-    # 删除第一列并重新排列数据框列顺序，将与可视化相关的列放在前面显示
-    columns_to_display = ['Hugo_Symbol', 'One_Consequence', 'age_at_initial_pathologic_diagnosis', 'vital_status'] + \
-                         [col for col in df.columns if
-                          col not in ['Unnamed: 0', 'Hugo_Symbol', 'One_Consequence',
-                                      'age_at_initial_pathologic_diagnosis',
-                                      'vital_status']]
-    df = df[columns_to_display]
+# 每个CSV文件或分区目录是一个队列 (例如一个TCGA项目), 由队列管理器按需加载并在内存上限内缓存;
+# GENOVAI_DATA_PATH 可以指定单个文件或分区目录, GENOVAI_CLINICAL_PATH 指定对应的临床文件
+dataset_dir = os.path.join(os.path.dirname(__file__), 'dataset')
+if 'GENOVAI_DATA_PATH' in os.environ:
+    cohort_paths = {cohort_name(os.environ['GENOVAI_DATA_PATH']): os.environ['GENOVAI_DATA_PATH']}
+    clinical_paths = {name: os.environ['GENOVAI_CLINICAL_PATH'] for name in cohort_paths
+                      if 'GENOVAI_CLINICAL_PATH' in os.environ}
 else:
-    df = pd.DataFrame()
-# 定义可视化选项
-visualization_options = [
-    {'label': 'Age Distribution at Initial Diagnosis', 'value': 'age_dist'},
-    {'label': 'Vital Status vs. Age', 'value': 'vital_status_vs_age'},
-    {'label': 'Age at Initial Diagnosis vs. Mutation Type and Vital Status', 'value': 'mutation_vs_age_vs_status'},
-    {'label': 'Top 10 Mutation Type Distribution in BRCA Patients', 'value': 'mutation_type_dist'},
-    {'label': 'Gene Mutation Frequency by Chromosome', 'value': 'mutation_by_chr'},
-    {'label': 'Age at Initial Diagnosis by Gender', 'value': 'age_by_gender'},
-    {'label': 'Number of Mutations per Gene', 'value': 'mutations_per_gene'},
-    {'label': 'Number of Mutations per Patient', 'value': 'mutations_per_patient'}
-    # {'label': 'BRCA Gene Mutation Waterfall Plot', 'value': 'brca_waterfall'}
-]
+    cohort_paths = discover_cohorts(dataset_dir) or {
+        'BRCA': os.path.join(dataset_dir, 'Cleaned_BRCA_Merged_Data_test.csv')}
+    clinical_paths = discover_clinical(dataset_dir)
+cohort_manager = CohortManager(cohort_paths, clinical=clinical_paths)
+# 数据文件被修改时在后台重新加载并替换, 不需要重启
+cohort_manager.watch()
+default_cohort = 'BRCA' if 'BRCA' in cohort_paths else cohort_manager.names()[0]
+# 启动时不读取数据: 默认队列在后台加载, 页面打开后表格的列选项由回调在加载完成后填入
+threading.Thread(target=cohort_manager.get, args=(default_cohort,), daemon=True).start()
+# precompute.py 生成的产物 (GENOVAI_PRECOMPUTED_DIR, 默认 dataset/precomputed): 没有过滤条件时直接显示预先生成的图表;
+# 第一次生成图表时读取
+precomputed_dir = os.environ.get('GENOVAI_PRECOMPUTED_DIR', os.path.join(dataset_dir, 'precomputed'))
+_precomputed = None
+_precomputed_lock = threading.Lock()
+
+
+def precomputed_cohorts():
+    global _precomputed
+    with _precomputed_lock:
+        if _precomputed is None:
+            from precompute import load_precomputed
+            _precomputed = {name: cohort for name, cohort in load_precomputed(precomputed_dir).items()
+                            if name in cohort_paths and cohort.valid_for(cohort_paths[name], clinical_paths.get(name))}
+        return _precomputed
+
+
+def request_batch():
+    # 请求体中的批次: JSON记录列表, 或者CSV/TSV文本; pandas在第一次导入批次时才导入, 不计入应用启动时间
+    import pandas as pd
+    if request.is_json:
+        records = request.get_json()
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise ValueError('JSON body must be a list of records')
+        return pd.DataFrame(records)
+    separator = '\t' if 'tab-separated' in (request.mimetype or '') else ','
+    return pd.read_csv(io.StringIO(request.get_data(as_text=True)), sep=separator)
+
+
+# 增量导入新的突变批次: POST CSV/TSV文本或JSON记录列表到 /api/cohorts/<队列>/append,
+# 追加到已加载的数据和磁盘上的文件, 不需要重启
+@app.server.route('/api/cohorts/<cohort>/append', methods=['POST'])
+def append_batch(cohort):
+    if cohort not in cohort_manager.paths:
+        return jsonify({'error': f'unknown cohort {cohort}'}), 404
+    try:
+        batch = request_batch()
+        if batch.empty or 'Hugo_Symbol' not in batch.columns:
+            return jsonify({'error': 'batch must contain mutation rows with a Hugo_Symbol column'}), 400
+        version = cohort_manager.append(cohort, batch)
+    except (KeyError, ValueError, TypeError) as error:
+        # 格式不对或取值不能转换的批次: 不写入任何文件, 返回400
+        return jsonify({'error': str(error)}), 400
+    return jsonify({'cohort': cohort, 'version': version, 'rows': len(batch)})
+
+
+# 新增或更新病人的临床记录: POST 到 /api/cohorts/<队列>/clinical, 格式与append相同
+@app.server.route('/api/cohorts/<cohort>/clinical', methods=['POST'])
+def update_clinical(cohort):
+    if cohort not in cohort_manager.paths:
+        return jsonify({'error': f'unknown cohort {cohort}'}), 404
+    try:
+        batch = request_batch()
+        version = cohort_manager.update_clinical(cohort, batch)
+    except (KeyError, ValueError, TypeError) as error:
+        return jsonify({'error': str(error)}), 400
+    return jsonify({'cohort': cohort, 'version': version, 'rows': len(batch)})
+
+
+# "Refine to exact" 在后台线程中计算精确计数, 页面通过定时器轮询结果;
+# 最多保留REFINE_JOBS个任务, 结果被图表使用后或队列快照被替换/淘汰后删除
+REFINE_JOBS = 8
+refine_executor = ThreadPoolExecutor(max_workers=1)
+refine_jobs = OrderedDict()
+refine_lock = threading.Lock()
+# 点击图表中的柱子/箱子时对应过滤的列
+click_filter_columns = {
+    'vital_status_vs_age': 'vital_status',
+    'mutation_vs_age_vs_status': 'One_Consequence',
+    'mutation_type_dist': 'One_Consequence',
+    'mutation_by_chr': 'Chromosome',
+    'age_by_gender': 'gender',
+    'mutations_per_gene': 'Hugo_Symbol',
+    'mutations_per_patient': 'bcr_patient_barcode',
+    'patient_burden': 'bcr_patient_barcode',
+    'brca_waterfall': 'Hugo_Symbol',
+}
+# 可以框选年龄区间的图表
+age_range_charts = ['age_dist', 'mutation_line']
 prediction_metrics_options = [
     {'label': 'a', 'value': 'A'},
     {'label': 'b', 'value': 'B'},
     {'label': 'c', 'value': 'C'},
     {'label': 'd', 'value': 'D'},
     {'label': 'e', 'value': 'E'},
-    {'label': 'BRCA Gene Mutation Waterfall Plot', 'value': 'brca_waterfall'}
+    {'label': '{cohort} Gene Mutation Waterfall Plot', 'value': 'brca_waterfall'}
 ]  # label: brca_wplot&mucnt_byage, value: Brca_wplot&mucnt_byage
 # 定义任务选项
 task_options = [
@@ -55,26 +140,66 @@ task_options = [
     # {'label': 'Timeseries', 'value': 'timeseries'}
 ]
 
-# 创建datatable tooltips工具提示数据
-tooltips = []
-for i in range(len(df)):
-    tooltips.append({
-        'Hugo_Symbol': {
-            'value': f"Barcode: {df.loc[i, 'bcr_patient_barcode']}, "
-                     f"Hugo_Symbol: {df.loc[i, 'Hugo_Symbol']},"
-                     f"One_Consequence: {df.loc[i, 'One_Consequence']}, "
-                     f"Age: {df.loc[i, 'age_at_initial_pathologic_diagnosis']}, "
-                     f"Vital Status: {df.loc[i, 'vital_status']}, "
-                     f"Gender: {df.loc[i, 'gender']}",
-            'type': 'markdown'
-        }
-    })
+# 任务选项内容
+def cohort_options(options, cohort):
+    # 选项标签中的队列名称随当前队列变化
+    return [{'label': option['label'].format(cohort=cohort), 'value': option['value']} for option in options]
+
+
+# 每个任务的可视化选项 (标签中的{cohort}在浏览器中替换)、默认选择和每行图表数; 其他任务没有可选的可视化
+task_settings = {
+    'tasks': {
+        'data_analysis': {'options': visualization_options,
+                          'value': [option['value'] for option in visualization_options], 'per_row': 2},
+        'Brca_wplot&mucnt_byage': {'options': prediction_metrics_options,
+                                   'value': [option['value'] for option in prediction_metrics_options],
+                                   'per_row': 1},
+    },
+    'default': {'options': [], 'value': [], 'per_row': 1},
+}
+
+
+# 图表网格容器的样式: 每行figures_per_row个等宽的图表 (与assets/clientside.js中的gridStyle相同)
+def grid_style(figures_per_row):
+    return {'display': 'grid', 'gridTemplateColumns': f'repeat({figures_per_row}, minmax(0, 1fr))',
+            'columnGap': '24px', 'rowGap': '24px'}
+
+
+# 创建datatable tooltips工具提示数据 (只为当前页的行生成)
+# 表格提示框显示的列
+TOOLTIP_COLUMNS = ['bcr_patient_barcode', 'Hugo_Symbol', 'One_Consequence', 'age_at_initial_pathologic_diagnosis',
+                   'vital_status', 'gender']
+
+
+def build_tooltips(page):
+    # 队列中没有的列 (例如MAF没有配对临床文件时的性别) 显示为空
+    tooltips = []
+    for _, row in page.iterrows():
+        tooltips.append({
+            'Hugo_Symbol': {
+                'value': f"Barcode: {row.get('bcr_patient_barcode', '')}, "
+                         f"Hugo_Symbol: {row.get('Hugo_Symbol', '')},"
+                         f"One_Consequence: {row.get('One_Consequence', '')}, "
+                         f"Age: {row.get('age_at_initial_pathologic_diagnosis', '')}, "
+                         f"Vital Status: {row.get('vital_status', '')}, "
+                         f"Gender: {row.get('gender', '')}",
+                'type': 'markdown'
+            }
+        })
+    return tooltips
+
 
 app.layout = dbc.Container([
     # 顶部Logo和标题区域
     dbc.Row([
         dbc.Col(html.Img(src=app.get_asset_url('GENOVAI Logo.png'), height='80px'), width="auto"),
-        dbc.Col(html.H1("Cancer Genomic Data Visualization Tool", style={'fontSize': '18px', 'margin': '0'}), width=9),
+        dbc.Col(html.H1("Cancer Genomic Data Visualization Tool", style={'fontSize': '18px', 'margin': '0'}), width=7),
+        dbc.Col(dcc.Dropdown(
+            id='cohort-dropdown',
+            options=[{'label': name, 'value': name} for name in cohort_manager.names()],
+            value=default_cohort,
+            clearable=False
+        ), width=2),
     ], align="center", className="mb-4"),
 
     # 主体内容区域
@@ -90,320 +215,597 @@ app.layout = dbc.Container([
                 className='mt-3',
                 style={'margin-bottom': '30px'}
             ),
-            html.Div(id='task-content')
+            # 任务内容: 两个下拉框固定在布局中, 切换任务时只在浏览器中改变选项和取值
+            html.Div([
+                html.Label('Select Visualization:', style={'margin-bottom': '15px'}),
+                dcc.Dropdown(
+                    id='visualization-dropdown',
+                    options=cohort_options(visualization_options, default_cohort),
+                    value=[option['value'] for option in visualization_options],  # 默认全选
+                    multi=True,
+                    className='mt-3',
+                    style={'margin-bottom': '30px'}
+                ),
+                html.Label('Number of figures per row:', style={'margin-bottom': '15px'}),
+                dcc.Dropdown(
+                    id='figures-per-row-dropdown',
+                    options=[
+                        {'label': '1', 'value': 1},
+                        {'label': '2', 'value': 2}
+                    ],
+                    value=2,
+                    multi=False,
+                    className='mt-3',
+                    style={'margin-bottom': '30px'}
+                ),
+            ], id='task-content'),
+            dcc.Store(id='task-settings', data=task_settings)
         ], width=3, style={'border-right': '1px solid #ddd', 'padding-right': '15px'}),
 
         # 右侧可视化图像生成区域
         dbc.Col([
             html.Div([
+                # 表格显示的列: 默认列在加载时读取, 其他列加入时才从文件读取
+                dcc.Dropdown(
+                    id='table-columns-dropdown',
+                    # 选项和默认选择在默认队列加载完成后由update_table_column_options填入
+                    options=[],
+                    value=None,
+                    multi=True,
+                    placeholder='Table columns...',
+                    className='mb-2'
+                ),
+                # 分区数据集的表格只包含内存中的抽样, 在这里标注
+                html.Div(id='table-note', style={'fontSize': '13px', 'color': '#555'}),
                 # dash table_Construction
                 dash_table.DataTable(
                     id='datatable-interactivity',
-                    columns=[
-                        {"name": i, "id": i, "deletable": True, "selectable": True} for i in df.columns
-                    ],
-                    data=df.to_dict('records'),
+                    columns=[],
+                    # 过滤、排序和分页都在服务器端完成, 分类列的过滤使用位图索引
+                    data=[],
                     editable=True,
-                    filter_action="native",
-                    sort_action="native",
+                    filter_action="custom",
+                    filter_query='',
+                    sort_action="custom",
                     sort_mode="multi",
                     column_selectable="single",
                     row_selectable="multi",
-                    row_deletable=True,
+                    row_deletable=False,
                     selected_columns=[],
                     selected_rows=[],
-                    page_action="native",
+                    page_action="custom",
                     page_current=0,
                     page_size=10,
-                    tooltip_data=tooltips,
+                    sort_by=[],
                     tooltip_duration=None,  # 保持工具提示一直可见
                 ),
                 # brca_waterfall plotting && Linechart plotting
                 html.Div(id='datatable-interactivity-container')
             ]),
-            # visualization_plots_container
-            dbc.Row(id='visualization-rows')
+            # 交叉过滤: 基因/病人选择 + 当前生效的过滤条件
+            dcc.Store(id='filter-state', data=empty_filter_state()),
+            dbc.Row([
+                dbc.Col(dcc.Dropdown(id='gene-filter-dropdown', placeholder='Filter genes...', multi=True,
+                                     options=[], value=[]), width=4),
+                dbc.Col(dcc.Dropdown(id='patient-filter-dropdown', placeholder='Filter patients...', multi=True,
+                                     options=[], value=[]), width=3),
+                dbc.Col(dcc.Input(id='region-filter-input', placeholder='Region, e.g. chr17:7000000-7700000',
+                                  debounce=True, value='', style={'width': '100%'}), width=3),
+                dbc.Col(html.Button('Clear filters', id='clear-filters-button', n_clicks=0), width=2),
+            ], className="mt-4 mb-2"),
+            dbc.Row([
+                dbc.Col(dcc.Checklist(id='approximate-mode',
+                                      options=[{'label': ' Approximate mode (stratified sample)',
+                                                'value': 'approximate'}],
+                                      value=[]), width="auto"),
+                dbc.Col(html.Button('Refine to exact', id='refine-button', n_clicks=0), width="auto"),
+                dbc.Col(html.Span(id='refine-progress', style={'fontSize': '13px', 'color': '#555'}), width="auto"),
+            ], align="center", className="mb-2"),
+            dcc.Store(id='refine-status'),
+            dcc.Interval(id='refine-interval', interval=500, disabled=True),
+            html.Div(id='active-filters', className="mb-4", style={'fontSize': '13px', 'color': '#555'}),
+            # visualization_plots_container: 图表按CSS网格排列, 每行图表数只改变网格样式 (在浏览器中完成)
+            html.Div(id='visualization-rows', style=grid_style(2)),
+            # 客户端当前显示的图表 (布局和每个图表数据/布局的摘要), 用来只发送变化的部分
+            dcc.Store(id='rendered-figures'),
+            # 突变共现/互斥: 过滤后突变最多的K个基因两两检验, 点击按钮后计算, 之后随过滤条件更新
+            html.H5('Mutation Co-occurrence and Mutual Exclusivity', className='mt-4'),
+            dbc.Row([
+                dbc.Col([html.Label('Top mutated genes:', style={'margin-right': '8px'}),
+                         dcc.Input(id='co-occurrence-top-genes', type='number', min=2, max=MAX_TOP_GENES, step=1,
+                                   value=TOP_GENES, debounce=True)], width="auto"),
+                dbc.Col([html.Label('Network q-value <', style={'margin-right': '8px'}),
+                         dcc.Input(id='co-occurrence-q', type='number', min=0, max=1, step=0.01,
+                                   value=NETWORK_Q_THRESHOLD, debounce=True)], width="auto"),
+                dbc.Col(html.Button('Compute co-occurrence', id='co-occurrence-button', n_clicks=0), width="auto"),
+                dbc.Col(html.Span(id='co-occurrence-summary', style={'fontSize': '13px', 'color': '#555'}),
+                        width="auto"),
+            ], align="center", className="mb-2"),
+            dash_table.DataTable(
+                id='co-occurrence-table',
+                columns=[{'name': column, 'id': column, 'type': 'numeric', 'format': {'specifier': '.3g'}}
+                         if column in ('Log2 Odds Ratio', 'p-Value', 'q-Value') else {'name': column, 'id': column}
+                         for column in STATS_COLUMNS],
+                data=[],
+                sort_action="native",
+                sort_mode="multi",
+                filter_action="native",
+                page_action="native",
+                page_size=15,
+            ),
+            dcc.Graph(id='co-occurrence-network', figure={'data': [], 'layout': {}})
         ], width=9)
     ])
 ], fluid=True)
 
 
-# 任务选项内容
-@app.callback(
-    Output('task-content', 'children'),
-    Input('task-dropdown', 'value')
+# 以下只改变界面的回调在浏览器中执行 (assets/clientside.js), 不请求服务器
+# 每行图表数变化时只改变网格的列数, 图表组件保持不变
+app.clientside_callback(
+    ClientsideFunction(namespace='genovai', function_name='gridStyle'),
+    Output('visualization-rows', 'style'),
+    Input('figures-per-row-dropdown', 'value')
 )
-def update_task_content(selected_task):
-    # if there is no value in 'task-dropdown' there is no update
-    if selected_task == '':
-        return dash.no_update
-    elif selected_task == 'data_analysis':
-        return html.Div([
-            html.Label('Select Visualization:', style={'margin-bottom': '15px'}),
-            dcc.Dropdown(
-                id='visualization-dropdown',
-                options=visualization_options,
-                value=[option['value'] for option in visualization_options],  # 默认全选
-                multi=True,
-                className='mt-3',
-                style={'margin-bottom': '30px'}
-            ),
-            html.Label('Number of figures per row:', style={'margin-bottom': '15px'}),
-            dcc.Dropdown(
-                id='figures-per-row-dropdown',
-                options=[
-                    {'label': '1', 'value': 1},
-                    {'label': '2', 'value': 2}
-                ],
-                value=2,
-                multi=False,
-                className='mt-3',
-                style={'margin-bottom': '30px'}
-            ),
-        ])
-    elif selected_task == 'Brca_wplot&mucnt_byage':
-        return html.Div([
-            html.Label('Select Visualization:', style={'margin-bottom': '15px'}),
-            dcc.Dropdown(
-                id='visualization-dropdown',
-                options=prediction_metrics_options,
-                value=[option['value'] for option in prediction_metrics_options],  # 默认全选
-                multi=True,
-                className='mt-3',
-                style={'margin-bottom': '30px'}
-            ),
-            html.Label('Number of figures per row:', style={'margin-bottom': '15px'}),
-            dcc.Dropdown(
-                id='figures-per-row-dropdown',
-                options=[
-                    {'label': '1', 'value': 1},
-                    {'label': '2', 'value': 2}
-                ],
-                value=1,
-                multi=False,
-                className='mt-3',
-                style={'margin-bottom': '30px'}
-            ),
-        ])
-    elif selected_task == 'vision':
-        return html.Div([
-            html.Label('Select Visualization:', style={'margin-bottom': '15px'}),
-            dcc.Dropdown(
-                id='visualization-dropdown',
-                # options=visualization_options,
-                value=[],  # 默认值为空
-                multi=True,
-                className='mt-3',
-                style={'margin-bottom': '30px'}
-            ),
-            html.Label('Number of figures per row:', style={'margin-bottom': '15px'}),
-            dcc.Dropdown(
-                id='figures-per-row-dropdown',
-                options=[
-                    {'label': '1', 'value': 1},
-                    {'label': '2', 'value': 2}
-                ],
-                value=1,
-                multi=False,
-                className='mt-3',
-                style={'margin-bottom': '30px'}
-            ),
-        ])
-    elif selected_task == 'nlp':
-        return html.Div([
-            html.Label('Select Visualization:', style={'margin-bottom': '15px'}),
-            dcc.Dropdown(
-                id='visualization-dropdown',
-                # options=visualization_options,
-                value=[],  # 默认值为空
-                multi=True,
-                className='mt-3',
-                style={'margin-bottom': '30px'}
-            ),
-            html.Label('Number of figures per row:', style={'margin-bottom': '15px'}),
-            dcc.Dropdown(
-                id='figures-per-row-dropdown',
-                options=[
-                    {'label': '1', 'value': 1},
-                    {'label': '2', 'value': 2}
-                ],
-                value=1,
-                multi=False,
-                className='mt-3',
-                style={'margin-bottom': '30px'}
-            ),
-        ])
-    return html.Div([
-        html.Label('Select Visualization:', style={'margin-bottom': '15px'}),
-        dcc.Dropdown(
-            id='visualization-dropdown',
-            # options=visualization_options,
-            value=[],  # 默认值为空
-            multi=True,
-            className='mt-3',
-            style={'margin-bottom': '30px'}
-        ),
-        html.Label('Number of figures per row:', style={'margin-bottom': '15px'}),
-        dcc.Dropdown(
-            id='figures-per-row-dropdown',
-            options=[
-                {'label': '1', 'value': 1},
-                {'label': '2', 'value': 2}
-            ],
-            value=1,
-            multi=False,
-            className='mt-3',
-            style={'margin-bottom': '30px'}
-        ),
-    ])
 
+# 切换任务时按task_settings设置可视化下拉框的选项、默认选择和每行图表数;
+# 切换队列时只更新选项标签, 保留当前仍然有效的选择
+app.clientside_callback(
+    ClientsideFunction(namespace='genovai', function_name='taskContent'),
+    [Output('visualization-dropdown', 'options'),
+     Output('visualization-dropdown', 'value'),
+     Output('figures-per-row-dropdown', 'value')],
+    [Input('task-dropdown', 'value'),
+     Input('cohort-dropdown', 'value')],
+    [State('task-settings', 'data'),
+     State('visualization-dropdown', 'value')]
+)
 
-@app.callback(
+
+# 选中的表格列高亮显示, 在浏览器中完成
+app.clientside_callback(
+    ClientsideFunction(namespace='genovai', function_name='selectedColumnStyles'),
     Output('datatable-interactivity', 'style_data_conditional'),
     Input('datatable-interactivity', 'selected_columns')
 )
-def update_styles(selected_columns):
-    return [{
-        'if': {'column_id': i},
-        'background_color': '#D2F3FF'
-    } for i in selected_columns]
 
 
-# 生成图像的回调函数
+# 基因/病人下拉框按输入内容动态生成选项, 避免一次下发所有取值
+def search_options(dataset, column, search_value, selected):
+    if dataset.empty or column not in dataset.cross_filter.labels:
+        return []
+    labels = dataset.cross_filter.labels[column]
+    options = [value for value in (selected or [])]
+    if search_value:
+        matches = labels[labels.astype(str).str.contains(search_value, case=False, regex=False)]
+        options += [value for value in matches[:50] if value not in options]
+    return [{'label': str(value), 'value': value} for value in options]
+
+
 @app.callback(
-    Output('visualization-rows', 'children'),
-    [Input('visualization-dropdown', 'value'),
-     Input('figures-per-row-dropdown', 'value'),
-     Input('datatable-interactivity', "derived_virtual_data"),
-     Input('datatable-interactivity', "derived_virtual_selected_rows")
-     ],
-    # prevent_initial_call=True
+    Output('gene-filter-dropdown', 'options'),
+    Input('gene-filter-dropdown', 'search_value'),
+    State('gene-filter-dropdown', 'value'),
+    State('cohort-dropdown', 'value')
 )
-def update_graphs(selected_vis, figures_per_row, rows, derived_virtual_selected_rows):
-    if df.empty:
-        return []
+def update_gene_options(search_value, selected, cohort):
+    return search_options(cohort_manager.get(cohort), 'Hugo_Symbol', search_value, selected)
 
-    if 'age_at_initial_pathologic_diagnosis' not in df.columns or 'vital_status' not in df.columns or 'One_Consequence' not in df.columns:
-        return []
+
+@app.callback(
+    Output('patient-filter-dropdown', 'options'),
+    Input('patient-filter-dropdown', 'search_value'),
+    State('patient-filter-dropdown', 'value'),
+    State('cohort-dropdown', 'value')
+)
+def update_patient_options(search_value, selected, cohort):
+    return search_options(cohort_manager.get(cohort), 'bcr_patient_barcode', search_value, selected)
+
+
+# 汇总表格过滤、图表点击和基因/病人选择, 生成共享的过滤状态
+@app.callback(
+    [Output('filter-state', 'data'),
+     Output('gene-filter-dropdown', 'value'),
+     Output('patient-filter-dropdown', 'value'),
+     Output('datatable-interactivity', 'filter_query'),
+     Output('region-filter-input', 'value')],
+    [Input('datatable-interactivity', 'filter_query'),
+     Input({'type': 'visualization-graph', 'index': ALL}, 'clickData'),
+     Input({'type': 'visualization-graph', 'index': ALL}, 'selectedData'),
+     Input('gene-filter-dropdown', 'value'),
+     Input('patient-filter-dropdown', 'value'),
+     Input('region-filter-input', 'value'),
+     Input('clear-filters-button', 'n_clicks'),
+     Input('cohort-dropdown', 'value')],
+    State('filter-state', 'data')
+)
+def update_filter_state(filter_query, click_data, selected_data, selected_genes, selected_patients, region,
+                        clear_clicks, cohort, state):
+    state = state or empty_filter_state()
+    triggered = dash.callback_context.triggered_id
+
+    # 切换队列时清空所有过滤条件
+    if triggered in ('clear-filters-button', 'cohort-dropdown'):
+        return empty_filter_state(), [], [], '', ''
+
+    state['table_filter'] = filter_query or ''
+    state['region'] = parse_region(region)
+
+    state['Hugo_Symbol'] = selected_genes or []
+    state['bcr_patient_barcode'] = selected_patients or []
+
+    # 点击柱子/箱子时切换对应列的取值
+    if isinstance(triggered, dict) and triggered.get('type') == 'visualization-graph':
+        column = click_filter_columns.get(triggered['index'])
+        event = dash.callback_context.triggered[0]
+        # 在年龄直方图/折线图上框选时按年龄区间过滤
+        if event['prop_id'].endswith('.selectedData'):
+            if triggered['index'] in age_range_charts:
+                selected_range = ((event['value'] or {}).get('range') or {}).get('x')
+                state['age_range'] = sorted(selected_range) if selected_range else None
+        elif column and event['value']:
+            point = event['value']['points'][0]
+            # 点的customdata是过滤取值时优先使用 (例如按排名绘制的病人负荷图)
+            value = point.get('customdata', point.get('x'))
+            selected = list(state.get(column) or [])
+            if value in selected:
+                selected.remove(value)
+            else:
+                selected.append(value)
+            state[column] = selected
+
+    return state, state['Hugo_Symbol'], state['bcr_patient_barcode'], dash.no_update, dash.no_update
+
+
+@app.callback(
+    Output('active-filters', 'children'),
+    Input('filter-state', 'data'),
+    State('cohort-dropdown', 'value')
+)
+def show_active_filters(state, cohort):
+    if not state:
+        return ''
+    parts = []
+    if state.get('table_filter'):
+        parts.append(f"table: {state['table_filter']}")
+    if state.get('age_range'):
+        parts.append('age: {:g}-{:g}'.format(*state['age_range']))
+    if state.get('region'):
+        parts.append('region: {chromosome}:{start:.0f}-{end:.0f}'.format(**state['region']))
+    for column in FILTER_COLUMNS:
+        if state.get(column):
+            parts.append(f"{column}: {', '.join(str(value) for value in state[column])}")
+    dataset = cohort_manager.get(cohort)
+    if not parts or dataset.empty:
+        return ''
+    cross_filter = dataset.cross_filter
+    words = cross_filter.bitmap_for(state)
+    matched = cross_filter.bitmaps.count(words)
+    if dataset.partitioned is not None:
+        # 分区数据集在内存中只有抽样: 给出抽样中的行数和按权重估计的整个队列中的行数
+        estimate = cross_filter.weights[cross_filter.bitmaps.to_rows(words)].sum()
+        return (f"Active filters ({matched:,} of {len(dataset.df):,} sampled mutations, "
+                f"~{estimate:,.0f} of {cross_filter.weights.sum():,.0f} in the cohort): " + '; '.join(parts))
+    return f"Active filters ({matched} of {len(dataset.df)} mutations): " + '; '.join(parts)
+
+
+@app.callback(
+    [Output('table-columns-dropdown', 'options'),
+     Output('table-columns-dropdown', 'value')],
+    Input('cohort-dropdown', 'value')
+)
+def update_table_column_options(cohort):
+    # 页面打开时也调用: 启动时不等待默认队列加载, 布局中的列选项是空的
+    columns = cohort_manager.get(cohort).columns
+    return ([{'label': column, 'value': column} for column in columns],
+            [column for column in TABLE_COLUMNS if column in columns])
+
+
+# 表格的服务器端过滤/排序/分页
+@app.callback(
+    [Output('datatable-interactivity', 'data'),
+     Output('datatable-interactivity', 'page_count'),
+     Output('datatable-interactivity', 'tooltip_data'),
+     Output('datatable-interactivity', 'columns'),
+     Output('table-note', 'children')],
+    [Input('filter-state', 'data'),
+     Input('datatable-interactivity', 'page_current'),
+     Input('datatable-interactivity', 'page_size'),
+     Input('datatable-interactivity', 'sort_by'),
+     Input('table-columns-dropdown', 'value')],
+    State('cohort-dropdown', 'value')
+)
+def update_table(filter_state, page_current, page_size, sort_by, table_columns, cohort):
+    dataset = cohort_manager.get(cohort)
+    if dataset.empty:
+        return [], 0, [], [], ''
+    # 还没有读取的列在这里按需读取 (读取到新快照上, 由队列管理器替换)
+    table_columns = table_columns if table_columns is not None else TABLE_COLUMNS
+    dataset = cohort_manager.load_columns(dataset.name, table_columns)
+    shown = dataset.shown_columns(table_columns)
+    columns = [{"name": i, "id": i, "deletable": True, "selectable": True} for i in shown]
+    cross_filter = dataset.cross_filter
+    words = cross_filter.bitmap_for(filter_state)
+    total = cross_filter.bitmaps.count(words)
+    dff = dataset.df.iloc[cross_filter.bitmaps.to_rows(words)]
+    sort_by = [col for col in sort_by or [] if cross_filter.has_column(col['column_id'])]
+    if sort_by:
+        # 按临床列排序时先给过滤后的行加上这些列, 否则只给当前页加上
+        dff = dataset.join_clinical(dff, [col['column_id'] for col in sort_by])
+        dff = dff.sort_values([col['column_id'] for col in sort_by],
+                              ascending=[col['direction'] == 'asc' for col in sort_by],
+                              inplace=False)
+    # 提示框中的临床列不在表格中显示时也要加上
+    page = dataset.join_clinical(dff.iloc[page_current * page_size:(page_current + 1) * page_size],
+                                 shown + [column for column in TOOLTIP_COLUMNS if column not in shown])
+    page_count = max(1, -(-total // page_size))
+    note = ''
+    if dataset.partitioned is not None:
+        note = (f"Partitioned cohort: the table shows a stratified sample of {len(dataset.df):,} of "
+                f"~{cross_filter.weights.sum():,.0f} mutations ({total:,} sampled rows match the filters)")
+    return page[shown].assign(id=page.index).to_dict('records'), page_count, build_tooltips(page), columns, note
+
+
+# 在后台开始计算当前过滤状态下的精确计数
+@app.callback(
+    [Output('refine-status', 'data'),
+     Output('refine-interval', 'disabled'),
+     Output('refine-progress', 'children')],
+    Input('refine-button', 'n_clicks'),
+    State('filter-state', 'data'),
+    State('cohort-dropdown', 'value'),
+    prevent_initial_call=True
+)
+def start_refine(n_clicks, filter_state, cohort):
+    dataset = cohort_manager.get(cohort)
+    if dataset.empty:
+        return dash.no_update, True, ''
+    job_id = uuid.uuid4().hex
+    with refine_lock:
+        # 队列快照已经被替换或淘汰的任务不再需要
+        for stale in [key for key, (job_dataset, _, _) in refine_jobs.items()
+                      if cohort_manager.resident.get(job_dataset.name) is not job_dataset]:
+            del refine_jobs[stale]
+        refine_jobs[job_id] = (dataset, filter_state, refine_executor.submit(dataset.exact_counts, filter_state))
+        while len(refine_jobs) > REFINE_JOBS:
+            refine_jobs.popitem(last=False)
+    # 精确结果对应的队列快照 (版本号) 和过滤状态, 结果被使用后精确图表保存在数据集的图表缓存中
+    status = {'job': job_id, 'ready': False, 'cohort': dataset.name, 'version': dataset.version,
+              'filter': json.dumps(filter_state, sort_keys=True)}
+    return status, False, 'Refining...'
+
+
+@app.callback(
+    [Output('refine-status', 'data', allow_duplicate=True),
+     Output('refine-interval', 'disabled', allow_duplicate=True),
+     Output('refine-progress', 'children', allow_duplicate=True)],
+    Input('refine-interval', 'n_intervals'),
+    State('refine-status', 'data'),
+    prevent_initial_call=True
+)
+def poll_refine(n_intervals, refine_status):
+    job = refine_jobs.get(refine_status['job']) if refine_status else None
+    if job is None:
+        return dash.no_update, True, ''
+    if not job[2].done():
+        return dash.no_update, False, dash.no_update
+    return dict(refine_status, ready=True), True, 'Exact'
+
+
+def is_refined(dataset, refine_status, filter_state):
+    # 后台精确计算已经完成, 且数据集快照和过滤状态都没有变化
+    return bool(refine_status and refine_status.get('ready')) and refine_status.get('cohort') == dataset.name \
+        and refine_status.get('version') == dataset.version \
+        and refine_status.get('filter') == json.dumps(filter_state, sort_keys=True)
+
+
+def refined_counts(dataset, refine_status, filter_state):
+    # 返回后台计算的精确计数并删除任务 (只使用一次, 之后由图表缓存提供精确图表)
+    if not is_refined(dataset, refine_status, filter_state):
+        return None
+    with refine_lock:
+        job = refine_jobs.pop(refine_status['job'], None)
+    if job is None or job[0] is not dataset:
+        return None
+    return job[2].result()
+
+
+# 缩放时只对可见范围重新聚合的图表
+zoom_charts = {'genome_density', 'patient_burden', 'age_dist', 'mutation_line'}
+
+
+# 图表缩放/平移时 (relayoutData), 服务器只对可见范围重新分箱或取点, 分辨率随缩放提高;
+# 返回部分更新 (只替换trace的数据数组), 坐标轴范围保持客户端当前的状态
+@app.callback(
+    Output({'type': 'visualization-graph', 'index': MATCH}, 'figure'),
+    Input({'type': 'visualization-graph', 'index': MATCH}, 'relayoutData'),
+    State({'type': 'visualization-graph', 'index': MATCH}, 'id'),
+    State('filter-state', 'data'),
+    State('cohort-dropdown', 'value'),
+    prevent_initial_call=True
+)
+def rebin_on_zoom(relayout_data, graph_id, filter_state, cohort):
+    from age_view import age_zoom_patch
+    from charts import zoom_filter
+    from genome_view import burden_patch, density_patch, patient_burden, relayout_range
+    vis = graph_id['index']
+    x_range = relayout_range(relayout_data)
+    if vis not in zoom_charts or x_range is False:
+        return dash.no_update
+    dataset = cohort_manager.get(cohort)
+    if dataset.empty:
+        return dash.no_update
+    view_filter = zoom_filter(dataset)
+    mask = view_filter.mask_for(filter_state or empty_filter_state())
+    if vis == 'genome_density':
+        return density_patch(view_filter, mask, x_range)
+    if vis == 'patient_burden':
+        return burden_patch(*patient_burden(view_filter, mask), x_range)
+    return age_zoom_patch(vis, view_filter, mask, x_range)
+
+
+def figure_parts(fig):
+    # 图表的data和layout (可以直接序列化的形式) 以及它们的摘要; 预计算的图表已经是字典
+    from plotly.io.json import to_json_plotly
+    parts = fig if isinstance(fig, dict) else fig.to_plotly_json()
+    parts = {'data': parts.get('data', []), 'layout': parts.get('layout', {})}
+    digests = {part: hashlib.md5(to_json_plotly(value).encode()).hexdigest() for part, value in parts.items()}
+    return parts, digests
+
+
+def render_graphs(figs):
+    # 图表平铺在网格容器中, id固定以便接收点击事件和部分更新; 网格列宽变化时图表自动调整大小
+    return [dcc.Graph(id={'type': 'visualization-graph', 'index': vis}, figure=fig, responsive=True)
+            for vis, fig in figs]
+
+
+def patch_graphs(figs, rendered):
+    # 图表不变时只发送变化了的图表的data或layout, 第k个图表是网格容器的第k个子组件
+    patch = dash.Patch()
+    digests = {}
+    changed = False
+    for k, (vis, fig) in enumerate(figs):
+        parts, digests[vis] = figure_parts(fig)
+        target = patch[k]['props']['figure']
+        for part, value in parts.items():
+            if rendered['digests'].get(vis, {}).get(part) != digests[vis][part]:
+                target[part] = value
+                changed = True
+    return (patch if changed else dash.no_update), digests
+
+
+def cohort_figures(dataset, selected_vis, filter_state, approximate_mode=None, refine_status=None):
+    # 由数据集计算所选可视化的图表 [(图表id, 图表)], 数据集为空或缺少必需的列时返回None
+    from charts import chart_figures
+    from sampling import dkw_bound
+    cross_filter = dataset.cross_filter
+    if dataset.empty:
+        return None
+
+    if not all(cross_filter.has_column(column)
+               for column in ['age_at_initial_pathologic_diagnosis', 'vital_status', 'One_Consequence']):
+        return None
+
+    # 所有图表共享同一个过滤状态, 计数按变化的行增量更新;
+    # 近似模式下在分层抽样上计算并在图上标注误差界, 直到后台精确计算完成;
+    # 分区数据集在内存中只有抽样, 总是先显示近似结果
+    approximate_note = None
+    counts = refined_counts(dataset, refine_status, filter_state)
+    approximate = 'approximate' in (approximate_mode or []) or dataset.partitioned is not None
+    approximate = approximate and counts is None and not is_refined(dataset, refine_status, filter_state)
+    # 精确结果的图表按过滤状态缓存; 追加的新行不满足过滤条件时缓存仍然有效
+    version = dataset.version
+    filter_key = json.dumps(filter_state, sort_keys=True)
+    exact = not approximate or dataset.sample_filter is None
+    cached = dataset.cached_figures(filter_key, filter_state) if exact else {}
+    if counts is None and any(vis not in cached for vis in selected_vis):
+        if approximate and dataset.sample_filter is not None:
+            sample_mask = dataset.sample_filter.mask_for(filter_state)
+            counts = dataset.sample_filter.apply(sample_mask)
+            sampled = int(sample_mask.sum())
+            approximate_note = (f"Approximate: {sampled:,} sampled rows, "
+                                f"±{dkw_bound(sampled):.1%} (95% DKW bound)")
+            if dataset.partitioned is None and {'age_dist', 'brca_waterfall'} & set(selected_vis):
+                # 年龄图表与缩放后的重新分箱一样在完整数据上计数, 放大前后的数字一致
+                mask = cross_filter.mask_for(filter_state)
+                counts = dict(counts, age=cross_filter.count('age', mask))
+        else:
+            counts = dataset.exact_counts(filter_state)
 
     figs = []
     for vis in selected_vis:
-        if vis == 'age_dist':
-            # Age Distribution at Initial Pathologic Diagnosis bar chart
-            hist_fig = px.histogram(df, x='age_at_initial_pathologic_diagnosis', nbins=30,
-                                    title='Age Distribution at Initial Pathologic Diagnosis')
-            hist_fig.update_layout(xaxis_title='Age', yaxis_title='Frequency')
-            figs.append(hist_fig)
-
-        elif vis == 'vital_status_vs_age':
-            # 生成Vital Status vs. Age图像
-            box_fig = px.box(df, x='vital_status', y='age_at_initial_pathologic_diagnosis', color='vital_status',
-                             title='Vital Status vs. Age')
-            box_fig.update_layout(xaxis_title='Vital Status', yaxis_title='Age at Initial Pathologic Diagnosis')
-            figs.append(box_fig)
-
-        elif vis == 'mutation_vs_age_vs_status':
-            # 生成Age at Initial Diagnosis vs. Mutation Type and Vital Status图像
-            box_fig = px.box(df, x='One_Consequence', y='age_at_initial_pathologic_diagnosis', color='vital_status',
-                             title='Age at Initial Diagnosis vs. Mutation Type and Vital Status')
-            box_fig.update_layout(xaxis_title='Mutation Type', yaxis_title='Age at Initial Pathologic Diagnosis')
-            figs.append(box_fig)
-
-        elif vis == 'mutation_type_dist':
-            # 生成Top 10 Mutation Type Distribution in BRCA Patients图像
-            mutation_type_counts = df['One_Consequence'].value_counts().head(10)
-            bar_fig = px.bar(mutation_type_counts, x=mutation_type_counts.index, y=mutation_type_counts.values,
-                             title='Top 10 Mutation Type Distribution in BRCA Patients')
-            bar_fig.update_layout(xaxis_title='Mutation Type', yaxis_title='Count')
-            figs.append(bar_fig)
-
-        elif vis == 'mutation_by_chr':
-            # 生成Gene Mutation Frequency by Chromosome图像
-            mutation_by_chr = df['Chromosome'].value_counts()
-            bar_fig = px.bar(mutation_by_chr, x=mutation_by_chr.index, y=mutation_by_chr.values,
-                             title='Gene Mutation Frequency by Chromosome')
-            bar_fig.update_layout(xaxis_title='Chromosome', yaxis_title='Mutation Count')
-            figs.append(bar_fig)
-
-        elif vis == 'age_by_gender':
-            # 生成Age at Initial Diagnosis by Gender图像
-            box_fig = px.box(df, x='gender', y='age_at_initial_pathologic_diagnosis', color='gender',
-                             title='Age at Initial Diagnosis by Gender')
-            box_fig.update_layout(xaxis_title='Gender', yaxis_title='Age at Initial Pathologic Diagnosis')
-            figs.append(box_fig)
-
-        elif vis == 'mutations_per_gene':
-            # 生成Number of Mutations per Gene图像（堆积条形图）
-            top_genes = df['Hugo_Symbol'].value_counts().head(10).index
-            filtered_df = df[df['Hugo_Symbol'].isin(top_genes)]
-            mutations_per_gene_fig = px.histogram(filtered_df, x='Hugo_Symbol', color='One_Consequence',
-                                                  title='Number of Mutations per Gene',
-                                                  category_orders={'One_Consequence': filtered_df[
-                                                                                          'One_Consequence'].value_counts().index[
-                                                                                      :5].tolist()},
-                                                  labels={'Hugo_Symbol': 'Gene', 'count': 'Mutation Count'},
-                                                  barmode='stack')
-            mutations_per_gene_fig.update_layout(xaxis_title='Gene', yaxis_title='Mutation Count')
-            figs.append(mutations_per_gene_fig)
-
-        elif vis == 'mutations_per_patient':
-            # 生成Number of Mutations per Patient图像
-            mutations_per_patient = df['bcr_patient_barcode'].value_counts().head(10)
-            max_value = mutations_per_patient.max()
-            y_axis_max = max(10, max_value + 1)  # 动态调整Y轴范围
-            mutations_per_patient_fig = px.bar(mutations_per_patient, x=mutations_per_patient.index,
-                                               y=mutations_per_patient.values,
-                                               title='Number of Mutations per Patient')
-            mutations_per_patient_fig.update_layout(xaxis_title='Patient', yaxis_title='Mutation Count',
-                                                    yaxis=dict(range=[0, y_axis_max]), xaxis={'tickangle': 45})
-            figs.append(mutations_per_patient_fig)
-
-        elif vis == 'brca_waterfall':
-            #     # 生成BRCA基因突变的瀑布图
-            #     top_genes = df['Hugo_Symbol'].value_counts().head(20).index
-            #     filtered_df = df[df['Hugo_Symbol'].isin(top_genes)]
-            #     waterfall_data = filtered_df.groupby(['Hugo_Symbol', 'One_Consequence']).size().reset_index(name='Count')
-            #     waterfall_fig = px.bar(waterfall_data, x='Hugo_Symbol', y='Count', color='One_Consequence',
-            #                            title='BRCA Gene Mutation Waterfall Plot')
-            #     waterfall_fig.update_layout(xaxis_title='Gene', yaxis_title='Count')
-            #     # 添加折线图
-            #     line_data = df.groupby('age_at_initial_pathologic_diagnosis').size().reset_index(name='Mutation Count')
-            #     line_fig = px.line(line_data, x='age_at_initial_pathologic_diagnosis', y='Mutation Count',
-            #                        title='Mutation Count by Age at Initial Pathologic Diagnosis')
-            #     line_fig.update_layout(xaxis_title='Age at Initial Pathologic Diagnosis', yaxis_title='Mutation Count')
-            if derived_virtual_selected_rows is None:
-                derived_virtual_selected_rows = []
-            dff = df if rows is None else pd.DataFrame(rows)
-            top_genes = dff['Hugo_Symbol'].value_counts().head(20).index
-            filtered_df = dff[dff['Hugo_Symbol'].isin(top_genes)]
-            waterfall_data = filtered_df.groupby(['Hugo_Symbol', 'One_Consequence']).size().reset_index(
-                name='Count')
-            waterfall_fig = px.bar(waterfall_data, x='Hugo_Symbol', y='Count', color='One_Consequence',
-                                   title='BRCA Gene Mutation Waterfall Plot')
-            waterfall_fig.update_layout(xaxis_title='Gene', yaxis_title='Count')
-            # 添加折线图
-            line_data = dff.groupby('age_at_initial_pathologic_diagnosis').size().reset_index(name='Mutation Count')
-            line_fig = px.line(line_data, x='age_at_initial_pathologic_diagnosis', y='Mutation Count',
-                               title='Mutation Count by Age at Initial Pathologic Diagnosis')
-            line_fig.update_layout(xaxis_title='Age at Initial Pathologic Diagnosis', yaxis_title='Mutation Count')
-            figs.append(waterfall_fig)
-            figs.append(line_fig)
+        if vis in cached:
+            figs += cached[vis]
+            continue
+        vis_figs = chart_figures(dataset, vis, counts, filter_state)
+        if exact:
+            dataset.store_figures(filter_key, version, vis, vis_figs)
+        figs += vis_figs
+    if approximate_note:
+        for vis, fig in figs:
+            # 缩放图表总是在完整数据上聚合 (分区数据集除外)
+            if vis in zoom_charts and dataset.partitioned is None:
+                continue
+            fig.add_annotation(text=approximate_note, xref='paper', yref='paper', x=1, y=1.12,
+                               showarrow=False, font=dict(size=11, color='#888'))
+    return figs
+
+
+def precomputed_figures(cohort, selected_vis, filter_state):
+    # 没有过滤条件且数据文件自预计算以来没有变化时, 直接使用产物中的图表 (不需要加载数据集)
+    artifact = precomputed_cohorts().get(cohort)
+    if artifact is None or not is_empty_filter(filter_state) or \
+            not artifact.valid_for(cohort_paths[cohort], clinical_paths.get(cohort)):
+        return None
+    return artifact.chart_figures(selected_vis)
+
+
+# 生成图像的回调函数
+@app.callback(
+    [Output('visualization-rows', 'children'),
+     Output('rendered-figures', 'data')],
+    [Input('visualization-dropdown', 'value'),
+     Input('filter-state', 'data'),
+     Input('approximate-mode', 'value'),
+     Input('refine-status', 'data')
+     ],
+    State('cohort-dropdown', 'value'),
+    State('rendered-figures', 'data'),
+    # prevent_initial_call=True
+)
+def update_graphs(selected_vis, filter_state, approximate_mode, refine_status, cohort, rendered):
+    figs = precomputed_figures(cohort, selected_vis, filter_state)
+    if figs is None:
+        figs = cohort_figures(cohort_manager.get(cohort), selected_vis, filter_state, approximate_mode,
+                              refine_status)
+    if figs is None:
+        return [], None
     # print "The visualization plots user chose"
     print(f"The plots user chose: {selected_vis}")
     # if there is no value in 'visualization-dropdown' there is no update
     if len(selected_vis) == 0:
-        return dash.no_update
-    # 根据图像数量和用户选择生成行和列布局
-    rows = []
-    for i in range(0, len(figs), figures_per_row):
-        row = dbc.Row([
-            dbc.Col(dcc.Graph(figure=figs[i]), width=int(12 / figures_per_row)) if i < len(figs) else None,
-            dbc.Col(dcc.Graph(figure=figs[i + 1]), width=int(12 / figures_per_row)) if i + 1 < len(
-                figs) and figures_per_row > 1 else None
-        ], className="mb-4")
-        rows.append(row)
-
-    return rows
+        return dash.no_update, dash.no_update
+    # 图表组件已经在客户端时只发送变化的部分 (例如过滤条件变化后一个图表的trace数据),
+    # 图表组件和其他图表保持不变; 选择的图表变化时才重新生成图表组件
+    ids = [vis for vis, _ in figs]
+    if rendered and rendered.get('ids') == ids:
+        graphs, digests = patch_graphs(figs, rendered)
+    else:
+        graphs = render_graphs(figs)
+        digests = {vis: figure_parts(fig)[1] for vis, fig in figs}
+    return graphs, {'ids': ids, 'digests': digests}
+
+
+# 突变共现/互斥统计; 表格最多发送q值最小的TABLE_ROWS个基因对 (K=500时有12万多对), 在浏览器中排序和过滤
+@app.callback(
+    [Output('co-occurrence-table', 'data'),
+     Output('co-occurrence-network', 'figure'),
+     Output('co-occurrence-summary', 'children')],
+    [Input('co-occurrence-button', 'n_clicks'),
+     Input('filter-state', 'data'),
+     Input('co-occurrence-top-genes', 'value'),
+     Input('co-occurrence-q', 'value'),
+     Input('cohort-dropdown', 'value')],
+    prevent_initial_call=True
+)
+def update_co_occurrence(n_clicks, filter_state, top_genes, q_threshold, cohort):
+    from charts import zoom_filter
+    from co_occurrence import TABLE_ROWS, co_occurrence_stats, network_figure
+    if not n_clicks:
+        return dash.no_update, dash.no_update, dash.no_update
+    dataset = cohort_manager.get(cohort)
+    if dataset.empty or not dataset.cross_filter.has_column('Hugo_Symbol'):
+        return [], {'data': [], 'layout': {}}, 'No mutation data'
+    top_genes = min(max(int(top_genes or TOP_GENES), 2), MAX_TOP_GENES)
+    q_threshold = NETWORK_Q_THRESHOLD if q_threshold is None else q_threshold
+    start = time.perf_counter()
+    # 分区数据集在内存中只有抽样 (与缩放图表相同)
+    view_filter = zoom_filter(dataset)
+    stats = co_occurrence_stats(view_filter, view_filter.mask_for(filter_state or empty_filter_state()), top_genes)
+    elapsed = time.perf_counter() - start
+    significant = int((stats['q-Value'] < q_threshold).sum())
+    summary = (f"{len(stats):,} gene pairs, {significant:,} with q < {q_threshold:g} "
+               f"(showing the {min(len(stats), TABLE_ROWS):,} most significant) in {elapsed:.2f} s")
+    return (stats.head(TABLE_ROWS).to_dict('records'), network_figure(stats, q_threshold), summary)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,50 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 测试直接导入 source_Develop 和 demos_sourcecode 下的模块 (与运行应用时相同, 没有包结构)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('source_Develop', 'demos_sourcecode'):
+    sys.path.insert(0, os.path.join(ROOT, directory))
+os.environ.setdefault('GENOVAI_RELOAD_INTERVAL', '0')
+
+GENES = ['TP53', 'PIK3CA', 'CDH1', 'GATA3', 'MAP3K1', 'KMT2C', 'PTEN', 'TTN'] + [f'GENE{i}' for i in range(40)]
+CONSEQUENCES = ['missense_variant', 'stop_gained', 'frameshift_variant', 'synonymous_variant', 'splice_region_variant']
+CHROMOSOMES = ['1', '2', '17', 'X']
+
+
+def make_mutations(n_rows=3000, n_patients=200, seed=0):
+    # 随机的合并突变表: 基因频率有偏 (常见基因在位图索引中是稠密取值), 临床列在同一病人内一致
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, len(GENES) + 1)
+    patients = np.array([f'TCGA-A{i // 100}-{i:04d}' for i in range(n_patients)])
+    patient = rng.integers(0, n_patients, n_rows)
+    ages = rng.integers(26, 90, n_patients).astype(float)
+    ages[rng.random(n_patients) < 0.05] = np.nan
+    return pd.DataFrame({
+        'Hugo_Symbol': rng.choice(GENES, n_rows, p=weights / weights.sum()),
+        'One_Consequence': rng.choice(CONSEQUENCES, n_rows),
+        'Chromosome': rng.choice(CHROMOSOMES, n_rows),
+        'Start_Position': rng.integers(1, 5_000_000, n_rows),
+        'Variant_Type': rng.choice(['SNP', 'DEL', 'INS'], n_rows),
+        'bcr_patient_barcode': patients[patient],
+        'age_at_initial_pathologic_diagnosis': ages[patient],
+        'vital_status': rng.choice(['Alive', 'Dead'], n_patients)[patient],
+        'gender': rng.choice(['FEMALE', 'MALE'], n_patients, p=[0.9, 0.1])[patient],
+    })
+
+
+def write_partitions(directory, frame):
+    # Hive风格的分区目录: Chromosome=<染色体>/part-0.csv
+    for chromosome, group in frame.groupby('Chromosome'):
+        partition = directory / f'Chromosome={chromosome}'
+        partition.mkdir()
+        group.drop(columns='Chromosome').to_csv(partition / 'part-0.csv', index=False)
+
+
+@pytest.fixture
+def mutations():
+    return make_mutations()
@@ -0,0 +1,31 @@
+import numpy as np
+
+from age_view import AGE_HISTOGRAM_BINS, age_histogram_figure, age_zoom_patch
+from cross_filter import AGE_COLUMN, CrossFilter
+from filter_state import empty_filter_state
+
+
+def patch_values(patch, location):
+    return [op['params']['value'] for op in patch.to_plotly_json()['operations'] if op['location'] == location]
+
+
+def test_zoom_rebins_visible_ages(mutations):
+    cross_filter = CrossFilter(mutations)
+    state = dict(empty_filter_state(), gender=['FEMALE'])
+    mask = cross_filter.mask_for(state)
+    ages = mutations[mutations['gender'] == 'FEMALE'][AGE_COLUMN]
+    # 全部范围: 最多AGE_HISTOGRAM_BINS个箱, 计数之和为有年龄的行数
+    counts = cross_filter.apply(mask)['age'][:-1]
+    fig = age_histogram_figure(cross_filter.labels[AGE_COLUMN].to_numpy(), counts)
+    assert len(fig.data[0].y) <= AGE_HISTOGRAM_BINS + 1 and fig.data[0].y.sum() == ages.notna().sum()
+    # 缩放到40~50岁: 箱宽为整数年龄的间隔1, 每个年龄一个箱, 计数与逐行计数一致
+    patch = age_zoom_patch('age_dist', cross_filter, mask, (40, 50))
+    x = patch_values(patch, ['data', 0, 'x'])[0]
+    assert np.all(patch_values(patch, ['data', 0, 'width'])[0] == 1)
+    expected = ages.value_counts()
+    for center, count in zip(x, patch_values(patch, ['data', 0, 'y'])[0]):
+        assert count == expected.get(center - 0.5, 0), center
+    # 折线图在同一范围内的点就是每个年龄的突变数
+    line = age_zoom_patch('mutation_line', cross_filter, mask, (40, 50))
+    line_x, line_y = patch_values(line, ['data', 0, 'x'])[0], patch_values(line, ['data', 0, 'y'])[0]
+    assert dict(zip(line_x, line_y)) == {age: count for age, count in expected.items() if 40 <= age < 51}
@@ -0,0 +1,142 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import dash
+import pytest
+
+import dataset
+import updated_app
+from cohorts import CohortManager
+from conftest import make_mutations
+from filter_state import empty_filter_state
+
+SOURCE_DIR = os.path.dirname(updated_app.__file__)
+CLINICAL_COLUMNS = ['age_at_initial_pathologic_diagnosis', 'vital_status', 'gender']
+
+
+def test_table_tooltips_without_shown_clinical_columns(tmp_path, monkeypatch):
+    # 性别等临床列来自单独的临床文件且不在表格显示的列中时, 提示框仍然显示它们
+    mutations = make_mutations(500, 50)
+    mutations.drop(columns=CLINICAL_COLUMNS).to_csv(tmp_path / 'mutations.csv', index=False)
+    clinical = mutations[['bcr_patient_barcode'] + CLINICAL_COLUMNS].drop_duplicates('bcr_patient_barcode')
+    clinical.to_csv(tmp_path / 'clinical.csv', index=False)
+    manager = CohortManager({'TEST': str(tmp_path / 'mutations.csv')},
+                            clinical={'TEST': str(tmp_path / 'clinical.csv')})
+    monkeypatch.setattr(updated_app, 'cohort_manager', manager)
+    records, _, tooltips, columns, _ = updated_app.update_table(empty_filter_state(), 0, 10, [],
+                                                                ['Hugo_Symbol', 'Chromosome'], 'TEST')
+    assert [column['id'] for column in columns] == ['Hugo_Symbol', 'Chromosome']
+    assert len(records) == len(tooltips) == 10
+    gender = dict(zip(clinical['bcr_patient_barcode'], clinical['gender']))
+    barcode = manager.get('TEST').df['bcr_patient_barcode'].iloc[0]
+    assert tooltips[0]['Hugo_Symbol']['value'].endswith(f'Gender: {gender[barcode]}')
+
+
+def test_update_graphs_patches_only_changed_parts(tmp_path, monkeypatch):
+    # 选择的图表不变时不重新生成图表组件: 结果不变时不发送任何内容, 过滤条件变化后只替换各图表的data
+    make_mutations(500, 50).to_csv(tmp_path / 'mutations.csv', index=False)
+    manager = CohortManager({'TEST': str(tmp_path / 'mutations.csv')})
+    monkeypatch.setattr(updated_app, 'cohort_manager', manager)
+    selected = ['mutation_by_chr', 'age_dist']
+    graphs, rendered = updated_app.update_graphs(selected, empty_filter_state(), [], None, 'TEST', None)
+    assert [graph.id['index'] for graph in graphs] == rendered['ids'] == selected
+    unchanged, digests = updated_app.update_graphs(selected, empty_filter_state(), [], None, 'TEST', rendered)
+    assert unchanged is dash.no_update and digests == rendered
+    state = dict(empty_filter_state(), vital_status=['Dead'])
+    patch, digests = updated_app.update_graphs(selected, state, [], None, 'TEST', rendered)
+    locations = [op['location'] for op in patch.to_plotly_json()['operations']]
+    assert sorted(locations) == [[0, 'props', 'figure', 'data'], [1, 'props', 'figure', 'data']]
+    assert digests['ids'] == selected
+    assert all(digests['digests'][vis]['layout'] == rendered['digests'][vis]['layout'] for vis in selected)
+
+
+def test_append_route_rejects_bad_batches(tmp_path, monkeypatch):
+    mutations = make_mutations(500, 50)
+    path = tmp_path / 'mutations.csv'
+    mutations.iloc[:400].to_csv(path, index=False)
+    before = path.read_bytes()
+    monkeypatch.setattr(updated_app, 'cohort_manager', CohortManager({'TEST': str(path)}))
+    client = updated_app.app.server.test_client()
+    batch = mutations.iloc[400:410].astype({'Start_Position': object})
+    batch.iloc[0, batch.columns.get_loc('Start_Position')] = 'abc'
+    # 格式不对的请求体和不能转换的取值都返回400, 文件不变
+    for body in [{'Hugo_Symbol': 'TP53'}, batch.to_dict('records')]:
+        response = client.post('/api/cohorts/TEST/append', json=body)
+        assert response.status_code == 400
+    response = client.post('/api/cohorts/TEST/clinical', json='TCGA-A1-A0SB')
+    assert response.status_code == 400
+    assert path.read_bytes() == before
+    response = client.post('/api/cohorts/TEST/append', json=mutations.iloc[400:410].to_dict('records'))
+    assert response.status_code == 200 and response.get_json()['version'] == 1
+
+
+def test_approximate_age_charts_match_zoom(tmp_path, monkeypatch):
+    # 近似模式下年龄图表也在完整数据上计数 (不加标注), 与缩放后重新分箱的结果一致
+    monkeypatch.setattr(dataset, 'APPROXIMATE_SAMPLE_PER_STRATUM', 5)
+    mutations = make_mutations()
+    mutations.to_csv(tmp_path / 'mutations.csv', index=False)
+    manager = CohortManager({'TEST': str(tmp_path / 'mutations.csv')})
+    monkeypatch.setattr(updated_app, 'cohort_manager', manager)
+    state = dict(empty_filter_state(), vital_status=['Dead'])
+    figs = dict(updated_app.cohort_figures(manager.get('TEST'), ['age_dist', 'brca_waterfall'], state,
+                                           approximate_mode=['approximate']))
+    dead = mutations[mutations['vital_status'] == 'Dead']
+    expected = dead['age_at_initial_pathologic_diagnosis'].notna().sum()
+    assert figs['age_dist'].data[0].y.sum() == expected
+    assert figs['mutation_line'].data[0].y.sum() == expected
+    assert not figs['age_dist'].layout.annotations and figs['brca_waterfall'].layout.annotations
+    patch = updated_app.rebin_on_zoom({'xaxis.autorange': True}, {'index': 'age_dist'}, state, 'TEST')
+    y = [op['params']['value'] for op in patch.to_plotly_json()['operations'] if op['location'] == ['data', 0, 'y']]
+    assert y[0].sum() == expected
+
+
+def test_startup_does_not_import_pandas():
+    # 应用启动 (不加载默认队列) 只导入Dash和标准库的模块, pandas在第一次加载数据时才导入
+    probe = ('import runpy, sys, threading\n'
+             'threading.Thread.start = lambda self: None\n'
+             f'sys.path.insert(0, {SOURCE_DIR!r})\n'
+             f'runpy.run_path({os.path.join(SOURCE_DIR, "updated_app.py")!r}, run_name="startup")\n'
+             'print(sorted(name for name in ["pandas", "dataset", "cross_filter"] if name in sys.modules))')
+    result = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True,
+                            env=dict(os.environ, GENOVAI_RELOAD_INTERVAL='0'))
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert result.stdout.strip().splitlines()[-1] == '[]'
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='node is not installed')
+def test_task_content_keeps_selection_on_cohort_switch():
+    # 浏览器端回调 (assets/clientside.js) 在node中运行: 切换队列保留有效的选择, 切换任务恢复任务的默认设置
+    settings = json.loads(json.dumps(updated_app.task_settings))
+    script = ('global.window = {dash_clientside: {no_update: null}};\n'
+              f'require({os.path.join(SOURCE_DIR, "assets", "clientside.js")!r});\n'
+              'const genovai = window.dash_clientside.genovai;\n'
+              'const call = (propIds, selected) => {\n'
+              '    window.dash_clientside.callback_context = {triggered: propIds.map(id => ({prop_id: id}))};\n'
+              f'    return genovai.taskContent("data_analysis", "LUAD", {json.dumps(settings)}, selected);\n'
+              '};\n'
+              'console.log(JSON.stringify([call(["cohort-dropdown.value"], ["age_dist", "gone"]),\n'
+              '                            call(["task-dropdown.value"], ["age_dist"])]));\n')
+    result = subprocess.run(['node', '-e', script], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    cohort_switch, task_switch = json.loads(result.stdout)
+    assert cohort_switch[1] == ['age_dist'] and cohort_switch[2] is None
+    assert 'LUAD' in cohort_switch[0][3]['label']
+    assert task_switch[1] == settings['tasks']['data_analysis']['value'] and task_switch[2] == 2
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='node is not installed')
+def test_figures_per_row_reflows_in_browser():
+    # 每行图表数只由浏览器端回调处理, 不触发服务器回调 (图表不重新生成); 样式与服务器端的grid_style相同
+    for callback in updated_app.app._callback_list:
+        inputs = [(item['id'], item['property']) for item in callback['inputs']]
+        if ('figures-per-row-dropdown', 'value') in inputs:
+            assert callback.get('clientside_function'), callback['output']
+    script = ('global.window = {dash_clientside: {}};\n'
+              f'require({os.path.join(SOURCE_DIR, "assets", "clientside.js")!r});\n'
+              'console.log(JSON.stringify([1, 2, 3].map(window.dash_clientside.genovai.gridStyle)));\n')
+    result = subprocess.run(['node', '-e', script], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout) == [updated_app.grid_style(n) for n in (1, 2, 3)]
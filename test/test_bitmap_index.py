@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+from bitmap_index import BitmapIndex, popcount, popcount_rows
+from cross_filter import FILTER_COLUMNS, CrossFilter, merge_labels, parse_table_filter
+
+
+def build_index(frame):
+    codes, labels = {}, {}
+    for column in FILTER_COLUMNS:
+        column_codes, uniques = pd.factorize(frame[column], sort=True)
+        codes[column] = column_codes.astype(np.int32)
+        labels[column] = pd.Index(uniques)
+    return BitmapIndex(codes, labels, len(frame), FILTER_COLUMNS), codes, labels
+
+
+def test_bitmap_matches_isin(mutations):
+    index, _, _ = build_index(mutations)
+    # TP53是稠密取值 (位图), 其余是稀疏取值 (行id)
+    assert index.labels['Hugo_Symbol'].get_loc('TP53') in index.dense['Hugo_Symbol']
+    for column, values in [('Hugo_Symbol', ['TP53']), ('Hugo_Symbol', ['GENE3', 'GENE17', 'TP53']),
+                           ('One_Consequence', ['stop_gained']), ('gender', ['MALE']), ('Hugo_Symbol', ['nope'])]:
+        words = index.bitmap(column, values)
+        expected = mutations[column].isin(values).to_numpy()
+        assert np.array_equal(index.to_mask(words), expected)
+        assert index.count(words) == expected.sum()
+
+
+def test_conjunction_and_round_trip(mutations):
+    index, _, _ = build_index(mutations)
+    words = index.bitmap('Hugo_Symbol', ['TP53', 'PIK3CA']) & index.bitmap('vital_status', ['Dead'])
+    expected = mutations['Hugo_Symbol'].isin(['TP53', 'PIK3CA']) & (mutations['vital_status'] == 'Dead')
+    assert np.array_equal(index.to_rows(words), np.flatnonzero(expected))
+    rows = np.array([0, 63, 64, 65, len(mutations) - 1])
+    assert np.array_equal(index.to_rows(index.from_rows(rows)), rows)
+    assert index.count(index.full()) == len(mutations)
+
+
+def test_popcount_rows():
+    rng = np.random.default_rng(1)
+    words = rng.integers(0, 2 ** 63, (7, 5), dtype=np.uint64)
+    assert np.array_equal(popcount_rows(words), [popcount(row) for row in words])
+
+
+def test_append_matches_rebuild(mutations):
+    head, tail = mutations.iloc[:2000], mutations.iloc[2000:].copy()
+    tail.loc[tail.index[:5], 'Hugo_Symbol'] = 'AAA_NEW'
+    index, codes, labels = build_index(head)
+    new_codes, remaps = {}, {}
+    for column in FILTER_COLUMNS:
+        merged, remap = merge_labels(labels[column], tail[column])
+        old = codes[column] if remap is None else remap[codes[column]]
+        if remap is not None:
+            remaps[column] = remap
+        new_codes[column] = np.concatenate([old, merged.get_indexer(tail[column]).astype(np.int32)])
+        labels[column] = merged
+    index.append(new_codes, labels, len(mutations), remaps)
+    rebuilt, _, _ = build_index(pd.concat([head, tail]))
+    for column in FILTER_COLUMNS:
+        assert index.labels[column].equals(rebuilt.labels[column])
+        for value in rebuilt.labels[column]:
+            assert np.array_equal(index.bitmap(column, [value]), rebuilt.bitmap(column, [value]))
+
+
+def test_parse_table_filter():
+    query = '{Hugo_Symbol} eq "TP53" && {age_at_initial_pathologic_diagnosis} ge 50 && {One_Consequence} contains stop'
+    assert parse_table_filter(query) == [('Hugo_Symbol', 'eq', 'TP53'),
+                                         ('age_at_initial_pathologic_diagnosis', 'ge', 50.0),
+                                         ('One_Consequence', 'contains', 'stop')]
+    assert parse_table_filter('') == []
+
+
+def test_table_filter_matches_pandas(mutations):
+    cross_filter = CrossFilter(mutations)
+    age = mutations['age_at_initial_pathologic_diagnosis']
+    cases = {
+        '{Hugo_Symbol} eq "TP53"': mutations['Hugo_Symbol'] == 'TP53',
+        '{Hugo_Symbol} ne "TP53"': mutations['Hugo_Symbol'] != 'TP53',
+        '{One_Consequence} contains "stop"': mutations['One_Consequence'].str.contains('stop'),
+        '{Chromosome} eq 17': mutations['Chromosome'] == '17',
+        '{Variant_Type} eq SNP': mutations['Variant_Type'] == 'SNP',
+        '{age_at_initial_pathologic_diagnosis} ge 50 && {age_at_initial_pathologic_diagnosis} lt 70':
+            (age >= 50) & (age < 70),
+        '{age_at_initial_pathologic_diagnosis} eq 60': age == 60,
+        '{Start_Position} gt 2500000 && {vital_status} eq "Dead"':
+            (mutations['Start_Position'] > 2500000) & (mutations['vital_status'] == 'Dead'),
+        '{gender} eq "MALE" && {Hugo_Symbol} eq "PIK3CA" && {age_at_initial_pathologic_diagnosis} le 60':
+            (mutations['gender'] == 'MALE') & (mutations['Hugo_Symbol'] == 'PIK3CA') & (age <= 60),
+        '{unknown_column} eq 3': pd.Series(True, index=mutations.index),
+    }
+    for query, expected in cases.items():
+        mask = cross_filter.mask_for({'table_filter': query})
+        assert np.array_equal(mask, expected.to_numpy()), query
@@ -0,0 +1,48 @@
+from math import comb
+
+import numpy as np
+import pandas as pd
+
+from co_occurrence import benjamini_hochberg, co_occurrence_stats
+from cross_filter import CrossFilter
+from filter_state import empty_filter_state
+
+
+def hypergeometric_reference(both, k1, k2, n):
+    # 精确的超几何分布尾部概率 (整数组合数)
+    pmf = [comb(k2, x) * comb(n - k2, k1 - x) / comb(n, k1) for x in range(0, min(k1, k2) + 1)]
+    return sum(pmf[:both + 1]), sum(pmf[both:])
+
+
+def test_p_values_match_reference(mutations):
+    # 加入一对明显共现和一对明显互斥的基因
+    rng = np.random.default_rng(2)
+    patients = mutations['bcr_patient_barcode'].unique()
+    together = rng.choice(patients, 60, replace=False)
+    apart = rng.permutation(patients)
+    extra = pd.DataFrame({'Hugo_Symbol': ['CO_A'] * 60 + ['CO_B'] * 60 + ['EX_A'] * 90 + ['EX_B'] * 90,
+                          'bcr_patient_barcode': list(together) * 2 + list(apart[:90]) + list(apart[100:190])})
+    frame = pd.concat([mutations, extra], ignore_index=True)
+    cross_filter = CrossFilter(frame)
+    stats = co_occurrence_stats(cross_filter, cross_filter.mask_for(empty_filter_state()), top_k=15)
+    mutated = frame.groupby('Hugo_Symbol')['bcr_patient_barcode'].apply(set)
+    n = frame['bcr_patient_barcode'].nunique()
+    assert len(stats) == 15 * 14 // 2
+    for row in stats.itertuples(index=False):
+        a, b = mutated[row[0]], mutated[row[1]]
+        both = len(a & b)
+        assert (row.Both, row[3], row[4], row.Neither) == (both, len(a) - both, len(b) - both, n - len(a | b))
+        lower, upper = hypergeometric_reference(both, len(a), len(b), n)
+        expected = upper if row.Tendency == 'Co-occurrence' else lower
+        assert np.isclose(row[7], expected, rtol=1e-9, atol=1e-300), (row[0], row[1])
+    pairs = {frozenset(pair): tendency
+             for pair, tendency in zip(zip(stats['Gene A'], stats['Gene B']), stats['Tendency'])}
+    assert pairs[frozenset(['CO_A', 'CO_B'])] == 'Co-occurrence'
+    assert pairs[frozenset(['EX_A', 'EX_B'])] == 'Mutual exclusivity'
+    assert np.allclose(stats['q-Value'], benjamini_hochberg(stats['p-Value'].to_numpy()))
+
+
+def test_benjamini_hochberg():
+    p_values = np.array([0.01, 0.04, 0.03, 0.2])
+    # p值排序后 p * m / 秩 再从大到小取累积最小值
+    assert np.allclose(benjamini_hochberg(p_values), [0.04, 0.16 / 3, 0.16 / 3, 0.2])
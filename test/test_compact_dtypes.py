@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from compact_dtypes import align_categories, compact_frame, memory_report
+
+
+def test_compact_frame_keeps_values(mutations):
+    frame = mutations.assign(score=np.linspace(0, 1, len(mutations)), flag=mutations['gender'] == 'MALE',
+                             barcode_text=mutations.index.astype(str))
+    compact = compact_frame(frame)
+    # 低基数字符串 -> category, 整数向下转换, 不能无损转换为float32的浮点列保持不变
+    assert isinstance(compact['Hugo_Symbol'].dtype, pd.CategoricalDtype)
+    assert compact['barcode_text'].dtype == frame['barcode_text'].dtype
+    assert compact['Start_Position'].dtype == np.int32
+    assert compact['age_at_initial_pathologic_diagnosis'].dtype == np.float32
+    assert compact['score'].dtype == np.float64 and compact['flag'].dtype == bool
+    pd.testing.assert_frame_equal(compact.astype(frame.dtypes.to_dict()), frame)
+    report = memory_report(frame, compact)
+    assert report.loc['Total', 'bytes_after'] < report.loc['Total', 'bytes_before']
+
+
+def test_align_categories_merges_new_values(mutations):
+    frame = compact_frame(mutations.iloc[:100])
+    batch = pd.DataFrame({'Hugo_Symbol': ['NEWGENE', 'TP53'], 'Chromosome': ['17', '17']})
+    frame, batch = align_categories(frame, batch)
+    # 两边使用同一组有序的类别, 合并后仍然是分类类型
+    assert list(frame['Hugo_Symbol'].cat.categories) == list(batch['Hugo_Symbol'].cat.categories)
+    categories = frame['Hugo_Symbol'].cat.categories
+    assert 'NEWGENE' in categories and categories.is_monotonic_increasing
+    merged = pd.concat([frame[['Hugo_Symbol']], batch[['Hugo_Symbol']]], ignore_index=True)
+    assert isinstance(merged['Hugo_Symbol'].dtype, pd.CategoricalDtype)
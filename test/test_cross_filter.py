@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from cross_filter import CrossFilter
+from filter_state import empty_filter_state
+
+
+def test_append_matches_rebuild(mutations):
+    head, tail = mutations.iloc[:2000], mutations.iloc[2000:].copy()
+    tail.loc[tail.index[:5], 'Hugo_Symbol'] = 'AAA_NEW'
+    tail.loc[tail.index[5:8], 'Chromosome'] = 'Y'
+    original = CrossFilter(head.reset_index(drop=True))
+    state = dict(empty_filter_state(), Hugo_Symbol=['TP53', 'AAA_NEW'], age_range=[40, 70])
+    before = original.apply(original.mask_for(state))
+    appended = original.append(tail)
+    rebuilt = CrossFilter(pd.concat([head, tail], ignore_index=True))
+    # 追加后的过滤器与整体重建的结果一致
+    for filter_state in (state, dict(empty_filter_state(), Chromosome=['Y']), empty_filter_state()):
+        counts = appended.apply(appended.mask_for(filter_state))
+        expected = rebuilt.apply(rebuilt.mask_for(filter_state))
+        for name in expected:
+            assert np.array_equal(counts[name], expected[name]), name
+    for column in rebuilt.labels:
+        assert appended.labels[column].equals(rebuilt.labels[column])
+    # 原过滤器不变: 行数、取值字典和计数与追加前相同
+    assert original.n_rows == len(head) and 'AAA_NEW' not in original.labels['Hugo_Symbol']
+    assert original.bitmaps.n_rows == len(head) and len(original.positions.rows()) == len(head)
+    after = original.apply(original.mask_for(state))
+    for name in before:
+        assert np.array_equal(after[name], before[name]), name
@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from clinical import patient_barcodes
+from cohorts import CohortManager
+from conftest import make_mutations
+from filter_state import empty_filter_state
+
+
+def test_cohorts_load_lazily_and_evict_least_recently_used(tmp_path):
+    paths = {}
+    for seed, name in enumerate(['A', 'B', 'C']):
+        paths[name] = str(tmp_path / f'Cleaned_{name}_Merged_Data.csv')
+        make_mutations(seed=seed).to_csv(paths[name], index=False)
+    size = CohortManager(paths).get('A').memory_bytes()
+    manager = CohortManager(paths, memory_cap=int(size * 2.5))
+    # 创建管理器时不加载任何队列, 未知的队列名称使用第一个队列
+    assert not manager.resident
+    first = manager.get('A')
+    assert manager.get('unknown') is first
+    manager.get('B')
+    # 常驻队列之间切换不重新加载; 超出内存上限时淘汰最久未使用的队列 (B)
+    assert manager.get('A') is first
+    manager.get('C')
+    assert list(manager.resident) == ['A', 'C'] and manager.memory_bytes() <= manager.memory_cap
+    assert manager.get('B') is not None and 'A' not in manager.resident
+
+
+def test_append_swaps_snapshot(tmp_path):
+    mutations = make_mutations()
+    path = tmp_path / 'Cleaned_TEST_Merged_Data.csv'
+    mutations.iloc[:2000].to_csv(path, index=False)
+    manager = CohortManager({'TEST': str(path)})
+    old = manager.get('TEST')
+    state = dict(empty_filter_state(), Hugo_Symbol=['TP53'])
+    old_counts = old.exact_counts(state)
+    version = manager.append('TEST', mutations.iloc[2000:])
+    new = manager.get('TEST')
+    # 追加后换上新快照, 仍在使用旧快照的请求看到的数据不变
+    assert new is not old and new.version == version == old.version + 1
+    assert len(old.df) == 2000 and old.cross_filter.n_rows == 2000 and not old.batches
+    assert len(new.df) == len(mutations)
+    for name, counts in old.exact_counts(state).items():
+        assert np.array_equal(counts, old_counts[name])
+    expected = (mutations['Hugo_Symbol'] == 'TP53').sum()
+    assert new.exact_counts(state)['consequence'].sum() == expected
+    # 重新从文件加载的结果与增量追加一致
+    reloaded = CohortManager({'TEST': str(path)}).get('TEST')
+    for name, counts in reloaded.exact_counts(state).items():
+        assert np.array_equal(counts, new.exact_counts(state)[name])
+
+
+def test_reload_changed_swaps_snapshot(tmp_path):
+    mutations = make_mutations()
+    path = tmp_path / 'Cleaned_TEST_Merged_Data.csv'
+    mutations.iloc[:2000].to_csv(path, index=False)
+    manager = CohortManager({'TEST': str(path)})
+    old = manager.get('TEST')
+    mutations.to_csv(path, index=False)
+    # 第一次检查只记下新的文件状态 (可能还在写入), 连续两次相同才重新加载并替换
+    manager.reload_changed()
+    assert manager.get('TEST') is old
+    manager.reload_changed()
+    new = manager.get('TEST')
+    assert new is not old and new.version == old.version + 1
+    assert len(new.df) == len(mutations) and len(old.df) == 2000
+    # 新文件加载失败时保留之前的快照, 同一个文件状态只尝试一次
+    path.write_text('Hugo_Symbol,Chromosome\n"TP53,17\n')
+    manager.reload_changed()
+    manager.reload_changed()
+    assert manager.get('TEST') is new and manager._failed['TEST'] == new.current_signature()
+
+
+def test_bad_append_leaves_file_unchanged(tmp_path):
+    mutations = make_mutations()
+    path = tmp_path / 'Cleaned_TEST_Merged_Data.csv'
+    mutations.iloc[:2000].to_csv(path, index=False)
+    before = path.read_bytes()
+    manager = CohortManager({'TEST': str(path)})
+    old = manager.get('TEST')
+    batch = mutations.iloc[2000:2010].astype({'Start_Position': object})
+    batch.iloc[3, batch.columns.get_loc('Start_Position')] = 'abc'
+    with pytest.raises(ValueError):
+        manager.append('TEST', batch)
+    # 出错的批次不写入文件, 当前快照不变, 重新加载仍然正常
+    assert path.read_bytes() == before
+    assert manager.get('TEST') is old and old.version == 0
+    assert len(CohortManager({'TEST': str(path)}).get('TEST').df) == 2000
+
+
+def test_load_columns_swaps_snapshot(tmp_path):
+    mutations = make_mutations()
+    path = tmp_path / 'Cleaned_TEST_Merged_Data.csv'
+    mutations.to_csv(path, index=False)
+    manager = CohortManager({'TEST': str(path)})
+    old = manager.get('TEST')
+    assert 'Variant_Type' not in old.df.columns
+    new = manager.load_columns('TEST', ['Hugo_Symbol', 'Variant_Type'])
+    # 按需读取的列加在新快照上, 旧快照的数据框 (以及它的交叉过滤器) 不变
+    assert new is not old and manager.get('TEST') is new
+    assert 'Variant_Type' not in old.df.columns and 'Variant_Type' not in old.cross_filter.frame.columns
+    assert new.shown_columns(['Hugo_Symbol', 'Variant_Type', 'unknown']) == ['Hugo_Symbol', 'Variant_Type']
+    assert new.cross_filter.frame is new.df
+    assert new.df['Variant_Type'].astype(str).tolist() == mutations['Variant_Type'].tolist()
+    state = dict(empty_filter_state(), table_filter='{Variant_Type} eq SNP')
+    assert new.cross_filter.mask_for(state).sum() == (mutations['Variant_Type'] == 'SNP').sum()
+    assert old.cross_filter.mask_for(state).all()
+    assert manager.load_columns('TEST', ['Variant_Type']) is new
+
+
+def test_clinical_table_join_matches_merged_file(tmp_path):
+    mutations = make_mutations()
+    clinical_columns = ['age_at_initial_pathologic_diagnosis', 'vital_status', 'gender']
+    mutations.to_csv(tmp_path / 'merged.csv', index=False)
+    mutations.drop(columns=clinical_columns).to_csv(tmp_path / 'mutations.csv', index=False)
+    clinical = mutations[['bcr_patient_barcode'] + clinical_columns].drop_duplicates('bcr_patient_barcode')
+    clinical.to_csv(tmp_path / 'clinical.csv', index=False)
+    merged = CohortManager({'TEST': str(tmp_path / 'merged.csv')}).get('TEST')
+    manager = CohortManager({'TEST': str(tmp_path / 'mutations.csv')},
+                            clinical={'TEST': str(tmp_path / 'clinical.csv')})
+    joined = manager.get('TEST')
+    # 临床列只在每个病人一行的临床表中, 计数与合并文件 (每个突变行重复临床列) 相同
+    assert 'gender' not in joined.df.columns and len(joined.clinical.frame) == len(clinical)
+    state = dict(empty_filter_state(), vital_status=['Dead'], gender=['FEMALE'])
+    for name, counts in merged.exact_counts(state).items():
+        assert np.array_equal(counts, joined.exact_counts(state)[name]), name
+    # 更新一个病人的临床记录: 换上新快照并写回临床文件
+    patient = clinical['bcr_patient_barcode'].iloc[0]
+    version = manager.update_clinical('TEST', pd.DataFrame({'bcr_patient_barcode': [patient], 'gender': ['MALE']}))
+    updated = manager.get('TEST')
+    assert version == updated.version == joined.version + 1
+    gender = mutations['gender'].where(mutations['bcr_patient_barcode'] != patient, 'MALE')
+    males = dict(empty_filter_state(), gender=['MALE'])
+    assert updated.exact_counts(males)['consequence'].sum() == (gender == 'MALE').sum()
+    written = pd.read_csv(tmp_path / 'clinical.csv').set_index('bcr_patient_barcode')
+    assert written.loc[patient, 'gender'] == 'MALE'
+
+
+def test_patient_barcodes_from_maf(tmp_path):
+    # MAF只有样本条码: 病人条码取样本条码的前12位
+    mutations = make_mutations(500, 50)
+    samples = mutations['bcr_patient_barcode'] + np.where(np.arange(len(mutations)) % 2, '-01A-11D-A142-09', '-10A')
+    maf = mutations.drop(columns=['bcr_patient_barcode']).assign(Tumor_Sample_Barcode=samples)
+    path = tmp_path / 'TEST.maf'
+    maf.to_csv(path, sep='\t', index=False)
+    dataset = CohortManager({'TEST': str(path)}).get('TEST')
+    barcodes = dataset.cross_filter.values('bcr_patient_barcode').astype(str)
+    assert (barcodes.str.len() == 12).all()
+    assert barcodes.tolist() == mutations['bcr_patient_barcode'].tolist()
+    codes = patient_barcodes(pd.Series(['TCGA-A1-A0SB-01A', 'TCGA-B2-0001-01A', None, 'TCGA-A1-A0SB-10A']))
+    assert list(codes.categories) == ['TCGA-A1-A0SB', 'TCGA-B2-0001']
+    assert codes.isna().tolist() == [False, False, True, False]
+    assert list(codes.astype(object)[[0, 1, 3]]) == ['TCGA-A1-A0SB', 'TCGA-B2-0001', 'TCGA-A1-A0SB']
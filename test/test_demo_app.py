@@ -0,0 +1,43 @@
+import demo_app
+import upload_jobs
+from upload_jobs import UploadJob
+
+
+def test_view_charts_and_active_charts(mutations):
+    # 未知路径显示默认视图; 选择图表的视图只显示一个有效的选择, 否则显示第一个图表
+    assert demo_app.view_charts('/unknown', []) == ['age_dist']
+    assert demo_app.view_charts('/age-and-vital-status', ['age_dist']) == ['age_dist', 'vital_status_vs_age']
+    assert demo_app.view_charts('/mutation-type-vs-age', ['mutation_vs_age_vs_status']) == \
+        ['mutation_vs_age_vs_status']
+    assert demo_app.view_charts('/mutation-type-vs-age', ['mutation_type_dist']) == ['age_dist']
+    # 上传任务只为当前视图中列齐全的图表预先生成图表
+    frame = mutations.drop(columns='vital_status')
+    assert demo_app.missing_columns('vital_status_vs_age', frame) == ['vital_status']
+    charts = demo_app.active_charts(frame, '/age-and-vital-status', None)
+    assert [vis for vis, _ in charts] == ['age_dist']
+
+
+def test_views_mount_once(monkeypatch):
+    monkeypatch.setattr(demo_app, '_mounted', {})
+    first = demo_app.mount_view('/top-mutation-types')
+    assert demo_app.mount_view('/top-mutation-types') is first
+    dropdown = first.children[2]
+    assert dropdown.id == {'type': 'view-visualization', 'index': '/top-mutation-types'}
+    assert [option['value'] for option in dropdown.options] == list(demo_app.CHARTS)
+    # 不选择图表的视图没有下拉框; 未知路径打开默认视图
+    assert len(demo_app.mount_view('/age-and-vital-status').children) == 1
+    assert demo_app.mount_view('/unknown') is demo_app.mount_view(demo_app.DEFAULT_VIEW)
+
+
+def test_graphs_reuse_job_figures(mutations, monkeypatch):
+    job = UploadJob(['mutations.csv'])
+    job.frame = mutations.drop(columns='vital_status')
+    monkeypatch.setattr(upload_jobs, 'upload_jobs', {'job': job})
+    assert demo_app.update_graphs(0, '/age-and-vital-status', [], 'job') == []
+    rows = demo_app.update_graphs(1, '/age-and-vital-status', [], 'job')
+    graph, missing = [row.children[0].children for row in rows]
+    assert graph.figure is job.figures['age_dist']
+    assert missing.children == 'Vital Status vs. Age: the uploaded data is missing vital_status'
+    # 同一次上传的图表只生成一次, 切换视图后复用
+    rows = demo_app.update_graphs(1, '/vital-status-vs-age', ['age_dist'], 'job')
+    assert rows[0].children[0].children.figure is graph.figure
@@ -0,0 +1,39 @@
+import importlib.util
+import json
+
+import pytest
+
+from dataset import Dataset
+from export import build_figures, main
+from filter_state import empty_filter_state
+
+
+def test_build_figures_match_filter(mutations, tmp_path):
+    mutations.to_csv(tmp_path / 'mutations.csv', index=False)
+    dataset = Dataset('TEST', str(tmp_path / 'mutations.csv'))
+    state = dict(empty_filter_state(), vital_status=['Dead'])
+    figs = dict(build_figures(dataset, ['mutation_by_chr', 'brca_waterfall'], state))
+    # 瀑布图同时生成年龄折线图
+    assert list(figs) == ['mutation_by_chr', 'brca_waterfall', 'mutation_line']
+    dead = mutations[mutations['vital_status'] == 'Dead']
+    counts = dead['Chromosome'].astype(str).value_counts()
+    assert dict(zip(figs['mutation_by_chr'].data[0].x, figs['mutation_by_chr'].data[0].y)) == counts.to_dict()
+
+
+def test_export_html(mutations, tmp_path):
+    mutations.to_csv(tmp_path / 'mutations.csv', index=False)
+    out = tmp_path / 'exports'
+    main([str(tmp_path / 'mutations.csv'), '--vis', 'age_dist', 'mutation_type_dist', '--formats', 'html',
+          '--filter', json.dumps({'gender': ['MALE']}), '--out', str(out), '--processes', '2'])
+    assert sorted(path.name for path in out.iterdir()) == ['mutations_age_dist.html',
+                                                           'mutations_mutation_type_dist.html']
+    html = (out / 'mutations_mutation_type_dist.html').read_text()
+    assert 'Top 10 Mutation Type Distribution in mutations Patients' in html
+
+
+@pytest.mark.skipif(importlib.util.find_spec('kaleido') is not None, reason='kaleido is installed')
+def test_image_export_needs_kaleido(mutations, tmp_path):
+    mutations.to_csv(tmp_path / 'mutations.csv', index=False)
+    with pytest.raises(SystemExit, match='Kaleido'):
+        main([str(tmp_path / 'mutations.csv'), '--formats', 'png', '--out', str(tmp_path / 'exports')])
+    assert not (tmp_path / 'exports').exists()
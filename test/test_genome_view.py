@@ -0,0 +1,48 @@
+import numpy as np
+
+import genome_view
+from cross_filter import CrossFilter
+from filter_state import empty_filter_state
+from genome_view import burden_patch, density_bins, density_patch, genome_axis, patient_burden
+
+
+def patch_values(patch, location):
+    return [op['params']['value'] for op in patch.to_plotly_json()['operations'] if op['location'] == location]
+
+
+def test_density_bins_count_filtered_rows(mutations):
+    cross_filter = CrossFilter(mutations)
+    state = dict(empty_filter_state(), Hugo_Symbol=['TP53', 'PIK3CA'])
+    mask = cross_filter.mask_for(state)
+    selected = mutations[mutations['Hugo_Symbol'].isin(['TP53', 'PIK3CA'])]
+    centers, counts, width = density_bins(cross_filter, mask)
+    assert counts.sum() == len(selected) and np.all(counts > 0)
+    # 缩放到17号染色体: 只对可见范围分箱, 箱更窄, 计数为该染色体上满足条件的行
+    axis = genome_axis(cross_filter)
+    index = axis.chromosomes.index('17')
+    x_range = (axis.offsets[index], axis.offsets[index + 1])
+    zoomed_centers, zoomed, zoomed_width = density_bins(cross_filter, mask, x_range)
+    assert zoomed.sum() == (selected['Chromosome'] == '17').sum()
+    assert zoomed_width < width and np.all((zoomed_centers > x_range[0]) & (zoomed_centers < x_range[1]))
+    # 缩放的部分更新与直接分箱一致, 并更新x轴标题中的箱宽
+    patch = density_patch(cross_filter, mask, x_range)
+    assert np.array_equal(patch_values(patch, ['data', 1, 'y'])[0], zoomed)
+    assert patch_values(patch, ['layout', 'xaxis', 'title', 'text']) == [
+        f'Genomic position ({zoomed_width:,.0f} bp bins)']
+
+
+def test_patient_burden_matches_groupby(mutations, monkeypatch):
+    cross_filter = CrossFilter(mutations)
+    state = dict(empty_filter_state(), vital_status=['Dead'])
+    patients, counts = patient_burden(cross_filter, cross_filter.mask_for(state))
+    expected = mutations[mutations['vital_status'] == 'Dead']['bcr_patient_barcode'].value_counts()
+    assert len(patients) == len(expected) and np.all(np.diff(counts) <= 0)
+    assert dict(zip(patients, counts)) == expected.to_dict()
+    # 缩放后只发送可见排名范围内的点
+    patch = burden_patch(patients, counts, (10.2, 20.7))
+    assert list(patch_values(patch, ['data', 0, 'x'])[0]) == list(range(10, 22))
+    assert np.array_equal(patch_values(patch, ['data', 0, 'y'])[0], counts[10:22])
+    # 点数超过上限时等间隔取点, 保留首尾
+    monkeypatch.setattr(genome_view, 'BURDEN_POINTS', 20)
+    ranks = patch_values(burden_patch(patients, counts, None), ['data', 0, 'x'])[0]
+    assert len(ranks) <= 20 and ranks[0] == 0 and ranks[-1] == len(counts) - 1
@@ -0,0 +1,44 @@
+import numpy as np
+
+from conftest import write_partitions
+from cross_filter import CrossFilter
+from filter_state import empty_filter_state
+from partitions import SAMPLE_BUDGET_SHARE, PartitionedDataset
+
+
+def test_aggregate_counts_match_in_memory(tmp_path, mutations):
+    write_partitions(tmp_path, mutations)
+    partitioned = PartitionedDataset(str(tmp_path))
+    labels = partitioned.summarize(100, [])['labels']
+    in_memory = CrossFilter(mutations.astype({'Chromosome': str}), labels=labels)
+    for state in [empty_filter_state(), dict(empty_filter_state(), Chromosome=['17'], vital_status=['Dead'])]:
+        counts = partitioned.aggregate_counts(state, labels)
+        expected = in_memory.apply(in_memory.mask_for(state))
+        assert counts.keys() == expected.keys()
+        for name in expected:
+            assert np.array_equal(counts[name], expected[name]), name
+
+
+def test_aggregate_counts_all_partitions_pruned(tmp_path, mutations):
+    write_partitions(tmp_path, mutations)
+    partitioned = PartitionedDataset(str(tmp_path))
+    labels = partitioned.summarize(100, [])['labels']
+    unfiltered = partitioned.aggregate_counts(empty_filter_state(), labels)
+    # 没有分区满足过滤条件时返回同样形状的零计数, 而不是None
+    pruned = partitioned.aggregate_counts(dict(empty_filter_state(), Chromosome=['Y']), labels)
+    assert pruned.keys() == unfiltered.keys()
+    for name in unfiltered:
+        assert pruned[name].shape == unfiltered[name].shape and not pruned[name].any()
+
+
+def test_sample_fits_memory_budget(tmp_path, mutations):
+    # 分层抽样计入内存预算: 超出留给抽样的部分时每层保留的行数减少, 权重之和仍然是总行数
+    write_partitions(tmp_path, mutations)
+    unbounded = PartitionedDataset(str(tmp_path)).summarize(1000, [])
+    assert len(unbounded['sample']) == len(mutations)
+    partitioned = PartitionedDataset(str(tmp_path), memory_budget=200_000)
+    summary = partitioned.summarize(1000, [])
+    max_rows = partitioned.memory_budget * SAMPLE_BUDGET_SHARE / partitioned._row_bytes
+    assert 0 < len(summary['sample']) <= max_rows < len(mutations)
+    assert summary['reservoir'].capacity < 1000
+    assert np.isclose(summary['weights'].sum(), len(mutations))
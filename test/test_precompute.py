@@ -0,0 +1,49 @@
+import json
+
+import updated_app
+from filter_state import empty_filter_state
+from precompute import load_precomputed, precompute, write_artifact
+
+
+def write_cohort(mutations, tmp_path):
+    path = str(tmp_path / 'TEST.csv')
+    mutations.to_csv(path, index=False)
+    meta, counts, figures = precompute(path, processes=2)
+    out = tmp_path / 'precomputed'
+    out.mkdir()
+    write_artifact(str(out / 'TEST.npz'), meta, counts, figures)
+    return path, meta, counts, figures
+
+
+def test_artifact_round_trip(mutations, tmp_path):
+    path, meta, counts, figures = write_cohort(mutations, tmp_path)
+    (tmp_path / 'precomputed' / 'broken.npz').write_bytes(b'not an artifact')
+    cohorts = load_precomputed(str(tmp_path / 'precomputed'))
+    # 读取失败的产物被跳过
+    assert list(cohorts) == ['TEST']
+    cohort = cohorts['TEST']
+    assert cohort.meta['rows'] == len(mutations) and cohort.valid_for(path)
+    for key, value in counts.items():
+        assert (cohort.counts[key] == value).all(), key
+    assert [chart_id for chart_id, _ in cohort.chart_figures(['brca_waterfall'])] == ['brca_waterfall',
+                                                                                      'mutation_line']
+    assert cohort.chart_figures(['age_dist'])[0][1] == json.loads(figures['age_dist'])
+    assert cohort.chart_figures(['unknown']) is None
+    # 数据文件变化后产物失效
+    with open(path, 'a') as file:
+        file.write(','.join(['TP53'] + [''] * (len(mutations.columns) - 1)) + '\n')
+    assert not cohort.valid_for(path)
+
+
+def test_app_serves_initial_figures_from_artifact(mutations, tmp_path, monkeypatch):
+    path, _, _, figures = write_cohort(mutations, tmp_path)
+    monkeypatch.setattr(updated_app, 'precomputed_dir', str(tmp_path / 'precomputed'))
+    monkeypatch.setattr(updated_app, 'cohort_paths', {'TEST': path})
+    monkeypatch.setattr(updated_app, 'clinical_paths', {})
+    monkeypatch.setattr(updated_app, '_precomputed', None)
+    # 没有过滤条件时直接使用产物中的图表, 有过滤条件时回到正常的计算路径
+    served = updated_app.precomputed_figures('TEST', ['age_dist', 'mutation_by_chr'], empty_filter_state())
+    assert [chart_id for chart_id, _ in served] == ['age_dist', 'mutation_by_chr']
+    assert served[1][1] == json.loads(figures['mutation_by_chr'])
+    state = dict(empty_filter_state(), gender=['MALE'])
+    assert updated_app.precomputed_figures('TEST', ['age_dist'], state) is None
@@ -0,0 +1,43 @@
+import numpy as np
+
+from filter_state import parse_region
+from range_index import PositionIndex, RangeIndex, interval_from_conditions
+
+
+def test_range_rows_match_mask(mutations):
+    ages = mutations['age_at_initial_pathologic_diagnosis'].to_numpy()
+    index = RangeIndex(ages)
+    for low, high, low_inclusive, high_inclusive in [(50, 70, True, False), (60, 60, True, True),
+                                                     (-np.inf, 40, True, True), (80, np.inf, False, True)]:
+        lower = ages >= low if low_inclusive else ages > low
+        upper = ages <= high if high_inclusive else ages < high
+        expected = np.flatnonzero(lower & upper)
+        assert np.array_equal(np.sort(index.rows(low, high, low_inclusive, high_inclusive)), expected)
+        assert index.count(low, high, low_inclusive, high_inclusive) == len(expected)
+
+
+def test_range_append_matches_rebuild(mutations):
+    ages = mutations['age_at_initial_pathologic_diagnosis'].to_numpy()
+    index = RangeIndex(ages[:1000])
+    index.append(ages[1000:], np.arange(1000, len(ages)))
+    rebuilt = RangeIndex(ages)
+    assert np.array_equal(index.values, rebuilt.values)
+    assert np.array_equal(index.rows(45, 65), rebuilt.rows(45, 65))
+
+
+def test_position_index(mutations):
+    index = PositionIndex(mutations['Chromosome'], mutations['Start_Position'])
+    chromosome, position = mutations['Chromosome'], mutations['Start_Position']
+    expected = np.flatnonzero((chromosome == '17') & (position >= 1_000_000) & (position <= 2_000_000))
+    assert np.array_equal(np.sort(index.rows(['17'], 1_000_000, 2_000_000)), expected)
+    assert index.count(None, high=100_000) == (position <= 100_000).sum()
+    index.append(['17', 'Y'], [1_500_000, 10], [len(mutations), len(mutations) + 1])
+    assert len(mutations) in index.rows(['17'], 1_000_000, 2_000_000)
+    assert list(index.rows(['Y'])) == [len(mutations) + 1]
+
+
+def test_interval_and_region():
+    assert interval_from_conditions([('ge', 50.0), ('lt', 70.0), ('gt', 40.0)]) == (50.0, 70.0, True, False)
+    assert interval_from_conditions([('eq', 60.0)]) == (60.0, 60.0, True, True)
+    assert parse_region('chr17:7,000,000-7,700,000') == {'chromosome': 'chr17', 'start': 7e6, 'end': 7.7e6}
+    assert parse_region('chr17') is None
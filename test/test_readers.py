@@ -0,0 +1,55 @@
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from readers import append_table, iter_table, read_header, read_table
+
+
+@pytest.fixture(params=['pyarrow', 'pandas'])
+def backend(request, monkeypatch):
+    # 没有pyarrow时退回pandas的解析器, 两种后端的结果相同
+    if request.param == 'pandas':
+        monkeypatch.setitem(sys.modules, 'pyarrow', None)
+        monkeypatch.setitem(sys.modules, 'pyarrow.csv', None)
+    else:
+        pytest.importorskip('pyarrow')
+    return request.param
+
+
+def write_maf(path, frame):
+    # GDC的MAF: 开头有注释行, 制表符分隔, 缺失值写成 "[Not Available]"
+    with open(path, 'wt') as handle:
+        handle.write('#version 2.4\n#annotation.spec gdc-1.0.1\n')
+    frame.astype({'age_at_initial_pathologic_diagnosis': object}).fillna('[Not Available]') \
+        .to_csv(path, sep='\t', index=False, mode='a')
+
+
+def test_read_table_projects_and_types_columns(tmp_path, mutations, backend):
+    path = str(tmp_path / 'TEST.maf')
+    write_maf(path, mutations)
+    assert read_header(path) == list(mutations.columns)
+    columns = ['Start_Position', 'Hugo_Symbol', 'age_at_initial_pathologic_diagnosis']
+    frame = read_table(path, columns)
+    # 只读取需要的列 (按文件中的顺序), 已知列按模式的类型解析, 类别排好序
+    assert list(frame.columns) == ['Hugo_Symbol', 'Start_Position', 'age_at_initial_pathologic_diagnosis']
+    assert isinstance(frame['Hugo_Symbol'].dtype, pd.CategoricalDtype)
+    assert frame['Hugo_Symbol'].cat.categories.is_monotonic_increasing
+    assert frame['Hugo_Symbol'].astype(str).tolist() == mutations['Hugo_Symbol'].tolist()
+    assert np.array_equal(frame['Start_Position'], mutations['Start_Position'])
+    age = mutations['age_at_initial_pathologic_diagnosis']
+    assert frame['age_at_initial_pathologic_diagnosis'].isna().sum() == age.isna().sum()
+
+
+def test_iter_table_and_append_gzip(tmp_path, mutations, backend):
+    path = str(tmp_path / 'TEST.csv.gz')
+    mutations.iloc[:2000].to_csv(path, index=False)
+    # gzip文件追加一个新的gzip成员, 读取时与一次写出的文件相同
+    append_table(path, mutations.iloc[2000:])
+    frame = read_table(path, ['Hugo_Symbol', 'Start_Position'])
+    assert len(frame) == len(mutations)
+    chunks = list(iter_table(path, ['Hugo_Symbol', 'Start_Position'], chunk_rows=1000))
+    assert len(chunks) > 1 and sum(len(chunk) for chunk in chunks) == len(mutations)
+    combined = pd.concat(chunks, ignore_index=True)
+    assert combined['Hugo_Symbol'].astype(str).tolist() == mutations['Hugo_Symbol'].tolist()
@@ -0,0 +1,35 @@
+import numpy as np
+
+from sampling import StratifiedReservoir, dkw_bound
+
+
+def test_reservoir_keeps_capacity_and_weights():
+    strata = np.array(['a'] * 500 + ['b'] * 30)
+    reservoir = StratifiedReservoir(capacity=100)
+    reservoir.add(strata, np.arange(len(strata)))
+    rows, weights = reservoir.sample()
+    assert np.all(np.diff(rows) > 0)
+    assert (rows < 500).sum() == 100 and (rows >= 500).sum() == 30
+    # 权重之和还原每个分层的总行数
+    assert np.isclose(weights[rows < 500].sum(), 500) and np.isclose(weights[rows >= 500].sum(), 30)
+
+
+def test_reservoir_batches_and_merge():
+    strata = np.array(['a', 'b'] * 400)
+    batched = StratifiedReservoir(capacity=50, seed=1)
+    for start in range(0, len(strata), 100):
+        batched.add(strata[start:start + 100], np.arange(start, start + 100))
+    left, right = StratifiedReservoir(capacity=50, seed=2), StratifiedReservoir(capacity=50, seed=3)
+    left.add(strata[:300], np.arange(300))
+    right.add(strata[300:], np.arange(300, len(strata)))
+    for reservoir in (batched, left.merge(right)):
+        rows, weights = reservoir.sample()
+        assert len(rows) == 100 and len(np.unique(rows)) == 100
+        assert reservoir.totals == {'a': 400, 'b': 400}
+        assert np.isclose(weights.sum(), len(strata))
+
+
+def test_dkw_bound():
+    assert dkw_bound(0) == 1.0
+    assert np.isclose(dkw_bound(1000), np.sqrt(np.log(40) / 2000))
+    assert dkw_bound(4000) < dkw_bound(1000)
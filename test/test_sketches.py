@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from charts import top_values
+from conftest import write_partitions
+from dataset import Dataset
+from partitions import PartitionedDataset
+from filter_state import empty_filter_state
+from sketches import CountMin, HeavyHitters, SpaceSaving
+
+
+def test_space_saving_bounds(mutations):
+    exact = mutations['Hugo_Symbol'].value_counts()
+    sketch = SpaceSaving(capacity=16).update(mutations['Hugo_Symbol'])
+    for item, count in sketch.counts.items():
+        # 计数是真实次数的上界, 减去误差后是下界
+        assert count - sketch.errors[item] <= exact[item] <= count
+    assert list(sketch.top(3).index) == list(exact.index[:3])
+
+
+def test_heavy_hitters_merge_matches_single_pass(mutations):
+    single = HeavyHitters(capacity=64).update(mutations['Hugo_Symbol'])
+    merged = HeavyHitters(capacity=64)
+    for part in np.array_split(mutations['Hugo_Symbol'], 4):
+        merged.merge(HeavyHitters(capacity=64).update(part))
+    assert merged.certain(5)
+    assert list(merged.top(5).index) == list(single.top(5).index)
+
+
+def test_count_min_upper_bound(mutations):
+    sketch = CountMin(width=16, depth=3).update(mutations['Hugo_Symbol'])
+    exact = mutations['Hugo_Symbol'].value_counts()
+    assert (sketch.estimate(exact.index) >= exact.to_numpy()).all()
+
+
+def test_top_values_are_exact_with_and_without_filter(tmp_path, mutations):
+    path = tmp_path / 'Cleaned_TEST_Merged_Data.csv'
+    mutations.to_csv(path, index=False)
+    dataset = Dataset('TEST', str(path))
+    # 内存中的队列有精确计数, 不建立草图; 这里放入分区数据集扫描时建立的那种草图
+    assert dataset.sketches == {}
+    # 很小的草图: 能确定Top 3, 但计数是偏大的上界
+    dataset.sketches['Hugo_Symbol'] = HeavyHitters(capacity=16, width=16, depth=2).update(mutations['Hugo_Symbol'])
+    assert dataset.sketches['Hugo_Symbol'].certain(3)
+    # 选中所有行的过滤条件: 柱子高度必须与没有过滤条件 (草图选出Top N) 时相同
+    everything = dict(empty_filter_state(), vital_status=['Alive', 'Dead'])
+    unfiltered = top_values(dataset, dataset.exact_counts(empty_filter_state())['gene_consequence'].sum(axis=1),
+                            'Hugo_Symbol', 3, empty_filter_state())
+    filtered = top_values(dataset, dataset.exact_counts(everything)['gene_consequence'].sum(axis=1),
+                          'Hugo_Symbol', 3, everything)
+    pd.testing.assert_series_equal(unfiltered, filtered)
+    assert unfiltered.tolist() == mutations['Hugo_Symbol'].value_counts().head(3).tolist()
+
+
+def test_partitioned_top_values_from_sketch(tmp_path, mutations):
+    # 分区数据集 (内存中只有抽样): 未过滤时由扫描建立的草图选出Top N, 计数取自分区上的精确聚合
+    write_partitions(tmp_path, mutations)
+    dataset = Dataset('TEST', str(tmp_path))
+    assert isinstance(dataset.partitioned, PartitionedDataset) and dataset.sketches['Hugo_Symbol'].certain(5)
+    counts = dataset.exact_counts(empty_filter_state())['gene_consequence'].sum(axis=1)
+    top = top_values(dataset, counts, 'Hugo_Symbol', 5, empty_filter_state())
+    pd.testing.assert_series_equal(top, mutations['Hugo_Symbol'].value_counts().head(5).astype(top.dtype),
+                                   check_names=False, check_index_type=False)
@@ -0,0 +1,63 @@
+import base64
+
+import pandas as pd
+
+from conftest import make_mutations
+from upload_jobs import get_job, parse_upload, start_upload, upload_jobs
+
+
+def test_parse_upload_reports_read_progress():
+    text = make_mutations(20000).to_csv(index=False)
+    contents = 'data:text/csv;base64,' + base64.b64encode(text.encode()).decode()
+    updates = []
+
+    class Progress(dict):
+        def __setitem__(self, key, value):
+            updates.append(value)
+            super().__setitem__(key, value)
+
+    progress = Progress()
+    df = parse_upload(contents, 'upload.csv', ['Hugo_Symbol'], progress, 3)
+    # 文件按块读取, 读取过程中多次更新进度, 最后一次为全部读完
+    assert len(df) == 20000 and progress[3] == 1.0
+    assert len(updates) > 2 and updates == sorted(updates) and 0 < updates[0] < 1
+
+
+def test_job_builds_active_charts_before_ready():
+    text = make_mutations(500).to_csv(index=False)
+    contents = 'data:text/csv;base64,' + base64.b64encode(text.encode()).decode()
+    built = []
+
+    def active_charts(frame):
+        return [('rows', lambda df: built.append(len(df)) or len(df)), ('broken', lambda df: df['missing'])]
+
+    job = upload_jobs[start_upload([contents, contents], ['a.csv', 'b.csv'], ['Hugo_Symbol'], active_charts)]
+    job.future.result()
+    # 当前视图的图表在标记完成之前已经生成, 生成失败的图表留到被请求时再生成
+    assert job.ready and job.error is None and job.progress == 1.0
+    assert job.figures == {'rows': 1000} and built == [1000]
+    assert job.figure('rows', None) == 1000
+
+
+def test_failed_upload_reports_error_and_stays_unready():
+    text = make_mutations(200).drop(columns=['Hugo_Symbol']).to_csv(index=False)
+    contents = 'data:text/csv;base64,' + base64.b64encode(text.encode()).decode()
+    job_id = start_upload([contents, contents], ['a.csv', 'b.txt'], ['Hugo_Symbol'])
+    job = upload_jobs[job_id]
+    job.future.result()
+    # 每个出错文件的原因都报告给界面, 任务不会变成可以显示的状态
+    assert not job.ready and get_job(job_id) is None
+    assert 'a.csv is missing required columns: Hugo_Symbol' in job.error and 'b.txt is not a CSV file' in job.error
+
+
+def test_merged_uploads_share_categories():
+    first, second = make_mutations(300, seed=1), make_mutations(300, seed=2)
+    contents = ['data:text/csv;base64,' + base64.b64encode(df.to_csv(index=False).encode()).decode()
+                for df in (first, second)]
+    job_id = start_upload(contents, ['first.csv', 'second.csv'], ['Hugo_Symbol'])
+    upload_jobs[job_id].future.result()
+    frame = get_job(job_id).frame
+    # 合并后仍然是分类类型, 并记录每行来自哪个文件
+    assert len(frame) == 600 and isinstance(frame['Hugo_Symbol'].dtype, pd.CategoricalDtype)
+    assert frame['Hugo_Symbol'].astype(str).tolist() == first['Hugo_Symbol'].tolist() + second['Hugo_Symbol'].tolist()
+    assert frame['source_file'].value_counts().to_dict() == {'first.csv': 300, 'second.csv': 300}